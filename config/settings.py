@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -19,13 +22,24 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
 
+# 本番では環境変数 DJANGO_DEBUG=0 と DJANGO_SECRET_KEY・DJANGO_ALLOWED_HOSTS を設定する
+# SECURITY WARNING: don't run with debug turned on in production!
+DEBUG = os.environ.get('DJANGO_DEBUG', '1') == '1'
+
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-lpn2_iyzi2j8%0+6=b2mwh^yedzfo%6!muskqn_-0lzcb!z%!l'
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', '')
+if not SECRET_KEY:
+    if not DEBUG:
+        raise ImproperlyConfigured('DJANGO_DEBUG=0 のときは DJANGO_SECRET_KEY を設定してください')
+    SECRET_KEY = 'django-insecure-lpn2_iyzi2j8%0+6=b2mwh^yedzfo%6!muskqn_-0lzcb!z%!l'
 
-# SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# カンマ区切り（例: "example.com,192.168.0.10"）
+ALLOWED_HOSTS = [h.strip() for h in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if h.strip()]
+CSRF_TRUSTED_ORIGINS = [o.strip() for o in os.environ.get('DJANGO_CSRF_TRUSTED_ORIGINS', '').split(',') if o.strip()]
 
-ALLOWED_HOSTS = []
+# アプリケーションサーバー（python manage.py serve で起動）
+# uvicorn: 開発用（1プロセス・自動リロード） / gunicorn: 本番用（gunicorn.conf.py のワーカー構成）
+APP_SERVER = os.environ.get('APP_SERVER', 'uvicorn' if DEBUG else 'gunicorn')
 
 
 # Application definition
@@ -42,10 +56,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # 静的ファイルの配信（WhiteNoise。圧縮済みファイル・長期キャッシュのヘッダ付き）
+    'orders.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # URL名ごとの応答時間・SQL件数の集計（セッション・ログインユーザーの読み込みも計測に含める）
+    'orders.middleware.RequestMetricsMiddleware',
+    'orders.middleware.DynamicSessionTimeoutMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -74,12 +93,70 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# POSTGRES_HOST が設定されていれば PostgreSQL（docker-compose の db サービス）を使う
+# 未設定の場合はローカル開発・テスト用の SQLite
+if os.environ.get('POSTGRES_HOST'):
+    # psycopg3 のコネクションプールを使う（DB_POOL=0 で永続接続 + ヘルスチェックに切り替え）
+    DB_POOL = os.environ.get('DB_POOL', '1') == '1'
+    # 1プロセスあたりの上限。gunicorn ではワーカー数と DB_MAX_CONNECTIONS から決まる（gunicorn.conf.py）
+    DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE') or '10')
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'postgres'),
+            'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ['POSTGRES_HOST'],
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # プール使用時は接続をプールに返すため永続接続は使わない
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': not DB_POOL,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': min(int(os.environ.get('DB_POOL_MIN_SIZE', '2')), DB_POOL_MAX_SIZE),
+                    'max_size': DB_POOL_MAX_SIZE,
+                    # 空きが無いときに待つ秒数
+                    'timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+                },
+            } if DB_POOL else {},
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            # SQLITE_PATH: 別のデータベースファイルを使う場合（ベンチマーク用のデータなど）
+            'NAME': os.environ.get('SQLITE_PATH') or BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                # 書き込みトランザクションは開始時にロックを取る（同時採番時の "database is locked" を防ぐ）
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+                # WALモードで読み込みと書き込みを並行させる
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+            },
+            # テスト用のデータベースもファイルにする（メモリ上の共有キャッシュでは同時実行のテストでロック待ちができない）
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
+    }
+
+# キャッシュ（検索結果・過去日の実績管理表・検索キャッシュの世代）は全ワーカー・全プロセスで共有する
+# CACHE_REDIS_URL があれば Redis（docker-compose の redis サービス）、未設定なら DB のキャッシュテーブル
+# （キャッシュテーブルはマイグレーション 0014 で作成。CACHES を変えた場合は python manage.py createcachetable）
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'orders_cache',
+        }
     }
-}
 
 
 # Password validation
@@ -117,6 +194,19 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 
 STATIC_URL = 'static/'
+# collectstatic の出力先（本番は WhiteNoise がここから配信する）
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    # 本番はファイル名にハッシュを付け、gzip/brotli 圧縮版も作成する（ハッシュ付きファイルは1年キャッシュ）
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+        else 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -134,6 +224,32 @@ AUTH_USER_MODEL = 'orders.User' # カスタムユーザーモデルの使用を
 # ブラウザを閉じたらログアウト
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 
+# 年度の開始月（実績のアーカイブ・テーブルの年度分割の単位）
+FISCAL_YEAR_START_MONTH = 4
+# 締めた年度の出荷・予定を書き出すディレクトリ（python manage.py archive_fiscal_year）
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR') or BASE_DIR / 'archives'
+
+# 変更通知（SSE）を複数プロセスで共有する場合の Redis（未設定ならプロセス内で配信）
+BROADCAST_REDIS_URL = os.environ.get('BROADCAST_REDIS_URL')
+
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'menu'  # ログイン成功後にメニュー画面へ
-LOGOUT_REDIRECT_URL = 'login'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = 'login'
+# リクエストの計測（orders.middleware.RequestMetricsMiddleware）
+# 応答時間がこのミリ秒を超えたリクエストを、実行時間の長い SQL とともにログに残す（0 で無効）
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', '1000'))
+# 応答に Server-Timing ヘッダ（SQL件数・DB時間・処理時間）を付ける
+METRICS_SERVER_TIMING = os.environ.get('METRICS_SERVER_TIMING', '1') == '1'
+# /orders/metrics/ を Prometheus から取得するためのトークン（Authorization: Bearer <トークン>）。未設定なら管理者のログインが必要
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'orders': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
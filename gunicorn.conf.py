@@ -0,0 +1,86 @@
+"""
+gunicorn の設定（本番用。python manage.py serve から読み込まれる）
+
+ワーカー数の目安: WEB_CONCURRENCY = CPUコア数（省略時の値）
+  - 2 × コア数 + 1 は同期ワーカー（1プロセス1リクエスト）向けの目安で、ASGI のワーカーには多すぎる
+  - 各ワーカーは ASGI（UvicornWorker）で動き、非同期ビュー（予定取得・予定保存・オートコンプリート・SSE など）は
+    1つのイベントループで多数の接続を処理する
+  - 同期ビュー（受注一覧・実績管理表・CSV出力・出荷取込・契約の進捗・予定の一括保存など）は Django が
+    sync_to_async(thread_sensitive=True) で実行する。ASGIHandler はリクエストごとに ThreadSensitiveContext を作るため、
+    1つのリクエストの同期処理は同じスレッドにまとまり、別のリクエストの同期ビューは別のスレッドで並行に動く
+  - 同期ビューの同時実行数はスレッド数ではなく DB のコネクションプール（DB_POOL_MAX_SIZE）で決まる
+    （実行中の同期ビューは1本ずつ接続を使い、空きが無ければ DB_POOL_TIMEOUT 秒待ってエラーになる）
+  - DB接続の上限: WEB_CONCURRENCY × DB_POOL_MAX_SIZE が DB_MAX_CONNECTIONS（PostgreSQL の max_connections。既定100）から
+    DB_RESERVED_CONNECTIONS（管理用・バッチ用の余裕。既定10）を引いた数を超えないこと
+    DB_POOL_MAX_SIZE を省略するとこの範囲で決め（最大10）、指定した値が超える場合は起動しない
+実際の値は python manage.py loadtest で確認して調整する（README 参照）
+
+複数ワーカーにするには BROADCAST_REDIS_URL（変更通知の Pub/Sub）が必要
+  未設定では保存したワーカーの SSE 接続にしか通知が届かず、ボードは接続中はポーリングしないため
+  他のワーカーにつながったボードへ変更が届かない。このためワーカーは1つに制限する
+"""
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY') or multiprocessing.cpu_count())
+if workers > 1 and not os.environ.get('BROADCAST_REDIS_URL'):
+    print(f'BROADCAST_REDIS_URL が未設定のため、ワーカー数を {workers} から 1 にします', file=sys.stderr)
+    workers = 1
+
+# PostgreSQL の接続数のうちワーカーのコネクションプールに使える数（残りは migrate・管理コマンド・psql 用）
+DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', '100'))
+DB_RESERVED_CONNECTIONS = int(os.environ.get('DB_RESERVED_CONNECTIONS', '10'))
+# DB_POOL_MAX_SIZE を省略した場合の1ワーカーあたりの上限
+DEFAULT_POOL_MAX_SIZE = 10
+
+
+def db_pool_max_size(workers):
+    """1ワーカーのコネクションプールの上限（ワーカー数 × 上限が接続数の予算を超える場合は起動しない）"""
+    budget = DB_MAX_CONNECTIONS - DB_RESERVED_CONNECTIONS
+    configured = os.environ.get('DB_POOL_MAX_SIZE')
+    size = int(configured) if configured else min(DEFAULT_POOL_MAX_SIZE, budget // workers)
+    if size < 1 or workers * size > budget:
+        sys.exit(
+            f'DB接続数が足りません: {workers}ワーカー × DB_POOL_MAX_SIZE {max(size, 1)} が '
+            f'DB_MAX_CONNECTIONS {DB_MAX_CONNECTIONS} − DB_RESERVED_CONNECTIONS {DB_RESERVED_CONNECTIONS} = {budget} を超えます。'
+            'WEB_CONCURRENCY か DB_POOL_MAX_SIZE を減らしてください'
+        )
+    return size
+
+
+# ワーカーは起動時に settings でこの値を読む
+if os.environ.get('POSTGRES_HOST') and os.environ.get('DB_POOL', '1') == '1':
+    os.environ['DB_POOL_MAX_SIZE'] = str(db_pool_max_size(workers))
+worker_class = 'uvicorn_worker.UvicornWorker'
+
+# UvicornWorker ではリクエスト単位ではなくワーカーの応答確認のタイムアウト（SSE の長時間接続は対象外）
+timeout = int(os.environ.get('WEB_TIMEOUT', '60'))
+graceful_timeout = 30
+keepalive = 5
+
+# メモリの増加を防ぐため、一定数のリクエストごとにワーカーを入れ替える（同時に入れ替わらないよう揺らす）
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', '2000'))
+max_requests_jitter = 200
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('WEB_LOG_LEVEL', 'info')
+
+# リクエストの計測（orders.metrics）を全ワーカーで合算するため、各ワーカーはこのディレクトリに値を書く
+# ワーカーが読み込む前に設定し、起動のたびに前回の値を消す
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'orders_metrics'))
+
+
+def on_starting(server):
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,322 @@
+import datetime
+import gzip
+import os
+import re
+from itertools import chain
+from pathlib import Path
+
+from django.conf import settings
+from django.core import serializers
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ArchivedPeriod, ChangeStamp, Order, OrderPlan, OrderSnapshot, RollupDirtyDate, Shipment
+from .progress import mark_contracts_dirty
+from .stamps import date_key, touch_dates
+
+# 期間で分割・アーカイブするテーブルと日付の列
+DATED_MODELS = [(Shipment, 'ship_date'), (OrderPlan, 'plan_date')]
+# アーカイブの書き出し・読み込みの単位
+ARCHIVE_CHUNK_SIZE = 2000
+
+PARTITION_INTERVALS = ('year', 'month')
+_BOUND_RE = re.compile(r"FROM \('([\d-]+)'\) TO \('([\d-]+)'\)")
+
+
+# --- 年度 ---
+def fiscal_year_of(d):
+    """日付の属する年度（settings.FISCAL_YEAR_START_MONTH 月始まり）"""
+    return d.year if d.month >= settings.FISCAL_YEAR_START_MONTH else d.year - 1
+
+
+def fiscal_year_range(year):
+    """年度の初日と末日"""
+    start = datetime.date(year, settings.FISCAL_YEAR_START_MONTH, 1)
+    return start, datetime.date(year + 1, settings.FISCAL_YEAR_START_MONTH, 1) - datetime.timedelta(days=1)
+
+
+def archived_periods(start, end):
+    """期間に重なるアーカイブ済みの年度の (開始日, 終了日)"""
+    return list(ArchivedPeriod.objects.filter(start__lte=end, end__gte=start).order_by('start').values_list('start', 'end'))
+
+
+def archived_q(field):
+    """アーカイブ済みの期間に含まれる日付の条件（アーカイブが無ければ None）"""
+    q = Q()
+    for start, end in ArchivedPeriod.objects.values_list('start', 'end'):
+        q |= Q(**{f'{field}__range': (start, end)})
+    return q or None
+
+
+# --- アーカイブ ---
+def archive_path(year):
+    return Path(settings.ARCHIVE_DIR) / f'FY{year}.jsonl.gz'
+
+
+def archive_fiscal_year(year):
+    """
+    締めた年度の出荷・予定を圧縮ファイル（Django の jsonl 形式・gzip）に書き出し、テーブルから削除する
+    日別集計（実績管理表・月次集計）と出荷カウンタ（日別・契約別）は残すため、集計は引き続き参照できる
+    戻り値: ArchivedPeriod
+    """
+    start, end = fiscal_year_range(year)
+    if end >= timezone.localdate():
+        raise ValueError(f'{year}年度はまだ終わっていません（{end} まで）')
+    if ArchivedPeriod.objects.filter(fiscal_year=year).exists():
+        raise ValueError(f'{year}年度はアーカイブ済みです')
+
+    # 集計・書き出しはトランザクションの外で行うため、その間の変更を削除の前に検出できるよう変更時刻を控えておく
+    stamps = _date_stamps(start, end)
+    # 削除後は出荷から集計できないため、先に日別集計を確定させる
+    from .rollups import refresh_rollups
+    refresh_rollups(start, end)
+
+    shipments = Shipment.objects.filter(ship_date__range=(start, end))
+    plans = OrderPlan.objects.filter(plan_date__range=(start, end))
+    # 出荷が参照する受注内容も含め、ファイルだけで復元できるようにする（テーブルの行は他の出荷と共有するため残す）
+    snapshots = OrderSnapshot.objects.filter(pk__in=shipments.values('snapshot_id'))
+    counts = {'snapshots': snapshots.count(), 'shipments': shipments.count(), 'plans': plans.count()}
+
+    path = archive_path(year)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+        serializers.serialize('jsonl', chain(
+            snapshots.order_by('pk').iterator(chunk_size=ARCHIVE_CHUNK_SIZE),
+            shipments.order_by('pk').iterator(chunk_size=ARCHIVE_CHUNK_SIZE),
+            plans.order_by('pk').iterator(chunk_size=ARCHIVE_CHUNK_SIZE),
+        ), stream=f)
+    # 書き出した件数を読み直して確認してから削除する
+    with gzip.open(tmp, 'rt', encoding='utf-8') as f:
+        written = sum(1 for line in f if line.strip())
+    if written != sum(counts.values()):
+        tmp.unlink()
+        raise RuntimeError(f'アーカイブの件数が一致しません（書き出し {written}件 / 対象 {sum(counts.values())}件）')
+
+    try:
+        with transaction.atomic():
+            # 出荷・予定への書き込みを止めてから、控えた時点から変更が無いことを確かめる
+            # （変更があれば書き出していない行・変更前の行を消すことになるため中止する）
+            _lock_for_delete()
+            if (
+                _date_stamps(start, end) != stamps
+                or shipments.count() != counts['shipments'] or plans.count() != counts['plans']
+            ):
+                raise RuntimeError(f'書き出し中に{year}年度の出荷・予定が変更されました。もう一度実行してください')
+            os.replace(tmp, path)
+            period = ArchivedPeriod.objects.create(
+                fiscal_year=year, start=start, end=end,
+                shipment_count=counts['shipments'], plan_count=counts['plans'], path=str(path),
+            )
+            # 予定数量の合計が変わる契約の進捗を再計算させる
+            mark_contracts_dirty(plans.order_by().values_list('order_id', flat=True).distinct())
+            # 削除はシグナル（カウンタの再集計・変更通知）を通さない。分割済みのテーブルは年度の区画ごと削除する
+            for model, field in DATED_MODELS:
+                delete_period(model, field, start, end)
+            RollupDirtyDate.objects.filter(date__range=(start, end)).delete()
+            touch_dates(_days(start, end))
+    finally:
+        tmp.unlink(missing_ok=True)
+    return period
+
+
+def _date_stamps(start, end):
+    """期間内の日付ごとの変更時刻（出荷・予定の追加・変更・削除で更新される）"""
+    return dict(ChangeStamp.objects.filter(key__in=[date_key(d) for d in _days(start, end)]).values_list('key', 'changed_at'))
+
+
+def _lock_for_delete():
+    """出荷・予定への書き込みをトランザクションの終わりまで待たせる（SQLite は書き込みのトランザクションで排他済み）"""
+    if connection.vendor == 'postgresql':
+        qn = connection.ops.quote_name
+        tables = ', '.join(qn(model._meta.db_table) for model, _ in DATED_MODELS)
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {tables} IN SHARE MODE')
+
+
+def restore_fiscal_year(year):
+    """アーカイブした年度の出荷・予定をファイルからテーブルに戻す（出荷カウンタ・日別集計は残っているためそのまま使う）"""
+    period = ArchivedPeriod.objects.filter(fiscal_year=year).first()
+    if period is None:
+        raise ValueError(f'{year}年度はアーカイブされていません')
+    order_ids = set(Order.objects.values_list('pk', flat=True))
+    restored = {}
+    contracts = set()
+    with transaction.atomic(), gzip.open(period.path, 'rt', encoding='utf-8') as f:
+        batch, batch_model = [], None
+        for item in serializers.deserialize('jsonl', f):
+            obj = item.object
+            # アーカイブ後に削除された受注への参照は外す
+            if isinstance(obj, (Shipment, OrderPlan)) and obj.order_id not in order_ids:
+                obj.order_id = None
+            if isinstance(obj, OrderPlan):
+                contracts.add(obj.order_id)
+            if batch and (type(obj) is not batch_model or len(batch) >= ARCHIVE_CHUNK_SIZE):
+                _restore_batch(batch_model, batch, restored)
+                batch = []
+            batch_model = type(obj)
+            batch.append(obj)
+        if batch:
+            _restore_batch(batch_model, batch, restored)
+        period.delete()
+        touch_dates(_days(period.start, period.end))
+        mark_contracts_dirty(contracts)
+    _reset_sequences()
+    return restored
+
+
+def _restore_batch(model, objs, restored):
+    # 受注内容は他の出荷と共有しているため、残っている行はそのまま使う
+    model.objects.bulk_create(objs, ignore_conflicts=model is OrderSnapshot)
+    restored[model._meta.model_name] = restored.get(model._meta.model_name, 0) + len(objs)
+
+
+def _reset_sequences():
+    """ID を指定して戻した後、自動採番を既存の最大値の後から続ける（PostgreSQL）"""
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [Shipment, OrderPlan]):
+            cursor.execute(sql)
+
+
+def _days(start, end):
+    return [start + datetime.timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def delete_period(model, field, start, end):
+    """期間内の行を削除する。PostgreSQL で期間内に収まる区画があれば、区画ごと切り離して削除する"""
+    table = model._meta.db_table
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for name, lower, upper in list_partitions(cursor, table):
+                if lower is not None and start <= lower and upper <= end + datetime.timedelta(days=1):
+                    cursor.execute(f'ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)}')
+                    cursor.execute(f'DROP TABLE {qn(name)}')
+        cursor.execute(f'DELETE FROM {qn(table)} WHERE {qn(field)} BETWEEN %s AND %s', [start, end])
+
+
+# --- PostgreSQL の期間分割（パーティション） ---
+def is_partitioned(cursor, table):
+    cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [table])
+    return cursor.fetchone() is not None
+
+
+def list_partitions(cursor, table):
+    """区画の一覧: [(名前, 下限, 上限)]（既定の区画は下限・上限が None）"""
+    cursor.execute(
+        'SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i '
+        'JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(%s)',
+        [table],
+    )
+    partitions = []
+    for name, bound in cursor.fetchall():
+        m = _BOUND_RE.search(bound or '')
+        if m:
+            partitions.append((name, datetime.date.fromisoformat(m.group(1)), datetime.date.fromisoformat(m.group(2))))
+        else:
+            partitions.append((name, None, None))
+    return partitions
+
+
+def partition_periods(first, last, interval):
+    """first〜last を含む区画: [(名前の接尾辞, 下限, 上限（含まない）)]。year は年度単位"""
+    if interval not in PARTITION_INTERVALS:
+        raise ValueError(f'interval は {" / ".join(PARTITION_INTERVALS)} のいずれかです')
+    periods = []
+    if interval == 'year':
+        year = fiscal_year_of(first)
+        while True:
+            lower, end = fiscal_year_range(year)
+            if lower > last:
+                break
+            periods.append((f'fy{year}', lower, end + datetime.timedelta(days=1)))
+            year += 1
+    else:
+        lower = first.replace(day=1)
+        while lower <= last:
+            upper = (lower + datetime.timedelta(days=32)).replace(day=1)
+            periods.append((f'{lower.year}_{lower.month:02d}', lower, upper))
+            lower = upper
+    return periods
+
+
+def create_partitions(cursor, table, periods):
+    """無い区画を作成する（戻り値: 作成した区画名）。範囲外の日付は既定の区画に入る"""
+    qn = connection.ops.quote_name
+    existing = {name for name, _, _ in list_partitions(cursor, table)}
+    created = []
+    for suffix, lower, upper in periods:
+        name = f'{table}_{suffix}'
+        if name not in existing:
+            cursor.execute(
+                f'CREATE TABLE {qn(name)} PARTITION OF {qn(table)} FOR VALUES FROM (%s) TO (%s)',
+                [lower.isoformat(), upper.isoformat()],
+            )
+            created.append(name)
+    default = f'{table}_default'
+    if default not in existing:
+        cursor.execute(f'CREATE TABLE {qn(default)} PARTITION OF {qn(table)} DEFAULT')
+        created.append(default)
+    return created
+
+
+def convert_to_partitioned(cursor, table, field, periods):
+    """
+    既存のテーブルを日付の範囲で分割したテーブルに作り替える（トランザクション内で呼ぶ。実行中は表がロックされる）
+    主キーは (id, 日付) になる（分割キーを含む必要があるため）。Django からは従来どおり id で参照する
+    """
+    qn = connection.ops.quote_name
+    old = f'{table}_unpartitioned'
+    # 同じトランザクションで書き込んだ行の外部キーの確認（遅延制約）を先に済ませる（残っていると旧テーブルを削除できない）
+    cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+    # 作り直す制約（外部キー・一意・チェック）と索引
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = to_regclass(%s) AND contype IN ('f', 'u', 'c')",
+        [table],
+    )
+    constraints = cursor.fetchall()
+    cursor.execute(
+        "SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s "
+        "AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s))",
+        [table, table],
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT attidentity FROM pg_attribute WHERE attrelid = to_regclass(%s) AND attname = 'id'", [table],
+    )
+    identity = cursor.fetchone()[0] in ('a', 'd')
+    cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [table, 'id'])
+    sequence = cursor.fetchone()[0]
+
+    cursor.execute(f'ALTER TABLE {qn(table)} RENAME TO {qn(old)}')
+    cursor.execute(
+        f'CREATE TABLE {qn(table)} (LIKE {qn(old)} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING GENERATED) '
+        f'PARTITION BY RANGE ({qn(field)})'
+    )
+    cursor.execute(f'ALTER TABLE {qn(table)} ADD PRIMARY KEY (id, {qn(field)})')
+    create_partitions(cursor, table, periods)
+    overriding = ' OVERRIDING SYSTEM VALUE' if identity else ''
+    cursor.execute(f'INSERT INTO {qn(table)}{overriding} SELECT * FROM {qn(old)}')
+
+    if identity:
+        # 作り直した自動採番を既存の最大値から続ける
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM {qn(table)}",
+            [table],
+        )
+    elif sequence:
+        # serial の採番は旧テーブルの削除で消えないよう付け替える
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY NONE')
+    cursor.execute(f'DROP TABLE {qn(old)}')
+    if sequence and not identity:
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {qn(table)}.id')
+
+    for name, definition in constraints:
+        cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}')
+    for definition in indexes:
+        cursor.execute(definition)
+    cursor.execute(f'ANALYZE {qn(table)}')
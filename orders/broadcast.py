@@ -0,0 +1,120 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# 購読者ごとの未配信イベントの上限（遅い接続でメモリを使い切らないため、超えた分は捨てる）
+QUEUE_SIZE = 1000
+
+
+class Subscription:
+    """SSE 接続1本分の受信キュー"""
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def deliver(self, event, data):
+        # イベントループのスレッドで実行される
+        if not self.queue.full():
+            self.queue.put_nowait((event, data))
+
+
+class LocalBroadcaster:
+    """プロセス内のブロードキャスタ（同じプロセスの SSE 接続にだけ配信）"""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        sub = Subscription()
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def publish(self, event, data):
+        self._fanout(event, data)
+
+    def _fanout(self, event, data):
+        # 保存処理はワーカースレッドで動くため、各接続のイベントループに受け渡す
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            try:
+                sub.loop.call_soon_threadsafe(sub.deliver, event, data)
+            except RuntimeError:
+                # 接続側のイベントループが終了済み
+                self.unsubscribe(sub)
+
+
+class RedisBroadcaster(LocalBroadcaster):
+    """Redis の Pub/Sub を経由して全プロセスの SSE 接続に配信"""
+
+    CHANNEL = 'orders:events'
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured('BROADCAST_REDIS_URL を使うには redis パッケージが必要です')
+        super().__init__()
+        self._redis = redis.Redis.from_url(url)
+        self._listener = None
+
+    def subscribe(self):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, daemon=True)
+                self._listener.start()
+        return super().subscribe()
+
+    def publish(self, event, data):
+        self._redis.publish(self.CHANNEL, json.dumps({'event': event, 'data': data}))
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CHANNEL)
+                for message in pubsub.listen():
+                    payload = json.loads(message['data'])
+                    self._fanout(payload['event'], payload['data'])
+            except Exception:
+                logger.exception('Redis の購読が切断されました。再接続します')
+                time.sleep(1)
+
+
+_broadcaster = None
+_broadcaster_lock = threading.Lock()
+
+
+def get_broadcaster():
+    """設定に応じたブロードキャスタ（BROADCAST_REDIS_URL があれば Redis 経由）"""
+    global _broadcaster
+    with _broadcaster_lock:
+        if _broadcaster is None:
+            url = getattr(settings, 'BROADCAST_REDIS_URL', None)
+            _broadcaster = RedisBroadcaster(url) if url else LocalBroadcaster()
+    return _broadcaster
+
+
+def publish(event, data):
+    """変更を通知する（トランザクション中ならコミット後に配信）"""
+    def send():
+        try:
+            get_broadcaster().publish(event, data)
+        except Exception:
+            # 通知に失敗しても保存処理は成功させる
+            logger.exception('変更通知の配信に失敗しました')
+    transaction.on_commit(send)
@@ -0,0 +1,67 @@
+from django.db.models import FloatField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Order, OrderPlan, ShipmentContractCounter, ShipmentDailyCounter
+
+# 数量の比較で誤差とみなす幅
+QTY_EPSILON = 1e-6
+
+
+def _commitment_rows(contracts, today):
+    """
+    契約ごとの契約数量・出荷済み数量・今後の予定数量を1クエリで集計する
+    contracts: 契約NOのリスト、または契約NOを返すサブクエリ
+
+    今日以降の予定には今日の出荷分も含まれるため、出荷済みは前日までの実績（全期間 − 当日分）とする
+    """
+    shipped_total = ShipmentContractCounter.objects.filter(issue_no=OuterRef('pk')).values('qty_sum')
+    shipped_today = ShipmentDailyCounter.objects.filter(issue_no=OuterRef('pk'), ship_date=today).values('qty_sum')
+    zero = Value(0.0, output_field=FloatField())
+    return (
+        Order.objects.filter(pk__in=contracts)
+        .values('issue_no', 'qty')
+        .annotate(
+            planned=Coalesce(Sum('orderplan__plan_qty', filter=Q(orderplan__plan_date__gte=today)), zero),
+            shipped_total=Coalesce(Subquery(shipped_total, output_field=FloatField()), zero),
+            shipped_today=Coalesce(Subquery(shipped_today, output_field=FloatField()), zero),
+        )
+        .order_by()
+    )
+
+
+def _as_commitment(row):
+    shipped = row['shipped_total'] - row['shipped_today']
+    remaining = row['qty'] - shipped - row['planned']
+    return {
+        'qty': row['qty'],
+        'shipped': round(shipped, 1),
+        'planned': round(row['planned'], 1),
+        'remaining': round(remaining, 1),
+        'over': remaining < -QTY_EPSILON,
+    }
+
+
+def window_contracts(start, end):
+    """期間内の予定に含まれる契約NO（サブクエリとして使う）"""
+    return (
+        OrderPlan.objects.filter(plan_date__range=(start, end), order__isnull=False)
+        .values('order_id')
+        .distinct()
+    )
+
+
+def contract_commitments(contracts, today=None):
+    """
+    契約ごとの予定超過チェック
+    出荷済み数量 + 今日以降の予定数量 が契約数量を超える契約は over=True
+    戻り値: {契約NO: {'qty', 'shipped', 'planned', 'remaining', 'over'}}
+    """
+    today = today or timezone.localdate()
+    return {row['issue_no']: _as_commitment(row) for row in _commitment_rows(contracts, today)}
+
+
+async def acontract_commitments(contracts, today=None):
+    """contract_commitments の非同期版"""
+    today = today or timezone.localdate()
+    return {row['issue_no']: _as_commitment(row) async for row in _commitment_rows(contracts, today)}
@@ -0,0 +1,188 @@
+from django.apps import apps as global_apps
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    BigIntegerField, Case, CharField, Count, DateField, F, Max, OuterRef, Q, Subquery, Sum, Value, When,
+)
+
+# 再集計時に一度に処理する契約数
+REBUILD_BATCH_SIZE = 500
+
+
+def _increment(model, lookup, updates, defaults):
+    """カウンタ行を更新し、無ければ作成する（同時作成時は更新をやり直す）"""
+    if model.objects.filter(**lookup).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **defaults)
+    except IntegrityError:
+        model.objects.filter(**lookup).update(**updates)
+
+
+def record_shipment(shipment):
+    """出荷1件の登録をカウンタに加算（出荷の保存と同じトランザクションで呼ぶ）"""
+    ShipmentDailyCounter = global_apps.get_model('orders', 'ShipmentDailyCounter')
+    ShipmentContractCounter = global_apps.get_model('orders', 'ShipmentContractCounter')
+    qty = shipment.ship_qty or 0
+
+    # 後から登録された出荷（IDが大きい方）の車両番号を前車NOとして残す
+    is_latest = Q(last_shipment_id__lt=shipment.pk)
+    _increment(
+        ShipmentDailyCounter,
+        {'issue_no': shipment.issue_no, 'ship_date': shipment.ship_date},
+        {
+            'unit_count': F('unit_count') + 1,
+            'qty_sum': F('qty_sum') + qty,
+            'last_car_no': Case(When(is_latest, then=Value(shipment.car_no)), default=F('last_car_no'), output_field=CharField()),
+            'last_shipment_id': Case(When(is_latest, then=Value(shipment.pk)), default=F('last_shipment_id'), output_field=BigIntegerField()),
+        },
+        {'unit_count': 1, 'qty_sum': qty, 'last_car_no': shipment.car_no, 'last_shipment_id': shipment.pk},
+    )
+    is_newer_day = Q(last_ship_date__isnull=True) | Q(last_ship_date__lt=shipment.ship_date)
+    _increment(
+        ShipmentContractCounter,
+        {'issue_no': shipment.issue_no},
+        {
+            'unit_count': F('unit_count') + 1,
+            'qty_sum': F('qty_sum') + qty,
+            'last_ship_date': Case(When(is_newer_day, then=Value(shipment.ship_date)), default=F('last_ship_date'), output_field=DateField()),
+        },
+        {'unit_count': 1, 'qty_sum': qty, 'last_ship_date': shipment.ship_date},
+    )
+
+
+def record_shipments(shipments):
+    """
+    一括登録した出荷をカウンタにまとめて加算（bulk_create 後、同じトランザクションで呼ぶ）
+    契約NO・出荷日ごとに1回ずつ更新する
+    """
+    ShipmentDailyCounter = global_apps.get_model('orders', 'ShipmentDailyCounter')
+    ShipmentContractCounter = global_apps.get_model('orders', 'ShipmentContractCounter')
+
+    daily, contracts = {}, {}
+    for s in shipments:
+        qty = s.ship_qty or 0
+        d = daily.setdefault((s.issue_no, s.ship_date), {'count': 0, 'qty': 0, 'last': s})
+        d['count'] += 1
+        d['qty'] += qty
+        if s.pk > d['last'].pk:
+            d['last'] = s
+        c = contracts.setdefault(s.issue_no, {'count': 0, 'qty': 0, 'last_date': s.ship_date})
+        c['count'] += 1
+        c['qty'] += qty
+        c['last_date'] = max(c['last_date'], s.ship_date)
+
+    for (issue_no, ship_date), d in daily.items():
+        last = d['last']
+        is_latest = Q(last_shipment_id__lt=last.pk)
+        _increment(
+            ShipmentDailyCounter,
+            {'issue_no': issue_no, 'ship_date': ship_date},
+            {
+                'unit_count': F('unit_count') + d['count'],
+                'qty_sum': F('qty_sum') + d['qty'],
+                'last_car_no': Case(When(is_latest, then=Value(last.car_no)), default=F('last_car_no'), output_field=CharField()),
+                'last_shipment_id': Case(When(is_latest, then=Value(last.pk)), default=F('last_shipment_id'), output_field=BigIntegerField()),
+            },
+            {'unit_count': d['count'], 'qty_sum': d['qty'], 'last_car_no': last.car_no, 'last_shipment_id': last.pk},
+        )
+    for issue_no, c in contracts.items():
+        is_newer_day = Q(last_ship_date__isnull=True) | Q(last_ship_date__lt=c['last_date'])
+        _increment(
+            ShipmentContractCounter,
+            {'issue_no': issue_no},
+            {
+                'unit_count': F('unit_count') + c['count'],
+                'qty_sum': F('qty_sum') + c['qty'],
+                'last_ship_date': Case(When(is_newer_day, then=Value(c['last_date'])), default=F('last_ship_date'), output_field=DateField()),
+            },
+            {'unit_count': c['count'], 'qty_sum': c['qty'], 'last_ship_date': c['last_date']},
+        )
+
+
+def rebuild_counters(issue_nos=None):
+    """
+    出荷テーブルからカウンタを作り直す
+    issue_nos: 対象の契約NO（None なら全契約）
+    """
+    Shipment = global_apps.get_model('orders', 'Shipment')
+    ShipmentDailyCounter = global_apps.get_model('orders', 'ShipmentDailyCounter')
+    ShipmentContractCounter = global_apps.get_model('orders', 'ShipmentContractCounter')
+
+    if issue_nos is None:
+        archived = _archived_q()
+        with transaction.atomic():
+            daily = ShipmentDailyCounter.objects.all()
+            (daily.exclude(archived) if archived else daily).delete()
+            ShipmentContractCounter.objects.all().delete()
+        issue_nos = sorted(
+            set(Shipment.objects.values_list('issue_no', flat=True).distinct().order_by())
+            | set(ShipmentDailyCounter.objects.values_list('issue_no', flat=True).distinct().order_by())
+        )
+
+    batch = []
+    for no in issue_nos:
+        batch.append(no)
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            _rebuild_batch(batch)
+            batch = []
+    if batch:
+        _rebuild_batch(batch)
+
+
+def _archived_q():
+    """
+    アーカイブ済みの年度の日付の条件（無ければ None）
+    その期間の出荷は削除済みのため、日別カウンタは作り直さずにアーカイブ時点の値を残す
+    """
+    ArchivedPeriod = global_apps.get_model('orders', 'ArchivedPeriod')
+    q = Q()
+    for start, end in ArchivedPeriod.objects.values_list('start', 'end'):
+        q |= Q(ship_date__range=(start, end))
+    return q or None
+
+
+def _rebuild_batch(issue_nos):
+    Shipment = global_apps.get_model('orders', 'Shipment')
+    ShipmentDailyCounter = global_apps.get_model('orders', 'ShipmentDailyCounter')
+    ShipmentContractCounter = global_apps.get_model('orders', 'ShipmentContractCounter')
+    archived = _archived_q()
+
+    with transaction.atomic():
+        daily_counters = ShipmentDailyCounter.objects.filter(issue_no__in=issue_nos)
+        (daily_counters.exclude(archived) if archived else daily_counters).delete()
+        ShipmentContractCounter.objects.filter(issue_no__in=issue_nos).delete()
+
+        shipments = Shipment.objects.filter(issue_no__in=issue_nos)
+        last_car_no = Subquery(
+            Shipment.objects.filter(issue_no=OuterRef('issue_no'), ship_date=OuterRef('ship_date'))
+            .order_by('-id').values('car_no')[:1]
+        )
+        daily = (
+            shipments.values('issue_no', 'ship_date')
+            .annotate(unit_count=Count('id'), qty_sum=Sum('ship_qty'), last_shipment_id=Max('id'), last_car_no=last_car_no)
+            .order_by()
+        )
+        ShipmentDailyCounter.objects.bulk_create([
+            ShipmentDailyCounter(
+                issue_no=d['issue_no'],
+                ship_date=d['ship_date'],
+                unit_count=d['unit_count'],
+                qty_sum=d['qty_sum'] or 0,
+                last_car_no=d['last_car_no'] or '',
+                last_shipment_id=d['last_shipment_id'],
+            )
+            for d in daily
+        ])
+        # 契約別は日別カウンタの合計（アーカイブ済みの年度の分を含む）
+        ShipmentContractCounter.objects.bulk_create([
+            ShipmentContractCounter(
+                issue_no=c['issue_no'],
+                unit_count=c['unit_count'],
+                qty_sum=c['qty_sum'] or 0,
+                last_ship_date=c['last_ship_date'],
+            )
+            for c in ShipmentDailyCounter.objects.filter(issue_no__in=issue_nos).values('issue_no')
+            .annotate(unit_count=Sum('unit_count'), qty_sum=Sum('qty_sum'), last_ship_date=Max('ship_date'))
+            .order_by()
+        ])
@@ -0,0 +1,119 @@
+import csv
+import datetime
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+from .models import Order, OrderSnapshot, Shipment
+from .pricing import get_price_table
+from .reports import contract_report, report_facts
+
+# DBから一度に読み込む行数（サーバーサイドカーソルの取得単位）
+EXPORT_CHUNK_SIZE = 2000
+# ASGI で1回のスレッド切り替えごとに書き出す行数
+ASGI_BATCH_ROWS = 500
+# 実績管理表を一度に集計する日数
+REPORT_WINDOW_DAYS = 7
+
+# Excel で開いたときに文字化けしないよう先頭に付ける BOM
+UTF8_BOM = '\ufeff'
+
+ORDER_FIELDS = [
+    'issue_no', 'issue_date', 'site', 'site_address', 'customer', 'contractor', 'coordinator', 'contact',
+    'product', 'product_category', 'note', 'firstship_date', 'qty', 'rotation', 'price',
+    'material_soil', 'water', 'cementBB', 'recycle_sand', 'admixture', 'material_soil_wm',
+    'test', 'night', 'outside23', 'material_delivery', 'specialnote',
+]
+SHIPMENT_FIELDS = [
+    'id', 'issue_no', 'ship_date', 'ship_time', 'ship_qty', 'car_no',
+    'total_unit', 'total_ship_qty', 'before_car_no', 'contract_qty', 'remaining_qty',
+]
+REPORT_HEADER = ['出荷日', '契約NO', '予定台数', '得意先', '現場名', '項目', '数量/回数', '単価', '金額']
+
+
+class _Echo:
+    """csv.writer の書き込み先（書いた1行をそのまま返す）"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield UTF8_BOM
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _take(iterator, size):
+    lines = []
+    for line in iterator:
+        lines.append(line)
+        if len(lines) >= size:
+            break
+    return ''.join(lines)
+
+
+async def _async_lines(lines):
+    # DB の読み込みは同期スレッドで行い、ASGI_BATCH_ROWS 行ずつ受け渡す
+    # （同期イテレータのままだと Django が全行をリストにしてから送信するため）
+    while True:
+        chunk = await sync_to_async(_take)(lines, ASGI_BATCH_ROWS)
+        if not chunk:
+            break
+        yield chunk
+
+
+def csv_response(request, filename, rows):
+    """行のイテレータ（先頭が見出し行）を CSV（UTF-8 BOM 付き）として逐次送信するレスポンス"""
+    lines = _csv_lines(rows)
+    content = _async_lines(lines) if isinstance(request, ASGIRequest) else lines
+    response = StreamingHttpResponse(content, content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _labels(model, names):
+    return [str(model._meta.get_field(name).verbose_name) for name in names]
+
+
+def order_rows(queryset):
+    """受注一覧の CSV 行"""
+    yield _labels(Order, ORDER_FIELDS)
+    for order in queryset.select_related('coordinator__user').order_by('issue_no').iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        values = [getattr(order, name) for name in ORDER_FIELDS]
+        values[ORDER_FIELDS.index('coordinator')] = order.coordinator.user.display_name if order.coordinator else ''
+        yield values
+
+
+def shipment_rows(start, end):
+    """期間内の出荷実績の CSV 行（受注内容のスナップショットを含む）"""
+    yield _labels(Shipment, SHIPMENT_FIELDS) + _labels(OrderSnapshot, OrderSnapshot.FIELDS)
+    shipments = (
+        Shipment.objects.filter(ship_date__range=(start, end))
+        .select_related('snapshot')
+        .order_by('ship_date', 'id')
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    empty = [''] * len(OrderSnapshot.FIELDS)
+    for s in shipments:
+        snapshot = [getattr(s.snapshot, name) for name in OrderSnapshot.FIELDS] if s.snapshot else empty
+        yield [getattr(s, name) for name in SHIPMENT_FIELDS] + snapshot
+
+
+def report_rows(start, end):
+    """実績管理表の CSV 行（REPORT_WINDOW_DAYS 日ずつ集計して書き出す）"""
+    yield REPORT_HEADER
+    prices = get_price_table()
+    window_start = start
+    while window_start <= end:
+        window_end = min(window_start + datetime.timedelta(days=REPORT_WINDOW_DAYS - 1), end)
+        for fact in report_facts(window_start, window_end):
+            report = contract_report(fact, prices)
+            for row in report['rows']:
+                yield [
+                    fact['date'], report['issue_no'], report['truck_planned'], report['customer'], report['site'],
+                    row['item'], row['unit'], row['price'], row['total'],
+                ]
+        window_start = window_end + datetime.timedelta(days=1)
@@ -1,5 +1,5 @@
 from django import forms
-from .models import Order, Shipment, User, SystemConfig
+from .models import Order, OrderSnapshot, Shipment, User, SystemConfig
 
 class OrderForm(forms.ModelForm):
     class Meta:
@@ -25,10 +25,30 @@ class ShipmentForm(forms.ModelForm):
         widgets = {
             'ship_date': forms.DateInput(attrs={'type': 'date'}),
             'ship_time': forms.TimeInput(attrs={'type': 'time'}),
-            'note': forms.Textarea(attrs={'rows': 2}),
-            'specialnote': forms.Textarea(attrs={'rows': 2}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 受注からのコピー項目は OrderSnapshot 側に持つため、入力欄だけ追加する
+        self.fields.update(forms.fields_for_model(
+            OrderSnapshot,
+            fields=OrderSnapshot.FIELDS,
+            widgets={
+                'note': forms.Textarea(attrs={'rows': 2}),
+                'specialnote': forms.Textarea(attrs={'rows': 2}),
+            },
+        ))
+        snapshot = self.instance.snapshot
+        if snapshot and not self.is_bound:
+            for name in OrderSnapshot.FIELDS:
+                self.initial.setdefault(name, getattr(snapshot, name))
+
+    def save(self, commit=True):
+        # 同じ内容の受注スナップショットは共有する
+        values = {name: self.cleaned_data.get(name) for name in OrderSnapshot.FIELDS}
+        self.instance.snapshot = OrderSnapshot.intern(self.cleaned_data.get('issue_no', ''), values)
+        return super().save(commit)
+
 class StaffForm(forms.ModelForm):
     """担当者登録・編集用"""
     password = forms.CharField(label="パスワード", widget=forms.PasswordInput, required=False, help_text="変更する場合のみ入力")
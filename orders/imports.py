@@ -0,0 +1,214 @@
+import csv
+import datetime
+import json
+
+from django.db import transaction
+from django.utils.dateparse import parse_date, parse_time
+
+from .broadcast import publish
+from .counters import record_shipments
+from .models import Order, OrderSnapshot, Shipment, ShipmentContractCounter, ShipmentDailyCounter
+from .progress import mark_contracts_dirty
+from .rollups import mark_dates_dirty
+
+# 1回のトランザクションで登録する行数（受注の検索・カウンタの読み込みもこの単位で行う）
+IMPORT_CHUNK_SIZE = 1000
+# 結果に残すエラー行の上限（件数はすべて数える）
+MAX_ERRORS = 100
+# 出荷量が空欄の場合の値（満載）
+DEFAULT_SHIP_QTY = 6.0
+
+FORMATS = ('csv', 'jsonl')
+
+
+class ImportResult:
+    """一括取込の結果（登録件数とエラー行）"""
+
+    def __init__(self):
+        self.created = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line_no, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'line': line_no, 'message': message})
+
+    def as_dict(self):
+        return {'created': self.created, 'error_count': self.error_count, 'errors': self.errors}
+
+
+def detect_format(filename):
+    """ファイル名の拡張子から形式を判定（不明なら csv）"""
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_records(stream, fmt):
+    """
+    テキストストリームから出荷レコードを1行ずつ読む（ファイル全体は読み込まない）
+    列: issue_no, ship_date, ship_time, ship_qty, car_no
+    戻り値: (行番号, レコードの辞書) のイテレータ
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'jsonl':
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_no, record if isinstance(record, dict) else {'_invalid': True}
+    else:
+        raise ValueError(f'未対応の形式です: {fmt}')
+
+
+def import_shipments(records, chunk_size=IMPORT_CHUNK_SIZE, result=None):
+    """
+    出荷レコードをまとめて登録する（計量器・配車記録の取込用）
+    累計台数・累計出荷量・前車NOは出荷カウンタの値からファイルの順に計算する
+    チャンクごとにコミットするため、途中で例外になってもそれまでの行は登録済み
+    （result を渡しておけば、例外のときも登録済みの件数がそこに残る）
+    """
+    if result is None:
+        result = ImportResult()
+    snapshots = {}
+    chunk = []
+    for line_no, record in records:
+        chunk.append((line_no, record))
+        if len(chunk) >= chunk_size:
+            _import_chunk(chunk, result, snapshots)
+            chunk = []
+    if chunk:
+        _import_chunk(chunk, result, snapshots)
+    return result
+
+
+def _parse_record(record, orders):
+    """1行分の検証と型変換（不正な場合は ValueError）"""
+    if record.get('_invalid'):
+        raise ValueError('JSONとして読めません')
+    issue_no = str(record.get('issue_no') or '').strip()
+    order = orders.get(issue_no)
+    if order is None:
+        raise ValueError(f'契約NO「{issue_no}」の受注がありません')
+
+    try:
+        ship_date = parse_date(str(record.get('ship_date') or '').strip())
+    except ValueError:
+        ship_date = None
+    if ship_date is None:
+        raise ValueError('ship_date が不正です')
+    time_text = str(record.get('ship_time') or '').strip()
+    try:
+        ship_time = parse_time(time_text) if time_text else datetime.time(0, 0)
+    except ValueError:
+        ship_time = None
+    if ship_time is None:
+        raise ValueError('ship_time が不正です')
+
+    qty_text = str(record.get('ship_qty') or '').strip()
+    try:
+        ship_qty = float(qty_text) if qty_text else DEFAULT_SHIP_QTY
+    except ValueError:
+        raise ValueError('ship_qty が不正です')
+
+    car_no = str(record.get('car_no') or '').strip()
+    if len(car_no) > Shipment._meta.get_field('car_no').max_length:
+        raise ValueError('car_no が長すぎます')
+
+    return {'order': order, 'ship_date': ship_date, 'ship_time': ship_time, 'ship_qty': ship_qty, 'car_no': car_no}
+
+
+def _import_chunk(chunk, result, snapshots):
+    # 参照される受注を1クエリでまとめて取得
+    issue_nos = {str(r.get('issue_no') or '').strip() for _, r in chunk}
+    orders = Order.objects.select_related('coordinator__user').in_bulk(issue_nos)
+
+    rows = []
+    for line_no, record in chunk:
+        try:
+            rows.append(_parse_record(record, orders))
+        except (ValueError, TypeError, AttributeError) as e:
+            result.add_error(line_no, str(e))
+    if not rows:
+        return
+
+    # 受注内容のスナップショットは契約ごとに1回だけ用意する（取込全体で共有）
+    used = {r['order'].issue_no for r in rows}
+    for issue_no in used - snapshots.keys():
+        order = orders[issue_no]
+        snapshots[issue_no] = OrderSnapshot.intern(issue_no, OrderSnapshot.values_from_order(order))
+
+    with transaction.atomic():
+        # まだ無いカウンタ行を先に作成する（行が無いと select_for_update で排他できず、
+        # 同時に取込むと両方が0から累計を数えてしまう。作成中の同じ行があればそのコミットを待つ）
+        daily_keys = sorted({(r['order'].issue_no, r['ship_date']) for r in rows})
+        ShipmentDailyCounter.objects.bulk_create(
+            [ShipmentDailyCounter(issue_no=no, ship_date=day) for no, day in daily_keys], ignore_conflicts=True,
+        )
+        ShipmentContractCounter.objects.bulk_create(
+            [ShipmentContractCounter(issue_no=no) for no in sorted(used)], ignore_conflicts=True,
+        )
+        # この範囲の出荷カウンタを読み、以降はメモリ上で順に加算する
+        daily = {
+            (c.issue_no, c.ship_date): c
+            for c in ShipmentDailyCounter.objects.select_for_update().filter(
+                issue_no__in=used, ship_date__in={day for _, day in daily_keys},
+            )
+        }
+        contract_qty = dict(
+            ShipmentContractCounter.objects.select_for_update()
+            .filter(issue_no__in=used).values_list('issue_no', 'qty_sum')
+        )
+        running = {}
+        shipments = []
+        for r in rows:
+            order = r['order']
+            key = (order.issue_no, r['ship_date'])
+            if key not in running:
+                c = daily.get(key)
+                running[key] = [c.unit_count, c.qty_sum, c.last_car_no] if c else [0, 0.0, '']
+            state = running[key]
+            before_car_no = state[2]
+            state[0] += 1
+            state[1] += r['ship_qty']
+            state[2] = r['car_no']
+            contract_qty[order.issue_no] = contract_qty.get(order.issue_no, 0) + r['ship_qty']
+            shipments.append(Shipment(
+                issue_no=order.issue_no,
+                order=order,
+                snapshot=snapshots[order.issue_no],
+                ship_date=r['ship_date'],
+                ship_time=r['ship_time'],
+                ship_qty=r['ship_qty'],
+                car_no=r['car_no'],
+                total_unit=state[0],
+                total_ship_qty=state[1],
+                before_car_no=before_car_no,
+                contract_qty=order.qty,
+                remaining_qty=order.qty - contract_qty[order.issue_no],
+            ))
+
+        # bulk_create では Shipment.save もシグナルも動かないため、カウンタの加算と通知をここで行う
+        created = Shipment.objects.bulk_create(shipments)
+        record_shipments(created)
+        mark_dates_dirty({s.ship_date for s in created})
+        mark_contracts_dirty({s.issue_no for s in created})
+
+    result.created += len(created)
+    latest = {}
+    for s in created:
+        latest[(s.issue_no, s.ship_date)] = s
+    for s in latest.values():
+        publish('shipment', {
+            'id': s.pk,
+            'issue_no': s.issue_no,
+            'date': str(s.ship_date),
+            'car_no': s.car_no,
+            'ship_qty': s.ship_qty,
+            'deleted': False,
+        })
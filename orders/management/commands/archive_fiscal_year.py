@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.archive import archive_fiscal_year, restore_fiscal_year
+from orders.models import ArchivedPeriod
+
+
+class Command(BaseCommand):
+    help = '締めた年度の出荷・予定を圧縮ファイル（settings.ARCHIVE_DIR）に移してテーブルから削除する（実績の集計は残る）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('year', type=int, nargs='?', help='年度（例: 2023 = 2023年4月〜2024年3月）')
+        parser.add_argument('--restore', action='store_true', help='アーカイブした年度をテーブルに戻す')
+        parser.add_argument('--list', action='store_true', help='アーカイブ済みの年度を表示する')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for period in ArchivedPeriod.objects.order_by('fiscal_year'):
+                self.stdout.write(
+                    f'{period} 出荷 {period.shipment_count}件 / 予定 {period.plan_count}件 / {period.path}'
+                )
+            return
+        year = options['year']
+        if year is None:
+            raise CommandError('年度を指定してください')
+
+        try:
+            if options['restore']:
+                restored = restore_fiscal_year(year)
+                self.stdout.write(self.style.SUCCESS(
+                    f"{year}年度を戻しました（出荷 {restored.get('shipment', 0)}件 / 予定 {restored.get('orderplan', 0)}件）"
+                ))
+                return
+            period = archive_fiscal_year(year)
+        except (ValueError, RuntimeError, OSError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f'{period} をアーカイブしました（出荷 {period.shipment_count}件 / 予定 {period.plan_count}件 → {period.path}）'
+        ))
@@ -0,0 +1,139 @@
+import asyncio
+import datetime
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from orders.management.commands.loadtest import percentile
+from orders.models import Order, OrderPlan
+
+
+class ThreadPeak:
+    """計測中のスレッド数の最大値を記録する"""
+
+    def __init__(self):
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+
+    def _watch(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, threading.active_count())
+            time.sleep(0.005)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class Command(BaseCommand):
+    help = 'JSON API を ASGI（非同期ビュー）と WSGI（1リクエスト1スレッド）で同時実行し、処理件数・応答時間・スレッド数を比較する'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='ログインに使うユーザー名')
+        parser.add_argument('--concurrency', type=int, default=64, help='同時に処理中のリクエスト数（タブレット台数の想定）')
+        parser.add_argument('--requests', type=int, default=500, help='エンドポイントごとのリクエスト数')
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(username=options['user']).first()
+        if user is None:
+            raise CommandError(f"ユーザー {options['user']} がありません")
+        order = Order.objects.order_by('-issue_no').only('issue_no').first()
+        if order is None:
+            raise CommandError('受注データがありません')
+
+        today = timezone.localdate()
+        start, end = today - datetime.timedelta(days=3), today + datetime.timedelta(days=3)
+        # 予定の保存は計測用の行（1年後の日付・BENCH 区分。計測後に削除）に書き込む
+        bench_date = (today + datetime.timedelta(days=366)).isoformat()
+        endpoints = {
+            'plan_feed': ('get', f'/orders/plans/feed/?start={start}&end={end}', None),
+            'autocomplete': ('get', '/orders/autocomplete/?term=現場', None),
+            'shipment_stats': ('get', f'/orders/shipment/stats/?issue_no={order.issue_no}', None),
+            'save_plan': ('post', '/orders/save_plan/', json.dumps({
+                'date': bench_date, 'section': 'BENCH', 'row_index': 1, 'site': 'bench', 'truck': 1,
+            })),
+        }
+
+        self.stdout.write(f"{connection.vendor}: 同時 {options['concurrency']} / {options['requests']}件ずつ")
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            self._bench(user, endpoints, options['concurrency'], options['requests'])
+        OrderPlan.objects.filter(section='BENCH').delete()
+
+    def _bench(self, user, endpoints, concurrency, total):
+        for name, (method, path, body) in endpoints.items():
+            for mode, run in (('WSGI', self._run_sync), ('ASGI', self._run_async)):
+                with ThreadPeak() as threads:
+                    started = time.perf_counter()
+                    latencies, errors = run(user, method, path, body, concurrency, total)
+                    elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"  {name:<15} {mode}: {len(latencies) / elapsed:7.1f}件/秒 p50 {percentile(latencies, 50):6.1f}ms "
+                    f"p95 {percentile(latencies, 95):6.1f}ms 最大スレッド {threads.peak:3d} エラー {errors}件"
+                )
+
+    def _run_sync(self, user, method, path, body, concurrency, total):
+        """スレッドごとに同期の Client でリクエストする（従来の1リクエスト1スレッドの構成）"""
+        local = threading.local()
+        lock = threading.Lock()
+        latencies, errors = [], 0
+
+        def one(_):
+            nonlocal errors
+            if not hasattr(local, 'client'):
+                local.client = Client()
+                local.client.force_login(user)
+            started = time.perf_counter()
+            response = self._request(local.client, method, path, body)
+            elapsed = (time.perf_counter() - started) * 1000
+            connection.close()
+            with lock:
+                if response.status_code == 200:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, range(total)))
+        return latencies, errors
+
+    def _run_async(self, user, method, path, body, concurrency, total):
+        """1つのイベントループから AsyncClient で同時にリクエストする（ASGI の構成）"""
+        async def main():
+            client = AsyncClient()
+            await client.aforce_login(user)
+            gate = asyncio.Semaphore(concurrency)
+            latencies, errors = [], 0
+
+            async def one():
+                nonlocal errors
+                async with gate:
+                    started = time.perf_counter()
+                    response = await self._request(client, method, path, body)
+                    elapsed = (time.perf_counter() - started) * 1000
+                if response.status_code == 200:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+            await asyncio.gather(*(one() for _ in range(total)))
+            return latencies, errors
+
+        return asyncio.run(main())
+
+    def _request(self, client, method, path, body):
+        if method == 'post':
+            return client.post(path, body, content_type='application/json')
+        return client.get(path)
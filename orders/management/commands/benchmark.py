@@ -0,0 +1,191 @@
+import datetime
+import json
+import platform
+import time
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from orders.management.commands.loadtest import percentile
+from orders.models import Order, OrderPlan, Shipment, ShipmentContractCounter, ShipmentDailyCounter
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+# 計測用の予定行（1年後の日付・BENCH 区分。計測後に削除）
+BENCH_SECTION = 'BENCH'
+# 計測中のキャッシュ（設定の CACHES によらずプロセス内のメモリにし、キャッシュの読み書きをクエリ数に含めない）
+BENCH_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'}}
+# リクエストごとにキャッシュを消して計測するエンドポイント（キャッシュ無しでの作成時間を測る）
+UNCACHED_ENDPOINTS = {'daily_report'}
+# 基準値と一致しなければ比較しない環境の項目（クエリ数はデータベースと Django のバージョンで変わる）
+MATCHING_ENVIRONMENT = ('database', 'django')
+
+
+class Command(BaseCommand):
+    help = '主要な画面・APIの応答時間（p50/p95/p99）とクエリ数を計測し、基準値（baseline.json）と比較する'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', default='bench', help='ログインに使うユーザー名')
+        parser.add_argument('--requests', type=int, default=50, help='エンドポイントごとの計測回数')
+        parser.add_argument('--warmup', type=int, default=3, help='計測前に捨てるリクエスト数（キャッシュの準備）')
+        parser.add_argument('--only', action='append', help='計測するエンドポイント名（複数指定可）')
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help='基準値のJSONファイル')
+        parser.add_argument('--save-baseline', action='store_true', help='今回の結果を基準値として保存する')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='p95 の許容する悪化率（0.25 = 25%%）')
+        parser.add_argument('--min-delta', type=float, default=2.0, help='悪化とみなす最小の差（ミリ秒。小さな揺れを無視する）')
+        parser.add_argument(
+            '--check-latency', action='store_true',
+            help='p95 の悪化も失敗にする（基準値を保存したのと同じマシンで計測する場合のみ）',
+        )
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(username=options['user']).first()
+        if user is None:
+            raise CommandError(f"ユーザー {options['user']} がありません（python manage.py seed_bench_data で作成）")
+        endpoints = self._endpoints()
+        if options['only']:
+            unknown = set(options['only']) - endpoints.keys()
+            if unknown:
+                raise CommandError(f"不明なエンドポイント: {', '.join(sorted(unknown))}（{', '.join(endpoints)}）")
+            endpoints = {name: e for name, e in endpoints.items() if name in options['only']}
+
+        client = Client()
+        client.force_login(user)
+        results = {}
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver'], CACHES=BENCH_CACHES):
+                for name, (method, path, body) in endpoints.items():
+                    results[name] = self._measure(
+                        client, method, path, body, options['requests'], options['warmup'], name in UNCACHED_ENDPOINTS,
+                    )
+                    r = results[name]
+                    self.stdout.write(
+                        f"  {name:<18} p50 {r['p50']:7.1f}ms p95 {r['p95']:7.1f}ms p99 {r['p99']:7.1f}ms "
+                        f"クエリ {r['queries']:3d} / {r['bytes']:,}バイト"
+                    )
+        finally:
+            OrderPlan.objects.filter(section=BENCH_SECTION).delete()
+
+        report = {
+            'environment': {
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'requests': options['requests'],
+            },
+            'data': {
+                'orders': Order.objects.count(),
+                'plans': OrderPlan.objects.count(),
+                'shipments': Shipment.objects.count(),
+            },
+            'endpoints': results,
+        }
+        path = Path(options['baseline'])
+        if options['save_baseline']:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(report, ensure_ascii=False, indent=2) + '\n', encoding='utf-8')
+            self.stdout.write(self.style.SUCCESS(f'基準値を保存しました: {path}'))
+            return
+        if not path.exists():
+            self.stdout.write(f'基準値がありません（--save-baseline で {path} に保存）')
+            return
+        self._compare(
+            json.loads(path.read_text(encoding='utf-8')), report,
+            options['tolerance'], options['min_delta'], options['check_latency'],
+        )
+
+    def _endpoints(self):
+        """計測対象: {名前: (メソッド, パス, 本文)}。日付・契約NOは生成データの中の負荷の高いものを選ぶ"""
+        today = timezone.localdate()
+        busiest_day = (
+            ShipmentDailyCounter.objects.values('ship_date').annotate(n=Count('id')).order_by('-n')
+            .values_list('ship_date', flat=True).first()
+        ) or today
+        busiest_contract = (
+            ShipmentContractCounter.objects.order_by('-unit_count').values_list('issue_no', flat=True).first()
+        ) or ''
+        start, end = today - datetime.timedelta(days=7), today + datetime.timedelta(days=13)
+        return {
+            'board_feed': ('get', f'/orders/plans/feed/?start={start}&end={end}', None),
+            'save_plan': ('post', '/orders/save_plan/', json.dumps({
+                'date': (today + datetime.timedelta(days=366)).isoformat(), 'section': BENCH_SECTION,
+                'row_index': 1, 'site': 'bench', 'qty': 6, 'truck': 1, 'issue_no': busiest_contract,
+            })),
+            'autocomplete': ('get', '/orders/autocomplete/?term=中央', None),
+            'autocomplete_long': ('get', '/orders/autocomplete/?term=共同住宅', None),
+            'shipment_stats': ('get', f'/orders/shipment/stats/?issue_no={busiest_contract}', None),
+            'daily_report': ('get', f'/orders/performance-report/?date={busiest_day}', None),
+            'order_list': ('get', '/orders/', None),
+            'contract_progress': ('get', '/orders/progress/data/?sort=-remaining_qty', None),
+        }
+
+    def _measure(self, client, method, path, body, requests, warmup, uncached=False):
+        for _ in range(warmup):
+            self._request(client, method, path, body)
+        latencies, queries, size = [], 0, 0
+        for _ in range(requests):
+            if uncached:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = self._request(client, method, path, body)
+                content = b''.join(response) if response.streaming else response.content
+                latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'{path} が {response.status_code} を返しました')
+            queries = max(queries, len(captured.captured_queries))
+            size = len(content)
+        return {
+            'p50': round(percentile(latencies, 50), 2),
+            'p95': round(percentile(latencies, 95), 2),
+            'p99': round(percentile(latencies, 99), 2),
+            'queries': queries,
+            'bytes': size,
+        }
+
+    def _request(self, client, method, path, body):
+        if method == 'post':
+            return client.post(path, body, content_type='application/json')
+        return client.get(path)
+
+    def _compare(self, baseline, report, tolerance, min_delta, check_latency):
+        """
+        クエリ数が基準値より増えたエンドポイントがあれば失敗にする
+        応答時間はマシンによって変わるため参考として表示する（--check-latency のときだけ p95 の悪化も失敗にする）
+        """
+        base_env = {key: baseline.get('environment', {}).get(key) for key in MATCHING_ENVIRONMENT}
+        env = {key: report['environment'][key] for key in MATCHING_ENVIRONMENT}
+        if baseline.get('data') != report['data'] or base_env != env:
+            raise CommandError(
+                f"計測条件が基準値と異なるため比較できません: 基準 {base_env} {baseline.get('data')} / 今回 {env} {report['data']}"
+                '（基準値と同じ --seed・件数で seed_bench_data を作り直すか、--save-baseline で保存し直す）'
+            )
+        regressions, slower = [], []
+        for name, current in report['endpoints'].items():
+            base = baseline.get('endpoints', {}).get(name)
+            if base is None:
+                self.stdout.write(f'  {name}: 基準値なし')
+                continue
+            if current['queries'] > base['queries']:
+                regressions.append(f"{name}: クエリ数 {base['queries']} → {current['queries']}")
+            limit = max(base['p95'] * (1 + tolerance), base['p95'] + min_delta)
+            if current['p95'] > limit:
+                slower.append(f"{name}: p95 {base['p95']}ms → {current['p95']}ms（上限 {limit:.1f}ms）")
+        if check_latency:
+            regressions.extend(slower)
+        else:
+            for line in slower:
+                self.stdout.write(self.style.WARNING(f'  {line}（参考）'))
+        if regressions:
+            for line in regressions:
+                self.stderr.write(f'  {line}')
+            raise CommandError(f'基準値より悪化しました（{len(regressions)}件）')
+        self.stdout.write(self.style.SUCCESS('すべて基準値の範囲内です'))
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Sum
+
+from orders.models import OrderPlan, Shipment
+from orders.reports import aggregate_contract_days
+
+
+class Command(BaseCommand):
+    help = '出荷・予定の主要な検索について実行計画（EXPLAIN）と実行時間を表示する'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='時間計測の繰り返し回数')
+        parser.add_argument('--analyze', action='store_true', help='EXPLAIN ANALYZE で実行計画を取得（PostgreSQL）')
+
+    def handle(self, *args, **options):
+        # 出荷件数が最も多い（契約NO, 出荷日）を計測対象にする
+        busiest = (
+            Shipment.objects.values('issue_no', 'ship_date')
+            .annotate(n=Count('id'))
+            .order_by('-n')
+            .first()
+        )
+        if not busiest:
+            raise CommandError('出荷データがありません')
+        issue_no, ship_date = busiest['issue_no'], busiest['ship_date']
+        self.stdout.write(f"{connection.vendor}: 対象 契約NO={issue_no} 出荷日={ship_date}（{busiest['n']}件）\n")
+
+        queries = {
+            '当日の出荷（出荷統計・前車NO）': lambda: Shipment.objects.filter(issue_no=issue_no, ship_date=ship_date).order_by('id'),
+            '契約の全期間出荷量': lambda: Shipment.objects.filter(issue_no=issue_no).values('issue_no').annotate(total=Sum('ship_qty')),
+            '日別の契約集計（実績管理表）': lambda: Shipment.objects.filter(ship_date=ship_date).values('issue_no').annotate(n=Count('id')),
+            '契約の予定台数（実績管理表）': lambda: OrderPlan.objects.filter(order_id=issue_no, plan_date=ship_date).values('order_id').annotate(t=Sum('truck_count')),
+        }
+        explain_options = {'analyze': True} if options['analyze'] and connection.vendor == 'postgresql' else {}
+        for label, build in queries.items():
+            qs = build()
+            elapsed = self._time(lambda: list(build()), options['repeat'])
+            self.stdout.write(self.style.MIGRATE_HEADING(f"■ {label}: 平均 {elapsed:.2f} ms"))
+            self.stdout.write(qs.explain(**explain_options))
+            self.stdout.write('')
+
+        elapsed = self._time(lambda: aggregate_contract_days(ship_date, ship_date), options['repeat'])
+        self.stdout.write(self.style.MIGRATE_HEADING(f"■ 実績管理表の集計（全体）: 平均 {elapsed:.2f} ms"))
+
+    def _time(self, func, repeat):
+        func()  # 初回はキャッシュの温め
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - started) * 1000 / repeat
@@ -0,0 +1,38 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.imports import FORMATS, IMPORT_CHUNK_SIZE, detect_format, import_shipments, read_records
+
+
+class Command(BaseCommand):
+    help = '計量器・配車記録（CSV / JSONL）から出荷実績を一括登録する'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="取込ファイル（'-' で標準入力）")
+        parser.add_argument('--format', choices=FORMATS, help='ファイル形式（省略時は拡張子から判定）')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help='1トランザクションで登録する行数')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or detect_format(path)
+        started = time.perf_counter()
+        try:
+            if path == '-':
+                result = import_shipments(read_records(sys.stdin, fmt), options['chunk_size'])
+            else:
+                with open(path, encoding='utf-8-sig', newline='') as f:
+                    result = import_shipments(read_records(f, fmt), options['chunk_size'])
+        except OSError as e:
+            raise CommandError(f'ファイルを開けません: {e}')
+        elapsed = time.perf_counter() - started
+
+        for error in result.errors:
+            self.stderr.write(f"{error['line']}行目: {error['message']}")
+        if result.error_count > len(result.errors):
+            self.stderr.write(f'…ほか {result.error_count - len(result.errors)}件')
+        self.stdout.write(f'{result.created}件を登録 / エラー {result.error_count}件 / {elapsed:.2f}秒')
+        if result.error_count:
+            raise CommandError('取り込めなかった行があります')
+        self.stdout.write(self.style.SUCCESS('取込が完了しました'))
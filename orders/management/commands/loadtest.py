@@ -0,0 +1,108 @@
+import datetime
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from orders.models import Order
+
+
+def percentile(values, p):
+    """p パーセンタイル（最近傍法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+class Command(BaseCommand):
+    help = '起動中のサーバーに同時リクエストを送り、スループットと応答時間を測る（ワーカー数の調整用）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000', help='対象サーバーのURL')
+        parser.add_argument('--user', required=True, help='ログインに使うユーザー名（セッションをDBに直接作成）')
+        parser.add_argument('--concurrency', type=int, default=32, help='同時接続数（タブレット台数の想定）')
+        parser.add_argument('--duration', type=float, default=20, help='計測時間（秒）')
+        parser.add_argument('--path', action='append', help='対象パス（複数指定可。省略時はボード・出荷画面の主要API）')
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(username=options['user']).first()
+        if user is None:
+            raise CommandError(f"ユーザー {options['user']} がありません")
+        cookie = f'{settings.SESSION_COOKIE_NAME}={self._create_session(user)}'
+        # 日本語を含むパスはURLエンコードしておく
+        paths = [urllib.parse.quote(p, safe='/?&=%') for p in options['path'] or self._default_paths()]
+        base_url = options['base_url'].rstrip('/')
+
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['duration']
+
+        def worker(offset):
+            i = offset
+            while time.monotonic() < deadline:
+                path = paths[i % len(paths)]
+                i += 1
+                request = urllib.request.Request(base_url + path, headers={'Cookie': cookie})
+                started = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(request, timeout=30) as response:
+                        response.read()
+                        ok = response.status == 200
+                except (urllib.error.URLError, OSError, ValueError):
+                    ok = False
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    if ok:
+                        latencies[path].append(elapsed)
+                    else:
+                        errors[path] += 1
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(options['concurrency'])]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.monotonic() - started
+
+        total = sum(len(v) for v in latencies.values())
+        self.stdout.write(f"{base_url} 同時 {options['concurrency']} / {elapsed:.1f}秒")
+        for path in paths:
+            values = latencies[path]
+            self.stdout.write(
+                f"  {path}: {len(values)}件 p50 {percentile(values, 50):.1f}ms p95 {percentile(values, 95):.1f}ms "
+                f"p99 {percentile(values, 99):.1f}ms エラー {errors[path]}件"
+            )
+        all_values = [v for values in latencies.values() for v in values]
+        self.stdout.write(self.style.SUCCESS(
+            f"合計 {total}件 {total / elapsed:.1f}件/秒 平均 {statistics.fmean(all_values) if all_values else 0:.1f}ms "
+            f"エラー {sum(errors.values())}件"
+        ))
+
+    def _create_session(self, user):
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return session.session_key
+
+    def _default_paths(self):
+        today = timezone.localdate()
+        start, end = today - datetime.timedelta(days=3), today + datetime.timedelta(days=3)
+        paths = [f'/orders/plans/feed/?start={start}&end={end}', '/orders/autocomplete/?term=現場']
+        order = Order.objects.order_by('-issue_no').only('issue_no').first()
+        if order:
+            paths.append(f'/orders/shipment/stats/?issue_no={order.issue_no}')
+        return paths
@@ -0,0 +1,37 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from orders.archive import (
+    DATED_MODELS, PARTITION_INTERVALS, convert_to_partitioned, create_partitions, is_partitioned, partition_periods,
+)
+
+
+class Command(BaseCommand):
+    help = '出荷・予定のテーブルを日付の範囲で分割する（PostgreSQL のみ。分割済みなら先の期間の区画を追加する）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', choices=PARTITION_INTERVALS, default='year', help='区画の単位（year: 年度 / month: 月）')
+        parser.add_argument('--ahead', type=int, default=400, help='今日から何日先までの区画を用意するか')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('PostgreSQL のみ対応しています（POSTGRES_HOST を設定して実行してください）')
+        last = timezone.localdate() + datetime.timedelta(days=options['ahead'])
+
+        for model, field in DATED_MODELS:
+            table = model._meta.db_table
+            with transaction.atomic(), connection.cursor() as cursor:
+                if is_partitioned(cursor, table):
+                    first = model.objects.aggregate(first=Min(field))['first'] or timezone.localdate()
+                    created = create_partitions(cursor, table, partition_periods(min(first, timezone.localdate()), last, options['interval']))
+                    self.stdout.write(f"{table}: 区画を追加 {', '.join(created) or 'なし'}")
+                    continue
+                first = model.objects.aggregate(first=Min(field))['first'] or timezone.localdate()
+                periods = partition_periods(min(first, timezone.localdate()), last, options['interval'])
+                self.stdout.write(f'{table}: {len(periods)}区画に分割しています（実行中はテーブルがロックされます）')
+                convert_to_partitioned(cursor, table, field, periods)
+            self.stdout.write(self.style.SUCCESS(f'{table}: 分割しました'))
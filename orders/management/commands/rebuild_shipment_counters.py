@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from orders.counters import rebuild_counters
+from orders.models import Order
+from orders.progress import mark_contracts_dirty
+
+
+class Command(BaseCommand):
+    help = '出荷テーブルから出荷カウンタ（日別・契約別）を作り直す'
+
+    def add_arguments(self, parser):
+        parser.add_argument('issue_no', nargs='*', help='対象の契約NO（省略時は全契約）')
+
+    def handle(self, *args, **options):
+        rebuild_counters(options['issue_no'] or None)
+        # 契約の進捗は出荷カウンタから作るため、次の参照時に作り直させる
+        mark_contracts_dirty(options['issue_no'] or Order.objects.values_list('pk', flat=True))
+        self.stdout.write(self.style.SUCCESS('出荷カウンタを再作成しました'))
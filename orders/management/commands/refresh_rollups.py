@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from orders.models import RollupDirtyDate, Shipment
+from orders.rollups import mark_dates_dirty, refresh_rollups
+
+
+class Command(BaseCommand):
+    help = '実績管理表の日別集計（DailyContractRollup）のうち再計算待ちの日付を作り直す'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='対象期間の開始日（YYYY-MM-DD）')
+        parser.add_argument('--end', help='対象期間の終了日（YYYY-MM-DD）')
+        parser.add_argument('--all', action='store_true', help='出荷のある全日付を再計算対象にしてから作り直す')
+
+    def handle(self, *args, **options):
+        start = parse_date(options['start']) if options['start'] else None
+        end = parse_date(options['end']) if options['end'] else None
+        if (options['start'] and not start) or (options['end'] and not end):
+            raise CommandError('日付は YYYY-MM-DD で指定してください')
+
+        if options['all']:
+            dates = Shipment.objects.values_list('ship_date', flat=True).distinct().order_by()
+            if start:
+                dates = dates.filter(ship_date__gte=start)
+            if end:
+                dates = dates.filter(ship_date__lte=end)
+            mark_dates_dirty(dates)
+
+        pending = RollupDirtyDate.objects.count()
+        refreshed = refresh_rollups(start, end)
+        self.stdout.write(self.style.SUCCESS(f'{refreshed}日分の日別集計を作り直しました（再計算待ち {pending}日）'))
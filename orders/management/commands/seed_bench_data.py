@@ -0,0 +1,189 @@
+import datetime
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from orders.imports import import_shipments
+from orders.models import IssueSequence, Order, OrderPlan, Staff, UnitPriceMaster
+from orders.progress import mark_contracts_dirty
+from orders.rollups import mark_dates_dirty, refresh_rollups
+from orders.stamps import ORDER_TABLE, PLAN_TABLE, touch_tables
+
+CUSTOMERS = [
+    '東都建設', '城南土木', '湾岸開発', '多摩建工', '武蔵野組', '隅田川工業', '荒川基礎', '江戸川興業',
+    '品川土建', '大田舗装', '世田谷建設', '練馬工務店', '板橋組', '北区開発', '足立建設', '葛飾土木',
+]
+TOWNS = ['中央', '港南', '新宿', '本町', '東雲', '有明', '豊洲', '大井', '平和島', '辰巳', '舟渡', '高島平']
+WORKS = ['共同住宅新築', '埋戻し', '下水道', '道路改良', '擁壁', '倉庫新築', '造成', '護岸']
+PRODUCTS = [('流動化処理土', 'A'), ('流動化処理土', 'B'), ('改良土', 'C')]
+# 1日の予定行数（ボードの EL 9行・他工場 5行）
+BOARD_ROWS = [('el', i) for i in range(1, 10)] + [('other', i) for i in range(1, 6)]
+# 計量所の車両番号
+CAR_NOS = [f'{n:03d}' for n in range(101, 161)]
+
+
+class Command(BaseCommand):
+    help = 'ベンチマーク用の受注・予定・出荷・単価マスタを生成する（SQLITE_PATH で別のデータベースを指定して使う）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--years', type=int, default=5, help='生成する期間（今日までの年数）')
+        parser.add_argument('--shipments', type=int, default=100_000, help='出荷件数の目安')
+        parser.add_argument('--per-order', type=int, default=100, help='1契約あたりの平均出荷件数')
+        parser.add_argument('--seed', type=int, default=0, help='乱数の種（同じ値なら同じデータになる）')
+        parser.add_argument('--user', default='bench', help='担当者・ベンチマークのログインに使うユーザー名（無ければ作成）')
+        parser.add_argument('--force', action='store_true', help='既存の受注があっても追加する')
+
+    def handle(self, *args, **options):
+        if Order.objects.exists() and not options['force']:
+            raise CommandError('受注データがあります。SQLITE_PATH で空のデータベースを指定するか --force を付けてください')
+        rng = random.Random(options['seed'])
+        today = timezone.localdate()
+        first_day = today - datetime.timedelta(days=365 * options['years'])
+        started = time.perf_counter()
+
+        staff = self._staff(options['user'])
+        prices = self._prices()
+        orders = self._orders(rng, staff, first_day, today, max(1, options['shipments'] // options['per_order']))
+        schedule = self._schedule(rng, orders, options['per_order'], today)
+        plans = self._plans(rng, schedule)
+        result = import_shipments(self._shipment_records(rng, schedule, today))
+        days = refresh_rollups()
+
+        self.stdout.write(
+            f'受注 {len(orders)}件 / 予定 {plans}件 / 出荷 {result.created}件 / 単価 {prices}件 / '
+            f'日別集計 {days}日 / {time.perf_counter() - started:.1f}秒'
+        )
+        if result.error_count:
+            raise CommandError(f'出荷の登録でエラーがありました: {result.errors[:3]}')
+        self.stdout.write(self.style.SUCCESS(f"ベンチマーク: python manage.py benchmark --user {options['user']}"))
+
+    def _staff(self, username):
+        user, _ = get_user_model().objects.get_or_create(username=username, defaults={'display_name': 'ベンチ担当'})
+        staff, _ = Staff.objects.get_or_create(user=user)
+        return staff
+
+    def _prices(self):
+        """単価マスタ（昼間・夜間 × 1〜6回転 × 実車・空積）。登録済みなら追加しない"""
+        if UnitPriceMaster.objects.exists():
+            return 0
+        rows = []
+        for night, label in ((False, '昼間'), (True, '夜間')):
+            for rotation in range(1, 7):
+                base = 60000 // rotation + (8000 if night else 0)
+                rows.append(UnitPriceMaster(category=label, item_name=f'{label} {rotation}回転', partition_price=base, standard_price=base + 5000))
+                rows.append(UnitPriceMaster(category='空積', item_name=f'{label} {rotation}回空積', partition_price=base // 2, standard_price=base // 2 + 2000))
+        UnitPriceMaster.objects.bulk_create(rows)
+        return len(rows)
+
+    def _orders(self, rng, staff, first_day, today, count):
+        """契約日の順に契約NO（西暦下2桁 + 年内連番 + 枝番0）を振る"""
+        span = max(1, (today - first_day).days - 30)
+        issue_dates = sorted(first_day + datetime.timedelta(days=rng.randrange(span)) for _ in range(count))
+        seqs = {}
+        orders = []
+        for issue_date in issue_dates:
+            yy = f'{issue_date.year % 100:02d}'
+            if yy not in seqs:
+                seqs[yy] = max(Order._last_year_seq(yy), IssueSequence.peek(f'year:{yy}', lambda: 0) - 1)
+            seqs[yy] += 1
+            if seqs[yy] > 9999:
+                raise CommandError(f'20{yy}年の契約NOが足りません（--per-order を増やしてください）')
+            product, category = rng.choice(PRODUCTS)
+            orders.append(Order(
+                issue_no=f'{yy}{seqs[yy]:04d}0',
+                issue_date=issue_date,
+                site=f'{rng.choice(TOWNS)}{rng.randint(1, 9)}丁目{rng.choice(WORKS)}工事',
+                site_address=f'東京都{rng.choice(TOWNS)}{rng.randint(1, 9)}-{rng.randint(1, 30)}',
+                customer=rng.choice(CUSTOMERS),
+                contractor=rng.choice(CUSTOMERS),
+                coordinator=staff,
+                contact=f'03-{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}',
+                product=product,
+                product_category=category,
+                firstship_date=issue_date + datetime.timedelta(days=rng.randint(7, 30)),
+                qty=0,
+                rotation=rng.randint(1, 4),
+                price=rng.choice([9800, 10500, 11200, 12000]),
+                night=rng.random() < 0.2,
+            ))
+        with transaction.atomic():
+            Order.objects.bulk_create(orders, batch_size=1000)
+            # bulk_create ではシグナルが動かないため、進捗の再計算待ちにする
+            mark_contracts_dirty(o.issue_no for o in orders)
+            # 以降に画面から登録する受注が生成した契約NOと重ならないよう、採番カウンタを進めておく
+            for yy, seq in seqs.items():
+                IssueSequence.objects.update_or_create(key=f'year:{yy}', defaults={'last_value': seq})
+            touch_tables(ORDER_TABLE)
+        return orders
+
+    def _schedule(self, rng, orders, per_order, today):
+        """
+        契約ごとの出荷日程: [(受注, 日付, 台数, 出荷件数), ...]
+        初回出荷日から日曜を除いて毎日出荷し、今日より後の日付は予定のみ（出荷件数は0）
+        """
+        schedule = []
+        for order in orders:
+            remaining = max(1, int(rng.gauss(per_order, per_order / 3)))
+            trucks = rng.randint(1, 4)
+            day = order.firstship_date
+            total = 0
+            while remaining > 0:
+                if day.weekday() != 6:
+                    count = min(remaining, max(1, trucks * order.rotation - rng.choice([0, 0, 0, 1, 2])))
+                    schedule.append((order, day, trucks, count if day <= today else 0))
+                    remaining -= count
+                    total += count
+                day += datetime.timedelta(days=1)
+            # 契約数量は出荷予定量の前後（一部の契約は予定が契約数量を超える）
+            order.qty = round(total * 6 * rng.uniform(0.9, 1.3))
+        Order.objects.bulk_update(orders, ['qty'], batch_size=1000)
+        return schedule
+
+    def _plans(self, rng, schedule):
+        """出荷日程をボードの予定行に割り当てる（1日の行数を超える分は登録しない）"""
+        used = {}
+        plans = []
+        for order, day, trucks, count in schedule:
+            slot = used.get(day, 0)
+            if slot >= len(BOARD_ROWS):
+                continue
+            used[day] = slot + 1
+            section, row_index = BOARD_ROWS[slot]
+            plans.append(OrderPlan(
+                order=order,
+                plan_date=day,
+                section=section,
+                row_index=row_index,
+                site_name=order.site,
+                start_time=rng.choice(['8:00', '8:30', '9:00', '13:00']) if not order.night else '20:00',
+                plan_qty=trucks * order.rotation * 6,
+                truck_count=trucks,
+            ))
+        with transaction.atomic():
+            OrderPlan.objects.bulk_create(plans, batch_size=1000)
+            mark_dates_dirty(used)
+            touch_tables(PLAN_TABLE)
+        return len(plans)
+
+    def _shipment_records(self, rng, schedule, today):
+        """取込形式の出荷レコード（出荷日・時刻の順）"""
+        records = []
+        for order, day, trucks, count in schedule:
+            if not count:
+                continue
+            start = 20 * 60 if order.night else 8 * 60
+            for i in range(count):
+                minutes = start + i * rng.randint(15, 40) // max(1, trucks)
+                records.append({
+                    'issue_no': order.issue_no,
+                    'ship_date': day.isoformat(),
+                    'ship_time': f'{minutes // 60 % 24:02d}:{minutes % 60:02d}',
+                    'ship_qty': 6.0 if rng.random() > 0.05 else round(rng.uniform(3, 5.5), 1),
+                    'car_no': rng.choice(CAR_NOS),
+                })
+        records.sort(key=lambda r: (r['ship_date'], r['ship_time']))
+        return enumerate(records, start=1)
@@ -0,0 +1,44 @@
+import os
+import shutil
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+ASGI_APPLICATION = 'config.asgi:application'
+
+
+class Command(BaseCommand):
+    help = 'settings.APP_SERVER のアプリケーションサーバーで起動する（gunicorn: 本番 / uvicorn: 開発）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', default=os.environ.get('WEB_BIND', '0.0.0.0:8000'), help='待ち受けアドレス')
+        parser.add_argument('--no-collectstatic', action='store_true', help='起動前の collectstatic を行わない')
+        parser.add_argument('--no-migrate', action='store_true', help='起動前の migrate を行わない')
+
+    def handle(self, *args, **options):
+        server = settings.APP_SERVER
+        if server not in ('gunicorn', 'uvicorn'):
+            raise CommandError(f'APP_SERVER は gunicorn か uvicorn を指定してください（現在: {server}）')
+
+        if not options['no_migrate']:
+            call_command('migrate', interactive=False, verbosity=1)
+        if not settings.DEBUG and not options['no_collectstatic']:
+            call_command('collectstatic', interactive=False, verbosity=0)
+
+        if server == 'gunicorn':
+            argv = ['gunicorn', '--config', str(settings.BASE_DIR / 'gunicorn.conf.py'), '--bind', options['bind'], ASGI_APPLICATION]
+        else:
+            host, _, port = options['bind'].rpartition(':')
+            argv = ['uvicorn', ASGI_APPLICATION, '--host', host or '0.0.0.0', '--port', port or '8000']
+            if settings.DEBUG:
+                argv.append('--reload')
+
+        executable = shutil.which(argv[0])
+        if executable is None:
+            raise CommandError(f'{argv[0]} がインストールされていません（pip install -r requirements.txt）')
+        self.stdout.write(f"起動: {' '.join(argv)}")
+        self.stdout.flush()
+        # シグナル（停止・再起動）がサーバーに直接届くよう、このプロセスを置き換える
+        os.chdir(settings.BASE_DIR)
+        os.execv(executable, argv)
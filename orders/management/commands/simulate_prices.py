@@ -0,0 +1,103 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from orders.pricing import get_price_table, parse_item_name
+
+# 単価ファイルの列名（単価マスタの管理画面・Excel から書き出した見出しのどちらでもよい）
+ITEM_COLUMNS = ('item_name', '項目名')
+PRICE_COLUMNS = ('partition_price', '仕切り価格')
+
+
+class Command(BaseCommand):
+    help = '単価マスタを変えた場合の売上（実績管理表の金額）を過去の実績で試算し、現行の単価との差を表示する'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help='候補の単価（CSV: 項目名・仕切り価格の列。載っていない項目は現行の単価）')
+        parser.add_argument('--set', action='append', default=[], metavar='項目名=単価', help='単価を1項目ずつ変更（例: "夜間 3回転=25000"。複数指定可）')
+        parser.add_argument('--scale', type=float, help='全項目の単価に掛ける倍率（例: 1.05。--file・--set の後に適用）')
+        parser.add_argument('--start', help='対象期間の開始日（YYYY-MM-DD。省略時は昨日までの12か月）')
+        parser.add_argument('--end', help='対象期間の終了日（YYYY-MM-DD）')
+        parser.add_argument('--top', type=int, default=20, help='表示する得意先の数（差の大きい順）')
+
+    def handle(self, *args, **options):
+        try:
+            from orders.simulation import last_twelve_months, simulate_prices
+        except ImportError:
+            raise CommandError('単価の試算には numpy が必要です（pip install -r requirements.txt）')
+
+        start, end = last_twelve_months(timezone.localdate())
+        if options['start']:
+            start = parse_date(options['start'])
+        if options['end']:
+            end = parse_date(options['end'])
+        if not start or not end:
+            raise CommandError('日付は YYYY-MM-DD で指定してください')
+
+        current = get_price_table()
+        candidate = dict(current)
+        if options['file']:
+            candidate.update(self._read_prices(options['file']))
+        for text in options['set']:
+            item_name, sep, price = text.partition('=')
+            key = parse_item_name(item_name)
+            if not sep or key is None or not price.strip().isdigit():
+                raise CommandError(f'--set は "昼間 2回転=30000" の形式で指定してください: {text}')
+            candidate[key] = int(price)
+        if options['scale']:
+            candidate = {key: round(price * options['scale']) for key, price in candidate.items()}
+        if candidate == current:
+            self.stdout.write(self.style.WARNING('候補の単価が現行と同じです（--file / --set / --scale で指定）'))
+
+        for key in sorted(set(current) | set(candidate)):
+            if current.get(key) != candidate.get(key):
+                night, rotation, empty = key
+                self.stdout.write(
+                    f"  {'夜間' if night else '昼間'} {rotation}回{'空積' if empty else '転'}: "
+                    f'{current.get(key, 0):,}円 → {candidate.get(key, 0):,}円'
+                )
+
+        started = time.perf_counter()
+        result = simulate_prices(candidate, start, end, prices=current)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f"\n{start}〜{end}（契約・日 {result['days']:,}件 / {elapsed:.2f}秒）")
+        self._line('合計', result['current'], result['candidate'])
+        self.stdout.write('\n月別')
+        for month, before, after in result['months']:
+            self._line(month, before, after)
+        self.stdout.write(f"\n得意先別（差の大きい順 {options['top']}件）")
+        for customer, before, after in result['customers'][:options['top']]:
+            self._line(customer or '（得意先なし）', before, after)
+
+    def _line(self, label, before, after):
+        delta = after - before
+        rate = f'{delta / before:+.1%}' if before else '-'
+        self.stdout.write(f'  {label:<16} {before:>15,.0f}円 → {after:>15,.0f}円  差 {delta:>+14,.0f}円 ({rate})')
+
+    def _read_prices(self, path):
+        """CSV の単価を {(夜間か, 回転数, 空積か): 単価} にする（書式外の項目名はエラーにする）"""
+        prices = {}
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as f:
+                reader = csv.DictReader(f)
+                fields = reader.fieldnames or []
+                item_col = next((c for c in ITEM_COLUMNS if c in fields), None)
+                price_col = next((c for c in PRICE_COLUMNS if c in fields), None)
+                if not item_col or not price_col:
+                    raise CommandError(f'{path}: 見出しに 項目名（item_name）・仕切り価格（partition_price）の列が必要です')
+                for line_no, row in enumerate(reader, start=2):
+                    key = parse_item_name(row[item_col])
+                    try:
+                        price = int(str(row[price_col]).replace(',', '').strip())
+                    except ValueError:
+                        raise CommandError(f'{path} {line_no}行目: 単価が数値ではありません: {row[price_col]}')
+                    if key is None:
+                        raise CommandError(f'{path} {line_no}行目: 項目名の書式が違います（例: 昼間 2回転 / 夜間 1回空積）: {row[item_col]}')
+                    prices[key] = price
+        except OSError as e:
+            raise CommandError(str(e))
+        return prices
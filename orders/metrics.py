@@ -0,0 +1,124 @@
+import logging
+import os
+import time
+from contextvars import ContextVar
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+
+logger = logging.getLogger('orders.slow_requests')
+
+# 計測中のリクエスト。SQL は全接続に登録した execute_wrapper で数え、どのリクエストの SQL かはこれで判別する
+# （非同期ビューから sync_to_async で実行される ORM にもコンテキストが引き継がれる）
+_current = ContextVar('orders_request_stats', default=None)
+
+# 遅いリクエストのログに残す SQL の上限（実行時間の長い順）
+SLOW_LOG_QUERIES = 10
+# 1リクエストで記録する SQL の上限（大量の SQL を発行するリクエストでメモリを使いすぎないため）
+MAX_RECORDED_QUERIES = 500
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+
+class RequestStats:
+    """1リクエスト分の SQL の件数・時間"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.db_seconds = 0.0
+        self.queries = []
+
+    def add_query(self, sql, seconds):
+        self.query_count += 1
+        self.db_seconds += seconds
+        if len(self.queries) < MAX_RECORDED_QUERIES:
+            self.queries.append((seconds, sql))
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def start_request():
+    """計測を始める（戻り値は finish_request に渡す）"""
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def finish_request(token):
+    _current.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    """execute_wrapper: 計測中のリクエストがあれば SQL の件数・時間を加算する"""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(sql, time.perf_counter() - started)
+
+
+def install(connection):
+    """DB接続に SQL の計測を登録する（接続ごとに1回）"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+# 集計は prometheus_client で行う
+# gunicorn の複数ワーカーでは PROMETHEUS_MULTIPROC_DIR（gunicorn.conf.py で設定）に各ワーカーが値を書き、
+# 取得時に全ワーカーの値を合算する（応答したワーカーによって値が戻ることがない）
+LABELS = ('view', 'method')
+_duration = Histogram('orders_request_duration_seconds', '応答時間（秒）', LABELS, buckets=DURATION_BUCKETS)
+_db_time = Histogram('orders_request_db_seconds', 'SQLの実行時間の合計（秒）', LABELS, buckets=DURATION_BUCKETS)
+_queries = Histogram('orders_request_queries', 'SQLの件数', LABELS, buckets=QUERY_BUCKETS)
+_size = Histogram('orders_response_bytes', '応答サイズ（バイト。ストリーミング応答は除く）', LABELS, buckets=SIZE_BUCKETS)
+_requests = Counter('orders_requests', 'リクエスト数', LABELS + ('status',))
+
+
+def observe(view, method, status, stats, elapsed, size):
+    """1リクエストの結果を集計に加える（size はストリーミング応答では None）"""
+    _duration.labels(view, method).observe(elapsed)
+    _db_time.labels(view, method).observe(stats.db_seconds)
+    _queries.labels(view, method).observe(stats.query_count)
+    if size is not None:
+        _size.labels(view, method).observe(size)
+    _requests.labels(view, method, str(status)).inc()
+
+
+def render():
+    """Prometheus のテキスト形式で全系列を出力する（複数プロセスの場合は全ワーカーの合計）"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry).decode()
+
+
+def server_timing(stats, elapsed):
+    """Server-Timing ヘッダの値（ブラウザの開発者ツールで内訳を確認できる）"""
+    return (
+        f'db;dur={stats.db_seconds * 1000:.1f};desc="SQL {stats.query_count}", '
+        f'app;dur={max(0.0, elapsed - stats.db_seconds) * 1000:.1f}, '
+        f'total;dur={elapsed * 1000:.1f}'
+    )
+
+
+def log_slow_request(request, view, status, stats, elapsed):
+    """遅いリクエストを、実行時間の長い SQL とともにログに残す"""
+    slowest = sorted(stats.queries, key=lambda q: q[0], reverse=True)[:SLOW_LOG_QUERIES]
+    repeated = {}
+    for _, sql in stats.queries:
+        repeated[sql] = repeated.get(sql, 0) + 1
+    lines = [
+        f'遅いリクエスト {request.method} {request.get_full_path()} ({view}) {status}: '
+        f'{elapsed * 1000:.0f}ms / SQL {stats.query_count}件 {stats.db_seconds * 1000:.0f}ms'
+    ]
+    for seconds, sql in slowest:
+        count = repeated[sql]
+        lines.append(f'  {seconds * 1000:8.1f}ms{f" (同じSQL {count}回)" if count > 1 else ""} {sql}')
+    logger.warning('\n'.join(lines))
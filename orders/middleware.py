@@ -1,14 +1,166 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import metrics
 from .models import SystemConfig
 
+DEFAULT_TIMEOUT_MINUTES = 30
+# 設定値を読み直す間隔（秒）。他のプロセス・ワーカーでの設定変更はこの時間内に反映される
+CONFIG_TTL_SECONDS = 30
+# 有効期限を最後に書き込んだ時刻（セッション内に保持）
+SESSION_REFRESHED_KEY = '_timeout_refreshed_at'
+# 有効期限のうちこの割合が経過したら延長を書き込む（毎リクエストのセッション保存を避ける）
+REFRESH_RATIO = 0.1
+
+_timeout_minutes = None
+_loaded_at = 0.0
+
+
+def _config_expired():
+    return _timeout_minutes is None or time.monotonic() - _loaded_at > CONFIG_TTL_SECONDS
+
+
+def _set_timeout(config):
+    global _timeout_minutes, _loaded_at
+    _timeout_minutes = config.session_timeout_minutes if config else DEFAULT_TIMEOUT_MINUTES
+    _loaded_at = time.monotonic()
+    return _timeout_minutes
+
+
+def get_session_timeout_minutes():
+    """タイムアウト時間（分）。DBは CONFIG_TTL_SECONDS ごとに1回だけ参照し、その間は使い回す"""
+    if _config_expired():
+        return _set_timeout(SystemConfig.objects.first())
+    return _timeout_minutes
+
+
+async def aget_session_timeout_minutes():
+    """get_session_timeout_minutes の非同期版（非同期で動くミドルウェア用）"""
+    if _config_expired():
+        return _set_timeout(await SystemConfig.objects.afirst())
+    return _timeout_minutes
+
+
+def _needs_refresh(expiry, refreshed_at, timeout):
+    # 設定が変わったとき、または前回の延長から一定時間経ったときだけ有効期限を更新する
+    return expiry != timeout or time.time() - refreshed_at > timeout * REFRESH_RATIO
+
+
+def invalidate_system_config():
+    """システム設定の保存時に呼び出し、このプロセスでは次回参照時に読み直させる"""
+    global _timeout_minutes
+    _timeout_minutes = None
+
+
 class DynamicSessionTimeoutMiddleware:
+    # ASGI では非同期のまま処理し、非同期ビューの前後でスレッドを切り替えない
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
         if request.user.is_authenticated:
-            # DBから設定値を取得（なければデフォルト30分）
-            config = SystemConfig.objects.first()
-            timeout = config.session_timeout_minutes if config else 30
-            # セッションの有効期限を更新
-            request.session.set_expiry(timeout * 60)
-        return self.get_response(request)
\ No newline at end of file
+            # 設定値はプロセス内キャッシュから取得（なければデフォルト30分）
+            timeout = get_session_timeout_minutes() * 60
+            session = request.session
+            if _needs_refresh(session.get('_session_expiry'), session.get(SESSION_REFRESHED_KEY, 0), timeout):
+                session.set_expiry(timeout)
+                session[SESSION_REFRESHED_KEY] = int(time.time())
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        user = await request.auser()
+        if user.is_authenticated:
+            timeout = await aget_session_timeout_minutes() * 60
+            session = request.session
+            expiry = await session.aget('_session_expiry')
+            if _needs_refresh(expiry, await session.aget(SESSION_REFRESHED_KEY, 0), timeout):
+                await session.aset_expiry(timeout)
+                await session.aset(SESSION_REFRESHED_KEY, int(time.time()))
+        return await self.get_response(request)
+
+
+# 集計のラベルに使う HTTP メソッド（それ以外は other にまとめる）
+METRICS_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+class RequestMetricsMiddleware:
+    """
+    URL名ごとに応答時間・SQL件数・DB時間・応答サイズを集計する（/orders/metrics/ で参照）
+    応答には Server-Timing ヘッダを付け、SLOW_REQUEST_MS を超えたリクエストは SQL とともにログに残す
+    ストリーミング応答は応答開始までの値になる
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token = metrics.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        return self._record(request, response, stats)
+
+    async def __acall__(self, request):
+        stats, token = metrics.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        return self._record(request, response, stats)
+
+    def _record(self, request, response, stats):
+        elapsed = stats.elapsed()
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        method = request.method if request.method in METRICS_METHODS else 'other'
+        size = None if response.streaming else len(response.content)
+        metrics.observe(view, method, response.status_code, stats, elapsed, size)
+        if settings.METRICS_SERVER_TIMING:
+            response['Server-Timing'] = metrics.server_timing(stats, elapsed)
+        if settings.SLOW_REQUEST_MS and elapsed * 1000 >= settings.SLOW_REQUEST_MS:
+            metrics.log_slow_request(request, view, response.status_code, stats, elapsed)
+        return response
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise の静的ファイル配信を非同期にも対応させたもの
+    （WhiteNoise 本体は同期のみのため、そのまま使うと ASGI で後続の処理がすべて同期に切り替わる）
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
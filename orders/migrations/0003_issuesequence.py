@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_orderplan_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IssueSequence',
+            fields=[
+                ('key', models.CharField(max_length=20, primary_key=True, serialize=False, verbose_name='採番キー')),
+                ('last_value', models.IntegerField(default=0, verbose_name='最終値')),
+            ],
+            options={
+                'verbose_name': '採番カウンタ',
+            },
+        ),
+    ]
@@ -0,0 +1,73 @@
+from django.db import migrations
+
+# 受注検索（オートコンプリート）用の索引
+# PostgreSQL: pg_trgm の GIN 索引 / SQLite: FTS5（trigram）の全文検索テーブル＋同期トリガー
+
+POSTGRESQL_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS orders_order_site_trgm ON orders_order USING gin (site gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS orders_order_issue_no_trgm ON orders_order USING gin (issue_no gin_trgm_ops)",
+]
+POSTGRESQL_REVERSE = [
+    "DROP INDEX IF EXISTS orders_order_issue_no_trgm",
+    "DROP INDEX IF EXISTS orders_order_site_trgm",
+]
+
+# 外部コンテンツ方式（本文は受注テーブルから読み、索引だけを持つ）。受注の rowid で索引の行を特定するため、
+# 削除・更新時にFTSテーブル全体を走査しない
+# 受注テーブルの rowid が変わる操作（VACUUM・テーブルの作り直し）に備え、migrate のたびに
+# トリガーと索引を作り直す（orders.search.sync_sqlite_search_index。post_migrate で実行）
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS orders_order_search USING fts5(
+        issue_no, site, content='orders_order', content_rowid='rowid', tokenize='trigram'
+    )
+    """,
+    "INSERT INTO orders_order_search (orders_order_search) VALUES ('rebuild')",
+    """
+    CREATE TRIGGER IF NOT EXISTS orders_order_search_ai AFTER INSERT ON orders_order BEGIN
+        INSERT INTO orders_order_search (rowid, issue_no, site) VALUES (new.rowid, new.issue_no, new.site);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS orders_order_search_ad AFTER DELETE ON orders_order BEGIN
+        INSERT INTO orders_order_search (orders_order_search, rowid, issue_no, site)
+        VALUES ('delete', old.rowid, old.issue_no, old.site);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS orders_order_search_au AFTER UPDATE OF issue_no, site ON orders_order
+    WHEN old.issue_no IS NOT new.issue_no OR old.site IS NOT new.site BEGIN
+        INSERT INTO orders_order_search (orders_order_search, rowid, issue_no, site)
+        VALUES ('delete', old.rowid, old.issue_no, old.site);
+        INSERT INTO orders_order_search (rowid, issue_no, site) VALUES (new.rowid, new.issue_no, new.site);
+    END
+    """,
+]
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS orders_order_search_au",
+    "DROP TRIGGER IF EXISTS orders_order_search_ad",
+    "DROP TRIGGER IF EXISTS orders_order_search_ai",
+    "DROP TABLE IF EXISTS orders_order_search",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for sql in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_issuesequence'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'postgresql': POSTGRESQL_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            _run({'postgresql': POSTGRESQL_REVERSE, 'sqlite': SQLITE_REVERSE}),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.1 on 2026-10-18 19:47
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery, Sum
+
+
+def build_counters(apps, schema_editor):
+    """
+    既存の出荷実績からカウンタを作成
+    orders.counters.rebuild_counters と同じ集計を、この時点のモデルで行う（以降の変更の影響を受けないよう複製）
+    """
+    Shipment = apps.get_model('orders', 'Shipment')
+    ShipmentDailyCounter = apps.get_model('orders', 'ShipmentDailyCounter')
+    ShipmentContractCounter = apps.get_model('orders', 'ShipmentContractCounter')
+
+    last_car_no = Subquery(
+        Shipment.objects.filter(issue_no=OuterRef('issue_no'), ship_date=OuterRef('ship_date'))
+        .order_by('-id').values('car_no')[:1]
+    )
+    daily = (
+        Shipment.objects.values('issue_no', 'ship_date')
+        .annotate(unit_count=Count('id'), qty_sum=Sum('ship_qty'), last_shipment_id=Max('id'), last_car_no=last_car_no)
+        .order_by()
+    )
+    ShipmentDailyCounter.objects.bulk_create([
+        ShipmentDailyCounter(
+            issue_no=d['issue_no'],
+            ship_date=d['ship_date'],
+            unit_count=d['unit_count'],
+            qty_sum=d['qty_sum'] or 0,
+            last_car_no=d['last_car_no'] or '',
+            last_shipment_id=d['last_shipment_id'],
+        )
+        for d in daily.iterator()
+    ], batch_size=1000)
+    ShipmentContractCounter.objects.bulk_create([
+        ShipmentContractCounter(
+            issue_no=c['issue_no'],
+            unit_count=c['unit_count'],
+            qty_sum=c['qty_sum'] or 0,
+            last_ship_date=c['last_ship_date'],
+        )
+        for c in ShipmentDailyCounter.objects.values('issue_no')
+        .annotate(unit_count=Sum('unit_count'), qty_sum=Sum('qty_sum'), last_ship_date=Max('ship_date'))
+        .order_by()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_order_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShipmentContractCounter',
+            fields=[
+                ('issue_no', models.CharField(max_length=10, primary_key=True, serialize=False, verbose_name='契約NO')),
+                ('unit_count', models.IntegerField(default=0, verbose_name='台数')),
+                ('qty_sum', models.FloatField(default=0, verbose_name='出荷量合計')),
+                ('last_ship_date', models.DateField(blank=True, null=True, verbose_name='最終出荷日')),
+            ],
+            options={
+                'verbose_name': '出荷カウンタ（契約別）',
+            },
+        ),
+        migrations.CreateModel(
+            name='ShipmentDailyCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('issue_no', models.CharField(max_length=10, verbose_name='契約NO')),
+                ('ship_date', models.DateField(verbose_name='出荷日')),
+                ('unit_count', models.IntegerField(default=0, verbose_name='台数')),
+                ('qty_sum', models.FloatField(default=0, verbose_name='出荷量合計')),
+                ('last_car_no', models.CharField(blank=True, default='', max_length=3, verbose_name='最終車両番号')),
+                ('last_shipment_id', models.BigIntegerField(default=0, verbose_name='最終出荷ID')),
+            ],
+            options={
+                'verbose_name': '出荷カウンタ（日別）',
+                'unique_together': {('issue_no', 'ship_date')},
+            },
+        ),
+        migrations.RunPython(build_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.1 on 2026-10-18 19:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# 稼働中のテーブルに対して実行できるよう、PostgreSQL では書き込みを止めない方法で作成する
+# （索引は CREATE INDEX CONCURRENTLY、外部キーは NOT VALID で追加してから VALIDATE）
+# CONCURRENTLY はトランザクション内で実行できないため、このマイグレーションは atomic = False
+
+
+class AddForeignKeyOnline(migrations.AddField):
+    """AddField と同じ。PostgreSQL では列・索引・制約を分けて、テーブルを長時間ロックせずに追加する"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        field = model._meta.get_field(self.name)
+        # 列だけを追加（NULL 可・既定値なしのためテーブルは書き換えない）
+        field.db_index, field.db_constraint = False, False
+        try:
+            schema_editor.add_field(model, field)
+        finally:
+            field.db_index, field.db_constraint = True, True
+        # 索引と制約の名前は通常の AddField と同じになる
+        schema_editor.execute(schema_editor._create_index_sql(model, fields=[field], concurrently=True))
+        fk = schema_editor._create_fk_sql(model, field, '_fk_%(to_table)s_%(to_column)s')
+        schema_editor.execute(f'{fk} NOT VALID')
+        qn = schema_editor.quote_name
+        schema_editor.execute(
+            f"ALTER TABLE {qn(model._meta.db_table)} VALIDATE CONSTRAINT {qn(str(fk.parts['name']))}"
+        )
+
+
+class AddIndexOnline(migrations.AddIndex):
+    """AddIndex と同じ。PostgreSQL では CREATE INDEX CONCURRENTLY で作成する"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_index(model, self.index, concurrently=True)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, concurrently=True)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('orders', '0005_shipment_counters'),
+    ]
+
+    operations = [
+        AddForeignKeyOnline(
+            model_name='shipment',
+            name='order',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='shipments', to='orders.order', verbose_name='受注'),
+        ),
+        AddIndexOnline(
+            model_name='orderplan',
+            index=models.Index(fields=['order', 'plan_date'], name='orderplan_order_date_idx'),
+        ),
+        AddIndexOnline(
+            model_name='shipment',
+            index=models.Index(fields=['issue_no', 'ship_date', 'id'], name='shipment_issue_date_id_idx'),
+        ),
+        AddIndexOnline(
+            model_name='shipment',
+            index=models.Index(fields=['ship_date'], name='shipment_ship_date_idx'),
+        ),
+    ]
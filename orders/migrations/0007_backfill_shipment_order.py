@@ -0,0 +1,32 @@
+from django.db import migrations, transaction
+from django.db.models import F, Max
+
+# 1回のUPDATEで処理する出荷IDの範囲（ロック時間を短く保つ）
+BATCH_SIZE = 5000
+
+
+def backfill_order(apps, schema_editor):
+    """既存の出荷実績に受注への参照を設定（ID範囲ごとにコミットし、稼働中でも長時間ロックしない）"""
+    Shipment = apps.get_model('orders', 'Shipment')
+    Order = apps.get_model('orders', 'Order')
+    max_id = Shipment.objects.aggregate(Max('id'))['id__max'] or 0
+    for lower in range(0, max_id, BATCH_SIZE):
+        with transaction.atomic():
+            Shipment.objects.filter(
+                id__gt=lower,
+                id__lte=lower + BATCH_SIZE,
+                order__isnull=True,
+                issue_no__in=Order.objects.values('issue_no'),
+            ).update(order_id=F('issue_no'))
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('orders', '0006_shipment_order_fk_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_order, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,101 @@
+import hashlib
+import json
+
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+from django.db.models import Max
+
+# 1回に処理する出荷IDの範囲
+BATCH_SIZE = 5000
+
+# OrderSnapshot.FIELDS と同じ並び（内容ハッシュの計算に使う）
+SNAPSHOT_FIELDS = [
+    'site', 'site_address', 'customer', 'contractor', 'coordinator', 'contact',
+    'product', 'product_category', 'note', 'specialnote',
+    'rotation', 'price', 'material_soil', 'water', 'cementBB', 'recycle_sand', 'admixture', 'material_soil_wm',
+    'test', 'night', 'outside23', 'material_delivery',
+]
+
+
+def make_digest(issue_no, values):
+    payload = json.dumps([issue_no] + [values.get(f) for f in SNAPSHOT_FIELDS], ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def collapse_snapshots(apps, schema_editor):
+    """既存の出荷実績のコピー項目を、内容ごとに1行の OrderSnapshot にまとめる（ID範囲ごとにコミット）"""
+    Shipment = apps.get_model('orders', 'Shipment')
+    OrderSnapshot = apps.get_model('orders', 'OrderSnapshot')
+    digests = dict(OrderSnapshot.objects.values_list('digest', 'id'))
+    max_id = Shipment.objects.aggregate(Max('id'))['id__max'] or 0
+    for lower in range(0, max_id, BATCH_SIZE):
+        with transaction.atomic():
+            rows = list(
+                Shipment.objects.filter(id__gt=lower, id__lte=lower + BATCH_SIZE, snapshot__isnull=True)
+                .values('id', 'issue_no', *SNAPSHOT_FIELDS)
+            )
+            new = {}
+            for row in rows:
+                row['digest'] = make_digest(row['issue_no'], row)
+                if row['digest'] not in digests and row['digest'] not in new:
+                    new[row['digest']] = OrderSnapshot(
+                        digest=row['digest'], issue_no=row['issue_no'], **{f: row[f] for f in SNAPSHOT_FIELDS}
+                    )
+            if new:
+                OrderSnapshot.objects.bulk_create(new.values())
+                digests.update(OrderSnapshot.objects.filter(digest__in=new).values_list('digest', 'id'))
+            Shipment.objects.bulk_update(
+                [Shipment(id=row['id'], snapshot_id=digests[row['digest']]) for row in rows],
+                ['snapshot'],
+                batch_size=500,
+            )
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('orders', '0007_backfill_shipment_order'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True, verbose_name='内容ハッシュ')),
+                ('issue_no', models.CharField(default='', max_length=10, verbose_name='契約NO')),
+                ('site', models.CharField(default='', max_length=100, verbose_name='現場名')),
+                ('site_address', models.CharField(blank=True, default='', max_length=200, verbose_name='現場住所')),
+                ('customer', models.CharField(default='', max_length=100, verbose_name='得意先')),
+                ('contractor', models.CharField(blank=True, default='', max_length=100, verbose_name='施工者名')),
+                ('coordinator', models.CharField(blank=True, default='', max_length=50, verbose_name='担当者名')),
+                ('contact', models.CharField(blank=True, default='', max_length=50, verbose_name='連絡先')),
+                ('product', models.CharField(default='', max_length=100, verbose_name='商品名')),
+                ('product_category', models.CharField(blank=True, default='', max_length=100, verbose_name='標準/規格')),
+                ('note', models.TextField(blank=True, default='', verbose_name='備考')),
+                ('specialnote', models.TextField(blank=True, default='', verbose_name='特記事項')),
+                ('rotation', models.FloatField(blank=True, default=0, null=True, verbose_name='予定回転数')),
+                ('price', models.IntegerField(blank=True, default=0, null=True, verbose_name='販売単価')),
+                ('material_soil', models.FloatField(blank=True, default=0, null=True, verbose_name='原料土')),
+                ('water', models.FloatField(blank=True, default=0, null=True, verbose_name='水')),
+                ('cementBB', models.FloatField(blank=True, default=0, null=True, verbose_name='セメントBB')),
+                ('recycle_sand', models.FloatField(blank=True, default=0, null=True, verbose_name='再生砂')),
+                ('admixture', models.FloatField(blank=True, default=0, null=True, verbose_name='混和剤')),
+                ('material_soil_wm', models.FloatField(blank=True, default=0, null=True, verbose_name='原料土wm')),
+                ('test', models.BooleanField(default=False, verbose_name='現場試験')),
+                ('night', models.BooleanField(default=False, verbose_name='夜間')),
+                ('outside23', models.BooleanField(default=False, verbose_name='23区外')),
+                ('material_delivery', models.BooleanField(default=False, verbose_name='材料渡し')),
+            ],
+            options={
+                'verbose_name': '受注内容スナップショット',
+            },
+        ),
+        migrations.AddField(
+            model_name='shipment',
+            name='snapshot',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='shipments', to='orders.ordersnapshot', verbose_name='受注内容'),
+        ),
+        migrations.RunPython(collapse_snapshots, migrations.RunPython.noop),
+    ]
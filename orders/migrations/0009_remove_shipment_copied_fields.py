@@ -0,0 +1,99 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_ordersnapshot'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='shipment',
+            name='admixture',
+        ),
+        migrations.RemoveField(
+            model_name='shipment',
+            name='cementBB',
+        ),
+        migrations.RemoveField(
+            model_name='shipment',
+            name='contact',
+        ),
+        migrations.RemoveField(
+            model_name='shipment',
+            name='contractor',
+        ),
+        migrations.RemoveField(
+            model_name='shipment',
+            name='coordinator',
+        ),
+        migrations.RemoveField(
+            model_name='shipment',
+            name='customer',
+        ),
+        migrations.RemoveField(
+            model_name='shipment',
+            name='material_delivery',
+        ),
+        migrations.RemoveField(
+            model_name='shipment',
+            name='material_soil',
+        ),
+        migrations.RemoveField(
+            model_name='shipment',
+            name='material_soil_wm',
+        ),
+        migrations.RemoveField(
+            model_name='shipment',
+            name='night',
+        ),
+        migrations.RemoveField(
+            model_name='shipment',
+            name='note',
+        ),
+        migrations.RemoveField(
+            model_name='shipment',
+            name='outside23',
+        ),
+        migrations.RemoveField(
+            model_name='shipment',
+            name='price',
+        ),
+        migrations.RemoveField(
+            model_name='shipment',
+            name='product',
+        ),
+        migrations.RemoveField(
+            model_name='shipment',
+            name='product_category',
+        ),
+        migrations.RemoveField(
+            model_name='shipment',
+            name='recycle_sand',
+        ),
+        migrations.RemoveField(
+            model_name='shipment',
+            name='rotation',
+        ),
+        migrations.RemoveField(
+            model_name='shipment',
+            name='site',
+        ),
+        migrations.RemoveField(
+            model_name='shipment',
+            name='site_address',
+        ),
+        migrations.RemoveField(
+            model_name='shipment',
+            name='specialnote',
+        ),
+        migrations.RemoveField(
+            model_name='shipment',
+            name='test',
+        ),
+        migrations.RemoveField(
+            model_name='shipment',
+            name='water',
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations, models
+
+
+def mark_existing_dates(apps, schema_editor):
+    """既存の出荷日をすべて再計算待ちにする（日別集計は初回参照時・refresh_rollups で作成）"""
+    Shipment = apps.get_model('orders', 'Shipment')
+    RollupDirtyDate = apps.get_model('orders', 'RollupDirtyDate')
+    RollupDirtyDate.objects.bulk_create(
+        [RollupDirtyDate(date=d) for d in Shipment.objects.values_list('ship_date', flat=True).distinct().order_by()],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_remove_shipment_copied_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupDirtyDate',
+            fields=[
+                ('date', models.DateField(primary_key=True, serialize=False, verbose_name='日付')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyContractRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ship_date', models.DateField(verbose_name='出荷日')),
+                ('issue_no', models.CharField(max_length=10, verbose_name='契約NO')),
+                ('customer', models.CharField(blank=True, default='', max_length=200, verbose_name='得意先')),
+                ('site', models.CharField(blank=True, default='', max_length=200, verbose_name='現場名')),
+                ('night', models.BooleanField(default=False, verbose_name='夜間')),
+                ('ship_count', models.IntegerField(default=0, verbose_name='出荷台数')),
+                ('truck_planned', models.IntegerField(default=1, verbose_name='予定台数')),
+                ('short_diff', models.FloatField(default=0, verbose_name='空積量')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ship_date'], name='rollup_ship_date_idx')],
+                'unique_together': {('ship_date', 'issue_no')},
+            },
+        ),
+        migrations.RunPython(mark_existing_dates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def create_initial_stamp(apps, schema_editor):
+    """変更時刻の基準（これ以前の変更は記録が無いため、未記録のキーはこの時刻とみなす）"""
+    ChangeStamp = apps.get_model('orders', 'ChangeStamp')
+    ChangeStamp.objects.update_or_create(key='init', defaults={'changed_at': timezone.now()})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_daily_contract_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeStamp',
+            fields=[
+                ('key', models.CharField(max_length=40, primary_key=True, serialize=False, verbose_name='キー')),
+                ('changed_at', models.DateTimeField(verbose_name='変更時刻')),
+            ],
+            options={
+                'verbose_name': '変更時刻',
+            },
+        ),
+        migrations.RunPython(create_initial_stamp, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-18 20:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_changestamp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedPeriod',
+            fields=[
+                ('fiscal_year', models.IntegerField(primary_key=True, serialize=False, verbose_name='年度')),
+                ('start', models.DateField(verbose_name='開始日')),
+                ('end', models.DateField(verbose_name='終了日')),
+                ('shipment_count', models.IntegerField(default=0, verbose_name='出荷件数')),
+                ('plan_count', models.IntegerField(default=0, verbose_name='予定件数')),
+                ('path', models.CharField(max_length=500, verbose_name='アーカイブファイル')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='アーカイブ日時')),
+            ],
+            options={
+                'verbose_name': 'アーカイブ済み年度',
+            },
+        ),
+    ]
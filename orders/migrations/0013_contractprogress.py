@@ -0,0 +1,44 @@
+# Generated by Django 5.1 on 2026-10-18 20:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0012_archivedperiod'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContractProgress',
+            fields=[
+                ('issue_no', models.CharField(max_length=10, primary_key=True, serialize=False, verbose_name='契約NO')),
+                ('customer', models.CharField(blank=True, default='', max_length=200, verbose_name='得意先')),
+                ('site', models.CharField(blank=True, default='', max_length=200, verbose_name='現場名')),
+                ('qty', models.FloatField(default=0, verbose_name='契約数量')),
+                ('planned_qty', models.FloatField(default=0, verbose_name='予定数量合計')),
+                ('upcoming_qty', models.FloatField(default=0, verbose_name='今後の予定数量')),
+                ('shipped_qty', models.FloatField(default=0, verbose_name='出荷済み数量')),
+                ('ship_count', models.IntegerField(default=0, verbose_name='出荷台数')),
+                ('remaining_qty', models.FloatField(default=0, verbose_name='残数量')),
+                ('progress', models.FloatField(default=0, verbose_name='進捗率')),
+                ('first_ship_date', models.DateField(blank=True, null=True, verbose_name='初回出荷日')),
+                ('last_ship_date', models.DateField(blank=True, null=True, verbose_name='最終出荷日')),
+                ('last_plan_date', models.DateField(blank=True, null=True, verbose_name='最終予定日')),
+                ('projected_completion', models.DateField(blank=True, null=True, verbose_name='完了見込み日')),
+                ('projected_by', models.CharField(blank=True, choices=[('done', '出荷済み'), ('plan', '予定'), ('pace', '出荷ペース'), ('', '見込みなし')], default='', max_length=10, verbose_name='見込みの根拠')),
+                ('over_planned', models.BooleanField(default=False, verbose_name='予定超過')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': '契約進捗',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProgressDirtyContract',
+            fields=[
+                ('issue_no', models.CharField(max_length=10, primary_key=True, serialize=False, verbose_name='契約NO')),
+            ],
+        ),
+    ]
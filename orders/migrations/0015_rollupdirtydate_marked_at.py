@@ -0,0 +1,19 @@
+# Generated by Django 5.1 on 2026-10-18 21:25
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0014_cache_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rollupdirtydate',
+            name='marked_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='印を付けた時刻'),
+        ),
+    ]
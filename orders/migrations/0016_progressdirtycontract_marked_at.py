@@ -0,0 +1,35 @@
+# Generated by Django 5.1 on 2026-10-18 21:26
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def mark_orders_without_progress(apps, schema_editor):
+    """進捗の行がまだ無い受注を再計算待ちにする（以前は参照のたびに探していた）"""
+    Order = apps.get_model('orders', 'Order')
+    ContractProgress = apps.get_model('orders', 'ContractProgress')
+    ProgressDirtyContract = apps.get_model('orders', 'ProgressDirtyContract')
+    ProgressDirtyContract.objects.bulk_create(
+        [
+            ProgressDirtyContract(issue_no=issue_no)
+            for issue_no in Order.objects.exclude(pk__in=ContractProgress.objects.values('issue_no')).values_list('pk', flat=True)
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0015_rollupdirtydate_marked_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='progressdirtycontract',
+            name='marked_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='印を付けた時刻'),
+        ),
+        migrations.RunPython(mark_orders_without_progress, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,7 @@
 import datetime
-from django.db import models
+import hashlib
+import json
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import AbstractUser,User
 from django.utils import timezone
 from django.conf import settings
@@ -16,6 +18,37 @@ class User(AbstractUser):
     is_admin_user = models.BooleanField('管理者権限', default=False)
     display_name = models.CharField('表示名', max_length=50, blank=True)
 
+# 採番カウンタ（年ごとの契約連番・契約ごとの枝番）
+class IssueSequence(models.Model):
+    key = models.CharField('採番キー', max_length=20, primary_key=True)
+    last_value = models.IntegerField('最終値', default=0)
+
+    class Meta:
+        verbose_name = '採番カウンタ'
+
+    @classmethod
+    def allocate(cls, key, seed):
+        """
+        カウンタを1進めて新しい値を返す（行ロック付きUPDATEのため同時実行でも重複しない）
+        カウンタがまだ無い場合は seed() の値（既存データの最大値）から始める
+        """
+        with transaction.atomic():
+            while True:
+                if cls.objects.filter(key=key).update(last_value=models.F('last_value') + 1):
+                    return cls.objects.values_list('last_value', flat=True).get(key=key)
+                try:
+                    with transaction.atomic():
+                        return cls.objects.create(key=key, last_value=seed() + 1).last_value
+                except IntegrityError:
+                    # 他の処理が同時にカウンタを作成した → UPDATE からやり直す
+                    continue
+
+    @classmethod
+    def peek(cls, key, seed):
+        """次に払い出される値（画面表示用の目安。カウンタは進めない）"""
+        last = cls.objects.filter(key=key).values_list('last_value', flat=True).first()
+        return (seed() if last is None else last) + 1
+
 # 受注テーブル
 class Order(models.Model):
     issue_no = models.CharField(max_length=7, primary_key=True, blank=True, verbose_name="契約NO")
@@ -53,26 +86,50 @@ class Order(models.Model):
         if not self.issue_no:
             # 現在の西暦の下2桁（例: 2025年 -> "25"）
             year_prefix = str(datetime.datetime.now().year)[2:]
-            # その年の最新レコードを取得
-            last_order = Order.objects.filter(issue_no__startswith=year_prefix).order_by('issue_no').last()
-            
-            if last_order:
-                # 最新の連番（25XXXX0 の XXXX部分）を抽出して+1
-                last_seq = int(last_order.issue_no[2:6])
-                new_seq = str(last_seq + 1).zfill(4)
-            else:
-                new_seq = "0001"
+            # 年ごとの採番カウンタから連番（25XXXX0 の XXXX部分）を取得
+            new_seq = str(IssueSequence.allocate(f"year:{year_prefix}", lambda: self._last_year_seq(year_prefix))).zfill(4)
             
             # 新規登録時は最後に "0" を付与
             self.issue_no = f"{year_prefix}{new_seq}0"
+            # 採番した番号は必ず新規行（既存の受注を上書きしない）
+            if not args:
+                kwargs.setdefault('force_insert', True)
         super().save(*args, **kwargs)
 
+    @staticmethod
+    def _last_year_seq(year_prefix):
+        """カウンタ作成時の初期値：その年の既存の最大連番"""
+        last_no = Order.objects.filter(issue_no__startswith=year_prefix).order_by('-issue_no').values_list('issue_no', flat=True).first()
+        return int(last_no[2:6]) if last_no else 0
+
+    @staticmethod
+    def _last_branch(base_no):
+        """カウンタ作成時の初期値：その契約の既存の最大枝番"""
+        last_no = Order.objects.filter(issue_no__startswith=base_no).order_by('-issue_no').values_list('issue_no', flat=True).first()
+        try:
+            return int(last_no[6:])
+        except (TypeError, ValueError):
+            return 0
+
+    @classmethod
+    def next_branch_no(cls, base_no):
+        """枝番付きの契約NOを採番（例: 2500010 -> 2500011）"""
+        branch = IssueSequence.allocate(f"branch:{base_no}", lambda: cls._last_branch(base_no))
+        return f"{base_no}{branch}"
+
+    @classmethod
+    def peek_branch_no(cls, base_no):
+        """次の枝番付き契約NO（画面表示用。採番はしない）"""
+        return f"{base_no}{IssueSequence.peek(f'branch:{base_no}', lambda: cls._last_branch(base_no))}"
+
     def __str__(self): return f"{self.issue_no} / {self.site}"
 
 # 出荷テーブル（ここを追加したことでImportErrorが消えます）
 class Shipment(models.Model):
     # 基本情報
     issue_no = models.CharField('契約NO', max_length=10, default='') 
+    # 受注への参照（issue_no から自動設定。受注に無い契約NOの場合は空）
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='shipments', verbose_name='受注')
     ship_date = models.DateField('出荷日', default=timezone.now)
     ship_time = models.TimeField('出荷時間', default=timezone.now)
     ship_qty = models.FloatField('出荷量', default=6.0)
@@ -85,7 +142,49 @@ class Shipment(models.Model):
     contract_qty = models.FloatField('契約数量', default=0)
     remaining_qty = models.FloatField('残量', default=0)
     
-    # 受注からのコピー項目
+    # 受注からのコピー項目（同じ内容は OrderSnapshot の1行を共有する）
+    snapshot = models.ForeignKey('OrderSnapshot', on_delete=models.PROTECT, null=True, blank=True, editable=False, related_name='shipments', verbose_name='受注内容')
+
+    class Meta:
+        indexes = [
+            # 契約NO・出荷日で絞り込み、ID順に並べる検索（出荷統計・実績管理表）用
+            models.Index(fields=['issue_no', 'ship_date', 'id'], name='shipment_issue_date_id_idx'),
+            models.Index(fields=['ship_date'], name='shipment_ship_date_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.issue_no and self.order_id != self.issue_no:
+            self.order = Order.objects.filter(pk=self.issue_no).first()
+        # 出荷カウンタ・日別集計の更新と同じトランザクションで保存する
+        from .counters import rebuild_counters, record_shipment
+        from .progress import mark_contracts_dirty
+        from .rollups import mark_dates_dirty
+        with transaction.atomic():
+            if self._state.adding:
+                super().save(*args, **kwargs)
+                record_shipment(self)
+                mark_dates_dirty([self.ship_date])
+                mark_contracts_dirty([self.issue_no])
+            else:
+                old_issue_no, old_date = Shipment.objects.filter(pk=self.pk).values_list('issue_no', 'ship_date').first() or (None, None)
+                super().save(*args, **kwargs)
+                rebuild_counters({self.issue_no, old_issue_no} - {None})
+                mark_dates_dirty([self.ship_date, old_date])
+                mark_contracts_dirty([self.issue_no, old_issue_no])
+
+# 出荷時点の受注内容（出荷ごとにコピーせず、内容が同じなら1行を共有する。作成後は変更しない）
+class OrderSnapshot(models.Model):
+    # 出荷実績から切り出した受注のコピー項目
+    FIELDS = [
+        'site', 'site_address', 'customer', 'contractor', 'coordinator', 'contact',
+        'product', 'product_category', 'note', 'specialnote',
+        'rotation', 'price', 'material_soil', 'water', 'cementBB', 'recycle_sand', 'admixture', 'material_soil_wm',
+        'test', 'night', 'outside23', 'material_delivery',
+    ]
+
+    digest = models.CharField('内容ハッシュ', max_length=64, unique=True)
+    issue_no = models.CharField('契約NO', max_length=10, default='')
+
     site = models.CharField('現場名', max_length=100, default='')
     site_address = models.CharField('現場住所', max_length=200, blank=True, default='')
     customer = models.CharField('得意先', max_length=100, default='')
@@ -112,6 +211,64 @@ class Shipment(models.Model):
     night = models.BooleanField('夜間', default=False)
     outside23 = models.BooleanField('23区外', default=False)
     material_delivery = models.BooleanField('材料渡し', default=False)
+
+    class Meta:
+        verbose_name = '受注内容スナップショット'
+
+    @classmethod
+    def make_digest(cls, issue_no, values):
+        """契約NOとコピー項目の内容から重複判定用のハッシュを作る"""
+        payload = json.dumps([issue_no] + [values.get(f) for f in cls.FIELDS], ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    @classmethod
+    def values_from_order(cls, order):
+        """受注からコピー項目の値を取り出す（出荷入力の初期値・一括取込で使用）"""
+        values = {f: getattr(order, f) for f in cls.FIELDS if f != 'coordinator'}
+        values['coordinator'] = order.coordinator.user.display_name if order.coordinator else ""
+        # 受注側の原料土は文字列のため、数値として読めない場合は空にする
+        try:
+            values['material_soil'] = float(order.material_soil) if order.material_soil not in (None, '') else None
+        except ValueError:
+            values['material_soil'] = None
+        return values
+
+    @classmethod
+    def intern(cls, issue_no, values):
+        """同じ内容のスナップショットがあればそれを、無ければ作成して返す"""
+        values = {f: cls._meta.get_field(f).to_python(values.get(f)) for f in cls.FIELDS}
+        digest = cls.make_digest(issue_no, values)
+        snapshot = cls.objects.filter(digest=digest).first()
+        if snapshot:
+            return snapshot
+        try:
+            with transaction.atomic():
+                return cls.objects.create(digest=digest, issue_no=issue_no, **values)
+        except IntegrityError:
+            return cls.objects.get(digest=digest)
+
+# 出荷カウンタ（契約NO・出荷日ごと）：当日の累計台数・累計出荷量・前車NO
+class ShipmentDailyCounter(models.Model):
+    issue_no = models.CharField('契約NO', max_length=10)
+    ship_date = models.DateField('出荷日')
+    unit_count = models.IntegerField('台数', default=0)
+    qty_sum = models.FloatField('出荷量合計', default=0)
+    last_car_no = models.CharField('最終車両番号', max_length=3, blank=True, default='')
+    last_shipment_id = models.BigIntegerField('最終出荷ID', default=0)
+
+    class Meta:
+        unique_together = ('issue_no', 'ship_date')
+        verbose_name = '出荷カウンタ（日別）'
+
+# 出荷カウンタ（契約NOごと）：全期間の出荷台数・出荷量
+class ShipmentContractCounter(models.Model):
+    issue_no = models.CharField('契約NO', max_length=10, primary_key=True)
+    unit_count = models.IntegerField('台数', default=0)
+    qty_sum = models.FloatField('出荷量合計', default=0)
+    last_ship_date = models.DateField('最終出荷日', null=True, blank=True)
+
+    class Meta:
+        verbose_name = '出荷カウンタ（契約別）'
     
 class OrderPlan(models.Model):
     order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True)
@@ -123,18 +280,47 @@ class OrderPlan(models.Model):
     plan_qty = models.FloatField(null=True, blank=True)
     truck_count = models.IntegerField(null=True, blank=True)
     plan_note = models.TextField(blank=True)
+    # 差分同期用の更新日時（ボードは前回取得以降の変更分だけを取得する）
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         unique_together = ('plan_date', 'section', 'row_index')
+        indexes = [
+            models.Index(fields=['order', 'plan_date'], name='orderplan_order_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.plan_date} [{self.section}-{self.row_index}] {self.site_name}"
 
-    # 契約数量チェック用のロジック（後で活用します）
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 読み込み時の契約（予定の契約を付け替えた場合に、元の契約の進捗も再計算させる）
+        instance._loaded_order_id = instance.__dict__.get('order_id')
+        return instance
+
+    def to_board_dict(self):
+        """ボード用のJSON形式（予定取得APIと変更通知で共通）"""
+        return {
+            'date': str(self.plan_date),
+            'section': self.section,
+            'row_index': self.row_index,
+            'site': self.site_name,
+            'time': self.start_time,
+            'qty': self.plan_qty,
+            'truck': self.truck_count,
+            'note': self.plan_note,
+            # 契約NOは受注の主キーなので order_id をそのまま使う（受注テーブルを引かない）
+            'issue_no': self.order_id or ''
+        }
+
     def check_over_qty(self):
-        # 同じ契約NOの予定合計を算出
-        total_planned = OrderPlan.objects.filter(order=self.order).aggregate(models.Sum('plan_qty'))['plan_qty__sum'] or 0
-        return total_planned > self.order.qty
+        """契約数量チェック（出荷済み + 今日以降の予定が契約数量を超えるか）。複数の契約は commitments でまとめて確認する"""
+        if not self.order_id:
+            return False
+        from .commitments import contract_commitments
+        commitment = contract_commitments([self.order_id]).get(self.order_id)
+        return bool(commitment and commitment['over'])
 
 # orders/models.py
 
@@ -158,4 +344,106 @@ class SystemConfig(models.Model):
     session_timeout_minutes = models.IntegerField('セッション有効期限(分)', default=30)
 
     class Meta:
-        verbose_name = 'システム設定'
\ No newline at end of file
+        verbose_name = 'システム設定'
+
+
+# 実績管理表の日別集計（契約NO・出荷日ごと）：単価に依存しない値だけを持ち、金額は参照時に単価表から計算する
+class DailyContractRollup(models.Model):
+    ship_date = models.DateField('出荷日')
+    issue_no = models.CharField('契約NO', max_length=10)
+    customer = models.CharField('得意先', max_length=200, blank=True, default='')
+    site = models.CharField('現場名', max_length=200, blank=True, default='')
+    night = models.BooleanField('夜間', default=False)
+    ship_count = models.IntegerField('出荷台数', default=0)
+    truck_planned = models.IntegerField('予定台数', default=1)
+    short_diff = models.FloatField('空積量', default=0)
+
+    class Meta:
+        unique_together = ('ship_date', 'issue_no')
+        indexes = [
+            models.Index(fields=['ship_date'], name='rollup_ship_date_idx'),
+        ]
+
+    def to_fact(self):
+        """aggregate_contract_days と同じ形式の集計結果に変換"""
+        return {
+            'date': self.ship_date,
+            'issue_no': self.issue_no,
+            'customer': self.customer,
+            'site': self.site,
+            'night': self.night,
+            'ship_count': self.ship_count,
+            'short_diff': self.short_diff,
+            'truck_planned': self.truck_planned,
+        }
+
+
+# 日別集計の再計算が必要な日付（出荷・予定・受注の変更時に記録し、集計の参照時に再計算する）
+class RollupDirtyDate(models.Model):
+    date = models.DateField('日付', primary_key=True)
+    # 印を付け直すたびに更新する（再計算は読んだ時点の値と一致する印だけを消す）
+    marked_at = models.DateTimeField('印を付けた時刻', default=timezone.now)
+
+
+# 変更時刻（日付ごと・テーブルごと）：ETag / Last-Modified と過去日の応答キャッシュの判定に使う
+class ChangeStamp(models.Model):
+    key = models.CharField('キー', max_length=40, primary_key=True)  # date:YYYY-MM-DD / table:名前
+    changed_at = models.DateTimeField('変更時刻')
+
+    class Meta:
+        verbose_name = '変更時刻'
+
+
+# アーカイブ済みの年度：出荷・予定はファイルに移して削除し、日別集計と出荷カウンタ（日別）だけを残す
+class ArchivedPeriod(models.Model):
+    fiscal_year = models.IntegerField('年度', primary_key=True)
+    start = models.DateField('開始日')
+    end = models.DateField('終了日')
+    shipment_count = models.IntegerField('出荷件数', default=0)
+    plan_count = models.IntegerField('予定件数', default=0)
+    path = models.CharField('アーカイブファイル', max_length=500)
+    archived_at = models.DateTimeField('アーカイブ日時', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'アーカイブ済み年度'
+
+    def __str__(self):
+        return f'{self.fiscal_year}年度 ({self.start}〜{self.end})'
+
+
+# 契約ごとの進捗（契約数量・予定・出荷済み・完了見込み）：出荷・予定・受注の変更時に再計算待ちにし、参照時に作り直す
+class ContractProgress(models.Model):
+    PROJECTED_BY_CHOICES = [
+        ('done', '出荷済み'),
+        ('plan', '予定'),
+        ('pace', '出荷ペース'),
+        ('', '見込みなし'),
+    ]
+
+    issue_no = models.CharField('契約NO', max_length=10, primary_key=True)
+    customer = models.CharField('得意先', max_length=200, blank=True, default='')
+    site = models.CharField('現場名', max_length=200, blank=True, default='')
+    qty = models.FloatField('契約数量', default=0)
+    planned_qty = models.FloatField('予定数量合計', default=0)
+    upcoming_qty = models.FloatField('今後の予定数量', default=0)  # 最終出荷日より後の予定
+    shipped_qty = models.FloatField('出荷済み数量', default=0)
+    ship_count = models.IntegerField('出荷台数', default=0)
+    remaining_qty = models.FloatField('残数量', default=0)
+    progress = models.FloatField('進捗率', default=0)
+    first_ship_date = models.DateField('初回出荷日', null=True, blank=True)
+    last_ship_date = models.DateField('最終出荷日', null=True, blank=True)
+    last_plan_date = models.DateField('最終予定日', null=True, blank=True)
+    projected_completion = models.DateField('完了見込み日', null=True, blank=True)
+    projected_by = models.CharField('見込みの根拠', max_length=10, choices=PROJECTED_BY_CHOICES, blank=True, default='')
+    over_planned = models.BooleanField('予定超過', default=False)
+    updated_at = models.DateTimeField('更新日時', auto_now=True)
+
+    class Meta:
+        verbose_name = '契約進捗'
+
+
+# 進捗の再計算が必要な契約
+class ProgressDirtyContract(models.Model):
+    issue_no = models.CharField('契約NO', max_length=10, primary_key=True)
+    # 印を付け直すたびに更新する（再計算は読んだ時点の値と一致する印だけを消す）
+    marked_at = models.DateTimeField('印を付けた時刻', default=timezone.now)
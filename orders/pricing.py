@@ -0,0 +1,69 @@
+import re
+import time
+
+from .models import ChangeStamp, UnitPriceMaster
+from .stamps import PRICE_TABLE, table_key, touch_tables
+
+# 項目名（例: "夜間 3回転", "昼間 2回空積"）から (夜間か, 回転数, 空積か) を取り出す
+_ITEM_NAME_RE = re.compile(r'^(昼間|夜間)\s*(\d+)回(転|空積)$')
+
+# 単価表の変更時刻を確認する間隔（秒）。他のプロセス・ワーカーでの単価変更はこの時間内に反映される
+PRICE_CHECK_TTL_SECONDS = 5
+
+_price_table = None
+_loaded_version = None
+_checked_at = 0.0
+
+
+def parse_item_name(item_name):
+    """単価マスタの項目名をキーに変換（書式外の項目は None）"""
+    m = _ITEM_NAME_RE.match((item_name or '').strip())
+    if not m:
+        return None
+    return (m.group(1) == '夜間', int(m.group(2)), m.group(3) == '空積')
+
+
+def get_price_table():
+    """
+    {(夜間か, 回転数, 空積か): 仕切り価格} の単価表を返す
+    単価マスタはプロセスごとに読み込んで保持し、単価表の変更時刻が変わるまで使い回す
+    変更時刻の確認は PRICE_CHECK_TTL_SECONDS ごとに1回だけで、その間はDBを参照しない
+    """
+    global _price_table, _loaded_version, _checked_at
+    if _price_table is not None and time.monotonic() - _checked_at <= PRICE_CHECK_TTL_SECONDS:
+        return _price_table
+    # 単価表より先に変更時刻を読む（読み込み中に変更されても、次回の確認で読み直す）
+    version = _price_version()
+    _checked_at = time.monotonic()
+    if _price_table is None or version != _loaded_version:
+        table = {}
+        # 同じ項目が複数ある場合は先に登録された行を優先する
+        for item_name, price in UnitPriceMaster.objects.order_by('-id').values_list('item_name', 'partition_price'):
+            key = parse_item_name(item_name)
+            if key:
+                table[key] = price
+        _price_table, _loaded_version = table, version
+    return _price_table
+
+
+def _price_version():
+    """
+    単価表の変更時刻（ChangeStamp の table:price。主キーで1行を読むだけ）
+    DBに記録されるため、他のプロセス・ワーカーでの変更もこれで検知する
+    """
+    return ChangeStamp.objects.filter(key=table_key(PRICE_TABLE)).values_list('changed_at', flat=True).first()
+
+
+def get_price_from_master(rotation, is_night, is_empty=False, prices=None):
+    """単価取得用ヘルパー（繰り返し呼ぶ処理では get_price_table の単価表を prices に渡す）"""
+    if prices is None:
+        prices = get_price_table()
+    return prices.get((bool(is_night), rotation, is_empty), 0)
+
+
+def invalidate_price_table():
+    """単価マスタ変更時に呼び出し、次回参照時に読み直させる"""
+    global _price_table
+    _price_table = None
+    # 単価は全日付の実績管理表の金額に影響する。他のプロセスはこの変更時刻で読み直す
+    touch_tables(PRICE_TABLE)
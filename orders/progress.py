@@ -0,0 +1,177 @@
+import datetime
+import math
+
+from django.db import transaction
+from django.db.models import F, FloatField, IntegerField, Min, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import (
+    ContractProgress, Order, OrderPlan, ProgressDirtyContract, ShipmentContractCounter, ShipmentDailyCounter,
+)
+
+# 再計算時に一度に処理する契約数
+PROGRESS_BATCH_SIZE = 500
+# 数量の比較で誤差とみなす幅
+QTY_EPSILON = 1e-6
+
+# 進捗一覧の並べ替えに使える項目（画面の列と同じ）
+PROGRESS_SORT_FIELDS = (
+    'issue_no', 'customer', 'site', 'qty', 'planned_qty', 'upcoming_qty', 'shipped_qty',
+    'remaining_qty', 'progress', 'last_ship_date', 'projected_completion',
+)
+PROGRESS_FILTERS = ('active', 'idle', 'over', 'done', 'all')
+# 残数量があっても、今後の予定が無くこの日数出荷していない契約は停滞（idle）として一覧の既定の表示から外す
+PROGRESS_IDLE_DAYS = 30
+
+
+def mark_contracts_dirty(issue_nos):
+    """進捗の再計算が必要な契約を記録する（変更と同じトランザクションで呼ぶ）"""
+    issue_nos = {no for no in issue_nos if no}
+    if issue_nos:
+        # 既に印がある契約も marked_at を更新する（行ロックを取るため、再計算中ならその完了を待つ）
+        now = timezone.now()
+        ProgressDirtyContract.objects.bulk_create(
+            [ProgressDirtyContract(issue_no=no, marked_at=now) for no in sorted(issue_nos)],
+            update_conflicts=True, unique_fields=['issue_no'], update_fields=['marked_at'],
+        )
+
+
+def refresh_progress():
+    """
+    再計算待ちの契約の進捗を作り直す
+    （受注はすべて登録時に印が付く。signals を通さずに一括登録する場合は mark_contracts_dirty を呼ぶ）
+    戻り値: 作り直した契約数
+    """
+    # 再計算待ちが無ければ書き込みのトランザクションを開かない（参照のたびにロックを取らない）
+    if not ProgressDirtyContract.objects.exists():
+        return 0
+    with transaction.atomic():
+        # 印の行をロックする（再計算どうしは順番になり、印を付け直す変更はこの再計算の完了を待つ）
+        marks = dict(ProgressDirtyContract.objects.select_for_update().values_list('issue_no', 'marked_at'))
+        targets = sorted(marks)
+        for i in range(0, len(targets), PROGRESS_BATCH_SIZE):
+            _refresh_batch(targets[i:i + PROGRESS_BATCH_SIZE])
+
+        # 印は再計算の後で、読んだ時点の marked_at と一致するものだけ消す
+        # （付け直された印は残り、次の参照で再計算される）
+        by_marked_at = {}
+        for issue_no, marked_at in marks.items():
+            by_marked_at.setdefault(marked_at, []).append(issue_no)
+        for marked_at, issue_nos in by_marked_at.items():
+            ProgressDirtyContract.objects.filter(issue_no__in=issue_nos, marked_at=marked_at).delete()
+    return len(targets)
+
+
+def _refresh_batch(issue_nos):
+    """契約NOごとの進捗を受注（出荷カウンタの副問合せ付き）・予定の2クエリで作り直す"""
+    zero = Value(0.0, output_field=FloatField())
+    counter = ShipmentContractCounter.objects.filter(issue_no=OuterRef('pk'))
+    first_day = (
+        ShipmentDailyCounter.objects.filter(issue_no=OuterRef('pk'))
+        .order_by().values('issue_no').annotate(first=Min('ship_date')).values('first')
+    )
+    orders = (
+        Order.objects.filter(pk__in=issue_nos)
+        .values('issue_no', 'customer', 'site', 'qty')
+        .annotate(
+            shipped_qty=Coalesce(Subquery(counter.values('qty_sum'), output_field=FloatField()), zero),
+            ship_count=Coalesce(Subquery(counter.values('unit_count'), output_field=IntegerField()), Value(0)),
+            last_ship_date=Subquery(counter.values('last_ship_date')),
+            first_ship_date=Subquery(first_day),
+        )
+    )
+    plans = {}
+    for order_id, plan_date, plan_qty in (
+        OrderPlan.objects.filter(order_id__in=issue_nos, plan_qty__gt=0)
+        .order_by('order_id', 'plan_date')
+        .values_list('order_id', 'plan_date', 'plan_qty')
+    ):
+        plans.setdefault(order_id, []).append((plan_date, plan_qty))
+
+    rows = [_as_progress(order, plans.get(order['issue_no'], [])) for order in orders]
+    # 削除された受注の進捗は消す
+    ContractProgress.objects.filter(issue_no__in=issue_nos).exclude(issue_no__in=[r.issue_no for r in rows]).delete()
+    ContractProgress.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['issue_no'],
+        update_fields=[f.name for f in ContractProgress._meta.concrete_fields if not f.primary_key],
+    )
+
+
+def _as_progress(order, plans):
+    """
+    1契約の進捗。plans: [(予定日, 予定数量)]（日付順）
+    完了見込み日: 出荷済み + 最終出荷日より後の予定 が契約数量に届く予定日。予定で届かない場合は、
+    初回〜最終出荷日の1日あたりの出荷量で残りを出荷し終える日（予定の最終日か最終出荷日の遅い方から数える）
+    """
+    qty, shipped, last_ship = order['qty'] or 0, order['shipped_qty'], order['last_ship_date']
+    upcoming = [(d, q) for d, q in plans if last_ship is None or d > last_ship]
+    upcoming_qty = sum(q for _, q in upcoming)
+    remaining = qty - shipped
+
+    projected, projected_by = None, ''
+    if remaining <= QTY_EPSILON:
+        projected, projected_by = last_ship, 'done'
+    else:
+        total = shipped
+        for plan_date, plan_qty in upcoming:
+            total += plan_qty
+            if total >= qty - QTY_EPSILON:
+                projected, projected_by = plan_date, 'plan'
+                break
+        else:
+            first_ship = order['first_ship_date']
+            if shipped > 0 and first_ship and last_ship:
+                per_day = shipped / ((last_ship - first_ship).days + 1)
+                start = max(d for d in (last_ship, upcoming[-1][0] if upcoming else None) if d)
+                projected = start + datetime.timedelta(days=math.ceil((qty - total) / per_day))
+                projected_by = 'pace'
+
+    return ContractProgress(
+        issue_no=order['issue_no'],
+        customer=order['customer'],
+        site=order['site'],
+        qty=qty,
+        planned_qty=round(sum(q for _, q in plans), 1),
+        upcoming_qty=round(upcoming_qty, 1),
+        shipped_qty=round(shipped, 1),
+        ship_count=order['ship_count'],
+        remaining_qty=round(remaining, 1),
+        progress=shipped / qty if qty > 0 else 0,
+        first_ship_date=order['first_ship_date'],
+        last_ship_date=last_ship,
+        last_plan_date=plans[-1][0] if plans else None,
+        projected_completion=projected,
+        projected_by=projected_by,
+        over_planned=shipped + upcoming_qty > qty + QTY_EPSILON,
+    )
+
+
+def progress_queryset(sort='projected_completion', status='active', customer='', today=None):
+    """
+    進捗一覧（参照前に再計算待ちの契約を作り直す）
+    sort: PROGRESS_SORT_FIELDS のいずれか（先頭に - で降順）
+    status: active（今後の予定がある・最近出荷した未完了の契約）/ idle（停滞）/ over（予定超過）/ done（完了）/ all
+    """
+    refresh_progress()
+    cutoff = (today or timezone.localdate()) - datetime.timedelta(days=PROGRESS_IDLE_DAYS)
+    rows = ContractProgress.objects.all()
+    if status == 'active':
+        rows = rows.filter(Q(upcoming_qty__gt=0) | Q(remaining_qty__gt=0, last_ship_date__gte=cutoff))
+    elif status == 'idle':
+        rows = rows.filter(Q(last_ship_date__isnull=True) | Q(last_ship_date__lt=cutoff), remaining_qty__gt=0, upcoming_qty__lte=0)
+    elif status == 'over':
+        rows = rows.filter(over_planned=True)
+    elif status == 'done':
+        rows = rows.filter(remaining_qty__lte=0, upcoming_qty__lte=0)
+    if customer:
+        rows = rows.filter(customer__icontains=customer)
+
+    field = sort.lstrip('-')
+    if field not in PROGRESS_SORT_FIELDS:
+        raise ValueError(f'sort は {", ".join(PROGRESS_SORT_FIELDS)} のいずれかです')
+    # 見込み日・最終出荷日が無い契約は昇順・降順とも末尾に並べる
+    expression = F(field).desc(nulls_last=True) if sort.startswith('-') else F(field).asc(nulls_last=True)
+    return rows.order_by(expression, 'issue_no')
@@ -0,0 +1,192 @@
+import datetime
+import math
+from django.core.cache import cache
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+from django.utils import timezone
+
+from .archive import archived_periods
+from .models import DailyContractRollup, OrderPlan, Shipment
+from .pricing import get_price_table
+from .stamps import PRICE_TABLE, date_key, last_changed, table_key
+
+# 1台あたりの基準出荷量（これを下回る分が空積割増の対象）
+FULL_LOAD = 6.0
+# 過去日の実績管理表を保持する時間（変更時はキーが変わるため、期限は使われない分の掃除用）
+REPORT_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def rotation_split(n, k):
+    """
+    N台の実績を予定台数 k で割り振ったときの回転数・回数を返す
+    L: グループ1の回転数（切り上げ） / M: グループ2の回転数（切り捨て）
+    X: グループ1の回数 / Y: グループ2の回数
+    """
+    q, r = divmod(n, k)
+    L = math.ceil(n / k)
+    M = math.floor(n / k)
+    X = (q + 1) * r
+    Y = q * (k - r)
+    return L, M, X, Y
+
+
+def aggregate_contract_days(start, end):
+    """
+    期間内の（出荷日, 契約NO）ごとの集計をまとめて取得する
+    出荷（受注を外部キーで結合）・予定の各テーブルにつき1クエリで、契約数に関係なく一定回数で済む
+    受注の無い契約NOの出荷（order が空）は集計しない
+    """
+    ship_rows = list(
+        Shipment.objects.filter(ship_date__range=(start, end), order__isnull=False)
+        .values('ship_date', 'order_id', customer=F('order__customer'), site=F('order__site'), night=F('order__night'))
+        .annotate(
+            ship_count=Count('id'),
+            short_diff=Sum(Case(
+                When(ship_qty__lt=FULL_LOAD, then=Value(FULL_LOAD) - F('ship_qty')),
+                default=Value(0.0),
+                output_field=FloatField(),
+            )),
+        )
+        .order_by('ship_date', 'order_id')
+    )
+    if not ship_rows:
+        return []
+
+    planned = {
+        (r['plan_date'], r['order_id']): r['trucks']
+        for r in OrderPlan.objects.filter(plan_date__range=(start, end), order__isnull=False)
+        .values('plan_date', 'order_id')
+        .annotate(trucks=Sum('truck_count'))
+        .order_by()
+    }
+    return [
+        {
+            'date': r['ship_date'],
+            'issue_no': r['order_id'],
+            'customer': r['customer'],
+            'site': r['site'],
+            'night': r['night'],
+            'ship_count': r['ship_count'],
+            'short_diff': r['short_diff'] or 0,
+            'truck_planned': planned.get((r['ship_date'], r['order_id'])) or 1,
+        }
+        for r in ship_rows
+    ]
+
+
+def contract_report(fact, prices):
+    """1契約・1日分の集計結果に回転数計算と単価（get_price_table の単価表）を適用し、実績管理表の1ブロックを作る"""
+    N, k, short_diff = fact['ship_count'], fact['truck_planned'], fact['short_diff']
+    night = fact['night']
+    L, M, X, Y = rotation_split(N, k)
+
+    price_X = prices.get((night, L, False), 0)
+    price_Y = prices.get((night, M, False), 0)
+    price_empty = prices.get((night, L, True), 0)
+
+    return {
+        'issue_no': fact['issue_no'],
+        'truck_planned': k,
+        'customer': fact['customer'],
+        'site': fact['site'],
+        'rows': [
+            {'item': f'流動化処理土 出荷量㎥ ({L}回転)', 'unit': X, 'price': price_X, 'total': X * 6 - short_diff},
+            {'item': f'流動化処理土 出荷量㎥ ({M}回転)', 'unit': Y, 'price': price_Y, 'total': Y * 6},
+            {'item': '空積割増', 'unit': L if short_diff > 0 else 0, 'price': price_empty, 'total': short_diff},
+        ]
+    }
+
+
+def report_facts(start, end):
+    """
+    実績管理表用の（出荷日, 契約NO）ごとの集計
+    アーカイブ済みの年度は出荷が無いため、アーカイブ時点の日別集計（DailyContractRollup）を使う
+    """
+    facts = []
+    cursor = start
+    for archived_start, archived_end in archived_periods(start, end):
+        if cursor < archived_start:
+            facts.extend(aggregate_contract_days(cursor, archived_start - datetime.timedelta(days=1)))
+        rollups = DailyContractRollup.objects.filter(
+            ship_date__range=(max(cursor, archived_start), min(end, archived_end)),
+        ).order_by('ship_date', 'issue_no')
+        facts.extend(r.to_fact() for r in rollups)
+        cursor = archived_end + datetime.timedelta(days=1)
+    if cursor <= end:
+        facts.extend(aggregate_contract_days(cursor, end))
+    return facts
+
+
+def build_daily_report(target_date):
+    """指定日の実績管理表データを作成"""
+    facts = report_facts(target_date, target_date)
+    if not facts:
+        return []
+    prices = get_price_table()
+    return [contract_report(fact, prices) for fact in facts]
+
+
+def daily_report_keys(target_date):
+    """実績管理表が依存する変更時刻のキー（その日の出荷・予定・受注と単価表）"""
+    return [date_key(target_date), table_key(PRICE_TABLE)]
+
+
+def cached_daily_report(target_date):
+    """
+    build_daily_report のキャッシュ付き版（過去日のみ）
+    キーにその日と単価表の変更時刻を含めるため、変更があった日だけ作り直される
+    """
+    if target_date >= timezone.localdate():
+        return build_daily_report(target_date)
+    changed = last_changed(daily_report_keys(target_date))
+    key = f"orders:daily_report:{target_date.isoformat()}:{changed.timestamp() if changed else 0}"
+    report = cache.get(key)
+    if report is None:
+        report = build_daily_report(target_date)
+        cache.set(key, report, REPORT_CACHE_TIMEOUT)
+    return report
+
+
+def _empty_totals():
+    return {'days': 0, 'ship_count': 0, 'volume': 0.0, 'empty_qty': 0.0, 'amount': 0}
+
+
+def _add_totals(totals, report):
+    rows = report['rows']
+    totals['days'] += 1
+    totals['ship_count'] += rows[0]['unit'] + rows[1]['unit']
+    totals['volume'] += rows[0]['total'] + rows[1]['total']
+    totals['empty_qty'] += rows[2]['total']
+    totals['amount'] += sum(r['total'] * (r['price'] or 0) for r in rows)
+
+
+def build_range_report(start, end):
+    """
+    期間（月次など）の実績を得意先・契約ごとに集計する
+    日別集計テーブル（DailyContractRollup）を読むだけで、出荷テーブルは再計算待ちの日付しか参照しない
+    金額（数量 × 単価）は現在の単価表で計算する
+    """
+    from .rollups import refresh_rollups
+    refresh_rollups(start, end)
+    prices = get_price_table()
+
+    customers = {}
+    grand = _empty_totals()
+    rollups = (
+        DailyContractRollup.objects.filter(ship_date__range=(start, end))
+        .order_by('customer', 'issue_no', 'ship_date')
+        .iterator(chunk_size=2000)
+    )
+    for rollup in rollups:
+        report = contract_report(rollup.to_fact(), prices)
+        customer = customers.setdefault(rollup.customer, {
+            'customer': rollup.customer, 'contracts': {}, 'totals': _empty_totals(),
+        })
+        contract = customer['contracts'].setdefault(rollup.issue_no, {
+            'issue_no': rollup.issue_no, 'site': rollup.site, 'totals': _empty_totals(),
+        })
+        for totals in (contract['totals'], customer['totals'], grand):
+            _add_totals(totals, report)
+
+    for customer in customers.values():
+        customer['contracts'] = list(customer['contracts'].values())
+    return {'customers': list(customers.values()), 'totals': grand}
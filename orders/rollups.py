@@ -0,0 +1,88 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .archive import archived_q
+from .models import DailyContractRollup, RollupDirtyDate, ShipmentDailyCounter
+from .reports import aggregate_contract_days
+from .stamps import touch_dates
+
+
+def mark_dates_dirty(dates):
+    """
+    集計の再計算が必要な日付を記録する（変更と同じトランザクションで呼ぶ）
+    同時にその日付の変更時刻を進め、実績管理表の ETag・応答キャッシュを無効にする
+    """
+    dates = {d for d in dates if d}
+    if dates:
+        # 既に印がある日付も marked_at を更新する（行ロックを取るため、再計算中ならその完了を待つ）
+        now = timezone.now()
+        RollupDirtyDate.objects.bulk_create(
+            [RollupDirtyDate(date=d, marked_at=now) for d in sorted(dates)],
+            update_conflicts=True, unique_fields=['date'], update_fields=['marked_at'],
+        )
+        touch_dates(dates)
+
+
+def mark_orders_dirty(issue_nos):
+    """受注（得意先・現場名・夜間）の変更時に、その契約の出荷日をすべて再計算対象にする"""
+    mark_dates_dirty(
+        ShipmentDailyCounter.objects.filter(issue_no__in=issue_nos).values_list('ship_date', flat=True).distinct()
+    )
+
+
+def refresh_rollups(start=None, end=None):
+    """
+    期間内（省略時は全期間）の再計算待ちの日付について日別集計を作り直す
+    戻り値: 再計算した日数
+    """
+    dirty = RollupDirtyDate.objects.all()
+    if start:
+        dirty = dirty.filter(date__gte=start)
+    if end:
+        dirty = dirty.filter(date__lte=end)
+    # 再計算待ちが無ければ書き込みのトランザクションを開かない（参照のたびにロックを取らない）
+    if not dirty.exists():
+        return 0
+
+    with transaction.atomic():
+        # アーカイブ済みの年度は出荷が無いため作り直さない（アーカイブ時点の集計を使い続ける）
+        archived = archived_q('date')
+        if archived:
+            RollupDirtyDate.objects.filter(archived).delete()
+            dirty = dirty.exclude(archived)
+        # 印の行をロックする（同じ日付の再計算どうしは順番になり、印を付け直す変更はこの再計算の完了を待つ）
+        marks = dict(dirty.select_for_update().values_list('date', 'marked_at'))
+        if not marks:
+            return 0
+        dates = sorted(marks)
+
+        # 月ごとにまとめて集計する
+        months = {}
+        for d in dates:
+            months.setdefault((d.year, d.month), []).append(d)
+        for month_dates in months.values():
+            targets = set(month_dates)
+            DailyContractRollup.objects.filter(ship_date__in=targets).delete()
+            DailyContractRollup.objects.bulk_create([
+                DailyContractRollup(
+                    ship_date=fact['date'],
+                    issue_no=fact['issue_no'],
+                    customer=fact['customer'],
+                    site=fact['site'],
+                    night=fact['night'],
+                    ship_count=fact['ship_count'],
+                    truck_planned=fact['truck_planned'],
+                    short_diff=fact['short_diff'],
+                )
+                for fact in aggregate_contract_days(month_dates[0], month_dates[-1])
+                if fact['date'] in targets
+            ])
+
+        # 印は集計の後で、読んだ時点の marked_at と一致するものだけ消す
+        # （付け直された印は残り、次の参照で再計算される）
+        by_marked_at = {}
+        for d, marked_at in marks.items():
+            by_marked_at.setdefault(marked_at, []).append(d)
+        for marked_at, marked_dates in by_marked_at.items():
+            RollupDirtyDate.objects.filter(date__in=marked_dates, marked_at=marked_at).delete()
+    return len(dates)
@@ -0,0 +1,187 @@
+import hashlib
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .models import Order
+
+# 候補の最大件数
+RESULT_LIMIT = 15
+# この文字数以下の検索語は結果をキャッシュする（候補が多く索引も効きにくいため）
+SHORT_TERM_LENGTH = 2
+CACHE_TIMEOUT = 300
+# 受注が変更されるたびに進め、キャッシュ済みの候補を無効にする
+SEARCH_VERSION_KEY = 'orders:search_version'
+# トライグラム索引が使える最小文字数
+TRIGRAM_LENGTH = 3
+
+# SQLite の全文検索テーブル（マイグレーション 0004 で作成）
+SQLITE_FTS_TABLE = 'orders_order_search'
+
+# 全文検索テーブルを受注テーブルに同期させるトリガー（0004 と同じ定義）
+# 索引の行は受注の rowid で特定する。受注テーブルの作り直し（SQLite の AlterField・RemoveField など）では
+# rowid が振り直され、トリガーも消えるため、マイグレーションのたびに sync_sqlite_search_index で作り直す
+SQLITE_FTS_TRIGGERS = [
+    f"""
+    CREATE TRIGGER orders_order_search_ai AFTER INSERT ON orders_order BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE} (rowid, issue_no, site) VALUES (new.rowid, new.issue_no, new.site);
+    END
+    """,
+    f"""
+    CREATE TRIGGER orders_order_search_ad AFTER DELETE ON orders_order BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE} ({SQLITE_FTS_TABLE}, rowid, issue_no, site)
+        VALUES ('delete', old.rowid, old.issue_no, old.site);
+    END
+    """,
+    f"""
+    CREATE TRIGGER orders_order_search_au AFTER UPDATE OF issue_no, site ON orders_order
+    WHEN old.issue_no IS NOT new.issue_no OR old.site IS NOT new.site BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE} ({SQLITE_FTS_TABLE}, rowid, issue_no, site)
+        VALUES ('delete', old.rowid, old.issue_no, old.site);
+        INSERT INTO {SQLITE_FTS_TABLE} (rowid, issue_no, site) VALUES (new.rowid, new.issue_no, new.site);
+    END
+    """,
+]
+SQLITE_FTS_TRIGGER_NAMES = ['orders_order_search_ai', 'orders_order_search_ad', 'orders_order_search_au']
+
+
+def search_orders(term, limit=RESULT_LIMIT):
+    """
+    現場名・契約NOで受注を検索し、オートコンプリート用の候補を返す
+    並び順: 契約NOの前方一致 → 現場名の前方一致 → 部分一致（類似度順）
+    """
+    term = term.strip()
+    if not term:
+        return []
+    if len(term) > SHORT_TERM_LENGTH:
+        return _search(term, limit)
+
+    key = _cache_key(term, limit, cache.get(SEARCH_VERSION_KEY, 0))
+    results = cache.get(key)
+    if results is None:
+        results = _search(term, limit)
+        cache.set(key, results, CACHE_TIMEOUT)
+    return results
+
+
+async def asearch_orders(term, limit=RESULT_LIMIT):
+    """search_orders の非同期版（非同期ビュー用）"""
+    term = term.strip()
+    if not term:
+        return []
+    if len(term) > SHORT_TERM_LENGTH:
+        return await _asearch(term, limit)
+
+    key = _cache_key(term, limit, await cache.aget(SEARCH_VERSION_KEY, 0))
+    results = await cache.aget(key)
+    if results is None:
+        results = await _asearch(term, limit)
+        await cache.aset(key, results, CACHE_TIMEOUT)
+    return results
+
+
+def _cache_key(term, limit, version):
+    return f"orders:ac:{version}:{limit}:{hashlib.md5(term.encode()).hexdigest()}"
+
+
+def invalidate_search_cache():
+    """受注の追加・変更・削除時に呼び出す"""
+    try:
+        cache.incr(SEARCH_VERSION_KEY)
+    except ValueError:
+        cache.set(SEARCH_VERSION_KEY, 1, None)
+
+
+def sync_sqlite_search_index(using='default'):
+    """
+    SQLite の全文検索テーブルのトリガーを作り直し、索引を受注テーブルから再構築する（migrate のたびに実行）
+    VACUUM でも rowid が振り直されるため、VACUUM の後は migrate を実行する
+    全文検索テーブルが無い場合（0004 の適用前・PostgreSQL）は何もしない
+    """
+    conn = connections[using]
+    if conn.vendor != 'sqlite':
+        return False
+    tables = conn.introspection.table_names()
+    if SQLITE_FTS_TABLE not in tables or 'orders_order' not in tables:
+        return False
+    with transaction.atomic(using=using), conn.cursor() as cursor:
+        for name in SQLITE_FTS_TRIGGER_NAMES:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        for sql in SQLITE_FTS_TRIGGERS:
+            cursor.execute(sql)
+        cursor.execute(f"INSERT INTO {SQLITE_FTS_TABLE} ({SQLITE_FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def _query(term, limit):
+    # 1〜2文字はどちらの索引も使えないため LIKE で検索する（結果はキャッシュされる）
+    if len(term) < TRIGRAM_LENGTH:
+        return _search_like(term, limit)
+    if connection.vendor == 'postgresql':
+        return _search_postgresql(term, limit)
+    if connection.vendor == 'sqlite':
+        return _search_sqlite_fts(term, limit)
+    return _search_like(term, limit)
+
+
+def _as_result(order):
+    return {'issue_no': order.issue_no, 'site': order.site, 'address': order.site_address}
+
+
+def _search(term, limit):
+    return [_as_result(o) for o in _query(term, limit)]
+
+
+async def _asearch(term, limit):
+    return [_as_result(o) async for o in _query(term, limit)]
+
+
+def _like_escape(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _search_postgresql(term, limit):
+    """pg_trgm の GIN 索引（site, issue_no）を使った部分一致検索。類似度で並べる"""
+    pattern = _like_escape(term)
+    return Order.objects.raw(
+        """
+        SELECT issue_no, site, site_address FROM orders_order
+        WHERE site ILIKE %s OR issue_no LIKE %s
+        ORDER BY CASE WHEN issue_no LIKE %s THEN 0 WHEN site ILIKE %s THEN 1 ELSE 2 END,
+                 similarity(site, %s) DESC, site
+        LIMIT %s
+        """,
+        [f'%{pattern}%', f'%{pattern}%', f'{pattern}%', f'{pattern}%', term, limit],
+    )
+
+
+def _search_sqlite_fts(term, limit):
+    """FTS5（trigram）の全文検索テーブルを使った部分一致検索。bm25 で並べる"""
+    pattern = _like_escape(term)
+    return Order.objects.raw(
+        f"""
+        SELECT o.issue_no, o.site, o.site_address FROM {SQLITE_FTS_TABLE} s
+        JOIN orders_order o ON o.rowid = s.rowid
+        WHERE {SQLITE_FTS_TABLE} MATCH %s
+        ORDER BY CASE WHEN o.issue_no LIKE %s ESCAPE '\\' THEN 0
+                      WHEN o.site LIKE %s ESCAPE '\\' THEN 1 ELSE 2 END,
+                 bm25({SQLITE_FTS_TABLE}), o.site
+        LIMIT %s
+        """,
+        ['"' + term.replace('"', '""') + '"', f'{pattern}%', f'{pattern}%', limit],
+    )
+
+
+def _search_like(term, limit):
+    """索引が使えない短い検索語・その他のDB向けの LIKE 検索"""
+    return (
+        Order.objects.filter(Q(site__icontains=term) | Q(issue_no__icontains=term))
+        .annotate(rank=Case(
+            When(issue_no__startswith=term, then=Value(0)),
+            When(site__startswith=term, then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField(),
+        ))
+        .only('issue_no', 'site', 'site_address')
+        .order_by('rank', 'site')[:limit]
+    )
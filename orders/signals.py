@@ -0,0 +1,116 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import metrics
+from .broadcast import publish
+from .counters import rebuild_counters
+from .middleware import invalidate_system_config
+from .models import Order, OrderPlan, Shipment, Staff, SystemConfig, UnitPriceMaster, User
+from .pricing import invalidate_price_table
+from .progress import mark_contracts_dirty
+from .rollups import mark_dates_dirty, mark_orders_dirty
+from .search import invalidate_search_cache, sync_sqlite_search_index
+from .stamps import ORDER_TABLE, PLAN_TABLE, STAFF_TABLE, touch_tables
+
+
+@receiver(connection_created)
+def install_query_metrics(sender, connection, **kwargs):
+    """DB接続のたびに SQL の計測を登録する（リクエストごとの SQL件数・DB時間の集計用）"""
+    metrics.install(connection)
+
+
+@receiver(post_migrate)
+def search_index_after_migrate(sender, using, **kwargs):
+    """マイグレーション後に SQLite の全文検索テーブルを作り直す（受注テーブルの作り直しで rowid・トリガーが変わるため）"""
+    if sender.name == 'orders':
+        sync_sqlite_search_index(using)
+
+
+@receiver([post_save, post_delete], sender=UnitPriceMaster)
+def unit_price_changed(sender, **kwargs):
+    """単価マスタの追加・編集・削除で単価キャッシュを破棄"""
+    invalidate_price_table()
+
+
+@receiver([post_save, post_delete], sender=SystemConfig)
+def system_config_changed(sender, **kwargs):
+    """システム設定（staff_management・管理画面）の保存でタイムアウト値を読み直させる"""
+    invalidate_system_config()
+
+
+@receiver([post_save, post_delete], sender=Order)
+def order_changed(sender, instance, **kwargs):
+    """受注の追加・編集・削除でオートコンプリートのキャッシュを破棄し、その契約の日別集計・進捗を再計算させる"""
+    invalidate_search_cache()
+    mark_orders_dirty([instance.pk])
+    mark_contracts_dirty([instance.pk])
+    touch_tables(ORDER_TABLE)
+
+
+@receiver(pre_delete, sender=Order)
+def order_deleting(sender, instance, **kwargs):
+    """受注の削除前に、削除で契約NOが外れる予定（OrderPlan.order は SET_NULL）を控える"""
+    instance._detached_plans = list(OrderPlan.objects.filter(order=instance).values_list('pk', 'plan_date'))
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    """
+    SET_NULL の一括更新では予定のシグナルも更新日時も動かないため、ここで予定の変更として扱う
+    （get_plans の ETag・plan_feed の since・その日の日別集計に反映し、ボードへ通知する）
+    """
+    plans = getattr(instance, '_detached_plans', None)
+    if not plans:
+        return
+    ids = [pk for pk, _ in plans]
+    OrderPlan.objects.filter(pk__in=ids).update(updated_at=timezone.now())
+    mark_dates_dirty({plan_date for _, plan_date in plans})
+    touch_tables(PLAN_TABLE)
+    for plan in OrderPlan.objects.filter(pk__in=ids):
+        publish('plan', plan.to_board_dict())
+
+
+@receiver(post_save, sender=OrderPlan)
+def plan_saved(sender, instance, **kwargs):
+    """予定の保存を他の端末のボードへ通知"""
+    publish('plan', instance.to_board_dict())
+
+
+@receiver([post_save, post_delete], sender=OrderPlan)
+def plan_changed(sender, instance, **kwargs):
+    """予定台数の変更でその日の日別集計を、予定数量の変更でその契約（付け替えた場合は元の契約も）の進捗を再計算させる"""
+    mark_dates_dirty([instance.plan_date])
+    mark_contracts_dirty([instance.order_id, getattr(instance, '_loaded_order_id', None)])
+    touch_tables(PLAN_TABLE)
+
+
+@receiver([post_save, post_delete], sender=Staff)
+@receiver([post_save, post_delete], sender=User)
+def staff_changed(sender, update_fields=None, **kwargs):
+    """担当者（表示名）の変更で受注一覧の ETag を無効にする（ログイン時の最終ログイン日時の更新は除く）"""
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    touch_tables(STAFF_TABLE)
+
+
+@receiver([post_save, post_delete], sender=Shipment)
+def shipment_changed(sender, instance, signal, **kwargs):
+    """出荷実績の登録・削除を同じ契約の出荷画面へ通知"""
+    publish('shipment', {
+        'id': instance.pk,
+        'issue_no': instance.issue_no,
+        'date': str(instance.ship_date),
+        'car_no': instance.car_no,
+        'ship_qty': instance.ship_qty,
+        'deleted': signal is post_delete,
+    })
+
+
+@receiver(post_delete, sender=Shipment)
+def shipment_deleted(sender, instance, **kwargs):
+    """出荷実績の削除時はその契約のカウンタを再集計し、その日の日別集計・契約の進捗を再計算させる（削除と同じトランザクション内）"""
+    rebuild_counters([instance.issue_no])
+    mark_dates_dirty([instance.ship_date])
+    mark_contracts_dirty([instance.issue_no])
@@ -0,0 +1,104 @@
+import datetime
+
+import numpy as np
+
+from .models import DailyContractRollup
+from .pricing import get_price_table
+from .reports import FULL_LOAD
+
+# 単価の試算（単価マスタを変えた場合の過去の売上との差）
+# 日別集計（DailyContractRollup）の全行を配列にして、contract_report と同じ回転数計算・単価の適用を一度に行う
+
+
+def load_contract_days(start, end):
+    """
+    期間内の（出荷日, 契約NO）ごとの集計を列ごとの配列で返す
+    {'date', 'issue_no', 'customer': object配列, 'night': bool, 'ship_count', 'truck_planned': int, 'short_diff': float}
+    """
+    from .rollups import refresh_rollups
+    refresh_rollups(start, end)
+    rows = list(
+        DailyContractRollup.objects.filter(ship_date__range=(start, end))
+        .order_by('ship_date', 'issue_no')
+        .values_list('ship_date', 'issue_no', 'customer', 'night', 'ship_count', 'truck_planned', 'short_diff')
+    )
+    columns = list(zip(*rows)) or [()] * 7
+    return {
+        'date': np.array(columns[0], dtype=object),
+        'issue_no': np.array(columns[1], dtype=object),
+        'customer': np.array(columns[2], dtype=object),
+        'night': np.array(columns[3], dtype=bool),
+        'ship_count': np.array(columns[4], dtype=np.int64),
+        # 予定が無い日は1台として割り振る（aggregate_contract_days と同じ）
+        'truck_planned': np.maximum(np.array(columns[5], dtype=np.int64), 1),
+        'short_diff': np.array(columns[6], dtype=np.float64),
+    }
+
+
+def price_array(prices, max_rotation):
+    """単価表 {(夜間か, 回転数, 空積か): 単価} を [夜間か, 回転数, 空積か] の配列にする（未登録は0円）"""
+    table = np.zeros((2, max_rotation + 1, 2), dtype=np.float64)
+    for (night, rotation, empty), price in prices.items():
+        if 0 <= rotation <= max_rotation:
+            table[int(night), rotation, int(empty)] = price or 0
+    return table
+
+
+def contract_day_amounts(days, prices):
+    """
+    契約・日ごとの金額の配列（contract_report の3行の 数量 × 単価 の合計と同じ値）
+    rotation_split と同じく、N台を予定台数 k で割り振って L/M 回転の回数 X/Y を求める
+    """
+    n, k = days['ship_count'], days['truck_planned']
+    short_diff, night = days['short_diff'], days['night'].astype(np.int64)
+    q, r = np.divmod(n, k)
+    L = q + (r > 0)
+    M = q
+    X = (q + 1) * r
+    Y = q * (k - r)
+
+    table = price_array(prices, int(L.max(initial=0)))
+    return (
+        (X * FULL_LOAD - short_diff) * table[night, L, 0]
+        + Y * FULL_LOAD * table[night, M, 0]
+        + short_diff * table[night, L, 1]
+    )
+
+
+def _group_totals(keys, current, candidate):
+    """キーごとの現行・試算の合計: [(キー, 現行, 試算)]（差の大きい順）"""
+    labels, index = np.unique(keys.astype(str), return_inverse=True)
+    current_sum = np.bincount(index, weights=current, minlength=len(labels))
+    candidate_sum = np.bincount(index, weights=candidate, minlength=len(labels))
+    order = np.argsort(-np.abs(candidate_sum - current_sum), kind='stable')
+    return [(labels[i], float(current_sum[i]), float(candidate_sum[i])) for i in order]
+
+
+def simulate_prices(candidate, start, end, prices=None):
+    """
+    期間内の売上を現行の単価表と候補の単価表で計算し、差を返す
+    candidate: 候補の単価表（get_price_table と同じ形式） / prices: 比較元（省略時は現行の単価表）
+    戻り値: {'days', 'current', 'candidate', 'customers': [(得意先, 現行, 試算)], 'months': [(年月, 現行, 試算)]}
+    """
+    days = load_contract_days(start, end)
+    current_amounts = contract_day_amounts(days, get_price_table() if prices is None else prices)
+    candidate_amounts = contract_day_amounts(days, candidate)
+    months = np.array([d.strftime('%Y-%m') for d in days['date']], dtype=object)
+    return {
+        'days': len(current_amounts),
+        'current': float(current_amounts.sum()),
+        'candidate': float(candidate_amounts.sum()),
+        'customers': _group_totals(days['customer'], current_amounts, candidate_amounts),
+        'months': sorted(_group_totals(months, current_amounts, candidate_amounts)),
+    }
+
+
+def last_twelve_months(today):
+    """昨日までの12か月（前年同月の翌日から）"""
+    end = today - datetime.timedelta(days=1)
+    try:
+        start = end.replace(year=end.year - 1) + datetime.timedelta(days=1)
+    except ValueError:
+        # 2月29日
+        start = end.replace(year=end.year - 1, day=28) + datetime.timedelta(days=1)
+    return start, end
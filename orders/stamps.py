@@ -0,0 +1,119 @@
+import functools
+import hashlib
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .models import ChangeStamp
+
+# マイグレーションで作成する基準の時刻（未記録のキーはこの時刻に変更されたものとみなす）
+INITIAL_KEY = 'init'
+
+# テーブルごとの変更時刻のキー
+ORDER_TABLE = 'order'
+PLAN_TABLE = 'plan'
+PRICE_TABLE = 'price'
+STAFF_TABLE = 'staff'
+
+
+def date_key(d):
+    # 日付（またはYYYY-MM-DD の文字列。save_plan は保存前の文字列のまま通知される）
+    return f'date:{d}'
+
+
+def table_key(name):
+    return f'table:{name}'
+
+
+def touch(keys):
+    """変更時刻を現在時刻にする（変更と同じトランザクションで呼ぶ）"""
+    now = timezone.now()
+    ChangeStamp.objects.bulk_create(
+        [ChangeStamp(key=key, changed_at=now) for key in set(keys)],
+        update_conflicts=True,
+        unique_fields=['key'],
+        update_fields=['changed_at'],
+    )
+
+
+def touch_dates(dates):
+    """出荷・予定を変更した日付の変更時刻を更新する"""
+    dates = {d for d in dates if d}
+    if dates:
+        touch(date_key(d) for d in dates)
+
+
+def touch_tables(*names):
+    touch(table_key(name) for name in names)
+
+
+def last_changed(keys):
+    """キーのうち最も新しい変更時刻（1クエリ）"""
+    return max(ChangeStamp.objects.filter(key__in=[INITIAL_KEY, *keys]).values_list('changed_at', flat=True), default=None)
+
+
+async def alast_changed(keys):
+    """last_changed の非同期版"""
+    stamps = [s async for s in ChangeStamp.objects.filter(key__in=[INITIAL_KEY, *keys]).values_list('changed_at', flat=True)]
+    return max(stamps, default=None)
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    """デプロイごとに変わる値（テンプレート・コードの変更後に以前の ETag を使わせない）"""
+    app_dir = Path(__file__).resolve().parent
+    return str(max(p.stat().st_mtime_ns for p in app_dir.rglob('*') if p.suffix in ('.py', '.html')))
+
+
+def _validators(request, user, keys, changed):
+    # 同じブラウザで別のユーザーがログインした場合に前のユーザーの画面を使わせない
+    source = '|'.join([code_version(), request.get_full_path(), str(user.pk), *sorted(keys), changed.isoformat()])
+    # Last-Modified は秒単位のため、比較に使う時刻も秒に切り捨てる（そのままでは If-Modified-Since が常に古くなる）
+    return quote_etag(hashlib.sha256(source.encode()).hexdigest()[:32]), int(changed.timestamp())
+
+
+def _finish(response, etag, last_modified):
+    if response.status_code == 200:
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        # ブラウザには保存させるが、表示のたびに変更の有無を確認させる
+        response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def conditional_on(keys_func):
+    """
+    変更時刻による条件付きGET（ETag / Last-Modified）。変更が無ければビューを実行せず 304 を返す
+    keys_func(request): 応答が依存する変更時刻のキーのリスト（None なら対象外）
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def _async_view(request, *args, **kwargs):
+                keys = keys_func(request) if request.method in ('GET', 'HEAD') else None
+                changed = await alast_changed(keys) if keys is not None else None
+                if changed is None:
+                    return await view(request, *args, **kwargs)
+                etag, last_modified = _validators(request, await request.auser(), keys, changed)
+                not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if not_modified is not None:
+                    return not_modified
+                return _finish(await view(request, *args, **kwargs), etag, last_modified)
+            return _async_view
+
+        @functools.wraps(view)
+        def _view(request, *args, **kwargs):
+            keys = keys_func(request) if request.method in ('GET', 'HEAD') else None
+            changed = last_changed(keys) if keys is not None else None
+            if changed is None:
+                return view(request, *args, **kwargs)
+            etag, last_modified = _validators(request, request.user, keys, changed)
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                return not_modified
+            return _finish(view(request, *args, **kwargs), etag, last_modified)
+        return _view
+    return decorator
@@ -1,3 +1,1198 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import functools
+import io
+import json
+import tempfile
+import threading
+from collections import Counter
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from prometheus_client import REGISTRY
+
+from django.apps import apps
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models.signals import post_migrate
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from . import archive, broadcast, exports, imports, middleware, pricing, progress, rollups, views
+from .broadcast import LocalBroadcaster
+from .search import SQLITE_FTS_TABLE, SQLITE_FTS_TRIGGER_NAMES, search_orders
+from .commitments import contract_commitments, window_contracts
+from .counters import rebuild_counters
+from .reports import build_daily_report, build_range_report, cached_daily_report, contract_report, report_facts
+from .simulation import simulate_prices
+from .models import (
+    ArchivedPeriod, ContractProgress, DailyContractRollup, Order, OrderPlan, OrderSnapshot, ProgressDirtyContract, RollupDirtyDate, Shipment, ShipmentContractCounter, ShipmentDailyCounter, Staff, SystemConfig, UnitPriceMaster, User,
+)
+from .stamps import PRICE_TABLE, touch_tables
+
+
+def make_order(**fields):
+    """テスト用の受注（契約NOは保存時に採番）"""
+    values = {
+        'site': '中央区共同住宅', 'site_address': '東京都中央区', 'customer': '山田建設', 'contractor': '山田建設',
+        'contact': '03-0000-0000', 'product': '流動化処理土', 'product_category': '標準',
+        'firstship_date': datetime.date(2025, 4, 1), 'qty': 60.0, 'rotation': 3, 'price': 10000,
+    }
+    values.update(fields)
+    return Order.objects.create(**values)
+
+
+class LoggedInTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester', password='pass')
+        self.client.force_login(self.user)
+
+
+class PlanFeedTests(LoggedInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = make_order()
+        self.day = datetime.date(2025, 5, 1)
+
+    def _plan(self, day, row_index, **fields):
+        return OrderPlan.objects.create(
+            plan_date=day, section='el', row_index=row_index, site_name='現場', order=self.order, **fields,
+        )
+
+    def _feed(self, **params):
+        return self.client.get('/orders/plans/feed/', {'start': '2025-05-01', 'end': '2025-05-07', **params})
+
+    def test_returns_plans_in_window(self):
+        self._plan(self.day, 1, plan_qty=12, truck_count=2)
+        self._plan(self.day + datetime.timedelta(days=10), 1)
+        data = self._feed().json()
+        self.assertEqual([(p['date'], p['row_index'], p['issue_no']) for p in data['plans']],
+                         [('2025-05-01', 1, self.order.issue_no)])
+        self.assertEqual(data['commitments'][self.order.issue_no]['qty'], 60.0)
+
+    def test_since_returns_only_rows_updated_after_cursor(self):
+        old = self._plan(self.day, 1)
+        self._plan(self.day, 2)
+        # 前回の取得より前に更新された行
+        OrderPlan.objects.filter(pk=old.pk).update(updated_at=timezone.now() - datetime.timedelta(hours=1))
+        since = (timezone.now() - datetime.timedelta(minutes=10)).isoformat()
+        data = self._feed(since=since).json()
+        self.assertEqual([p['row_index'] for p in data['plans']], [2])
+
+    def test_cursor_overlaps_so_late_commits_are_not_missed(self):
+        before = timezone.now()
+        data = self._feed().json()
+        cursor = datetime.datetime.fromisoformat(data['cursor'])
+        self.assertLess(cursor, before)
+        # カーソルより後に保存された行は次回の差分に含まれる
+        self._plan(self.day, 3)
+        self.assertEqual([p['row_index'] for p in self._feed(since=data['cursor']).json()['plans']], [3])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self._feed(since='yesterday').status_code, 400)
+        self.assertEqual(self.client.get('/orders/plans/feed/', {'start': '2025-05-07', 'end': '2025-05-01'}).status_code, 400)
+
+
+class PriceTableTests(TestCase):
+    def setUp(self):
+        self.item = UnitPriceMaster.objects.create(category='昼間', item_name='昼間 3回転', partition_price=20000)
+
+    def test_reuses_table_without_queries(self):
+        self.assertEqual(pricing.get_price_from_master(3, False), 20000)
+        # 確認間隔内はDBを参照しない
+        with self.assertNumQueries(0):
+            self.assertEqual(pricing.get_price_from_master(3, False), 20000)
+            self.assertEqual(pricing.get_price_from_master(2, False, prices=pricing.get_price_table()), 0)
+
+    def test_checks_only_the_stamp_after_ttl(self):
+        pricing.get_price_table()
+        # 変更が無ければ変更時刻の1行だけを読む
+        with mock.patch.object(pricing, 'PRICE_CHECK_TTL_SECONDS', -1), self.assertNumQueries(1):
+            self.assertEqual(pricing.get_price_from_master(3, False), 20000)
+
+    def test_change_from_another_process_is_picked_up_after_ttl(self):
+        pricing.get_price_table()
+        # 他のプロセスでの変更: 単価マスタと変更時刻だけが更新され、このプロセスの単価表は破棄されていない
+        UnitPriceMaster.objects.filter(pk=self.item.pk).update(partition_price=25000)
+        touch_tables(PRICE_TABLE)
+        self.assertEqual(pricing.get_price_from_master(3, False), 20000)
+        with mock.patch.object(pricing, 'PRICE_CHECK_TTL_SECONDS', -1):
+            self.assertEqual(pricing.get_price_from_master(3, False), 25000)
+
+    def test_save_invalidates(self):
+        pricing.get_price_table()
+        self.item.partition_price = 30000
+        self.item.save()
+        self.assertEqual(pricing.get_price_from_master(3, False), 30000)
+
+
+class SessionTimeoutTests(TestCase):
+    def setUp(self):
+        self.config = SystemConfig.objects.create(session_timeout_minutes=45)
+        middleware.invalidate_system_config()
+
+    def test_cached_between_requests(self):
+        self.assertEqual(middleware.get_session_timeout_minutes(), 45)
+        with self.assertNumQueries(0):
+            self.assertEqual(middleware.get_session_timeout_minutes(), 45)
+
+    def test_change_from_another_process_is_picked_up_after_ttl(self):
+        middleware.get_session_timeout_minutes()
+        # 他のプロセスでの変更（このプロセスのキャッシュは破棄されない）
+        SystemConfig.objects.filter(pk=self.config.pk).update(session_timeout_minutes=10)
+        self.assertEqual(middleware.get_session_timeout_minutes(), 45)
+        with mock.patch.object(middleware, 'CONFIG_TTL_SECONDS', -1):
+            self.assertEqual(middleware.get_session_timeout_minutes(), 10)
+
+    def test_save_invalidates(self):
+        middleware.get_session_timeout_minutes()
+        self.config.session_timeout_minutes = 20
+        self.config.save()
+        self.assertEqual(middleware.get_session_timeout_minutes(), 20)
+
+    def test_session_expiry_follows_setting(self):
+        user = User.objects.create_user('tester', password='pass')
+        self.client.force_login(user)
+        self.client.get('/orders/menu/')
+        self.assertEqual(self.client.session.get_expiry_age(), 45 * 60)
+
+
+def run_concurrently(func, threads=8):
+    """func を複数のスレッドから同時に実行し、戻り値のリストを返す（例外があれば送出）"""
+    results, errors = [], []
+    lock = threading.Lock()
+    gate = threading.Barrier(threads)
+
+    def worker():
+        try:
+            gate.wait()
+            value = func()
+            with lock:
+                results.append(value)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+class IssueNoConcurrencyTests(TransactionTestCase):
+    """同時に受注・枝番を登録しても契約NOが重複しない（採番カウンタの行ロック）"""
+
+    def test_concurrent_orders_get_unique_issue_nos(self):
+        make_order(issue_no='', site='既存')
+
+        def create():
+            return [make_order().issue_no for _ in range(5)]
+
+        issue_nos = [no for batch in run_concurrently(create) for no in batch] + list(
+            Order.objects.filter(site='既存').values_list('issue_no', flat=True))
+        self.assertEqual(len(issue_nos), 41)
+        self.assertEqual([no for no, n in Counter(issue_nos).items() if n > 1], [])
+        self.assertEqual(Order.objects.count(), 41)
+        # 連番は既存の番号の次から欠番なく払い出される
+        seqs = sorted(int(no[2:6]) for no in issue_nos)
+        self.assertEqual(seqs, list(range(seqs[0], seqs[0] + 41)))
+
+    def test_concurrent_branches_get_unique_issue_nos(self):
+        parent = make_order()
+        base_no = parent.issue_no[:6]
+
+        def create_branch():
+            order = Order(**{f.name: getattr(parent, f.name) for f in Order._meta.concrete_fields if not f.primary_key})
+            # order_branch ビューと同じ手順（保存直前に枝番を採番）
+            order.issue_no = Order.next_branch_no(base_no)
+            order.save(force_insert=True)
+            return order.issue_no
+
+        issue_nos = run_concurrently(create_branch)
+        self.assertEqual(len(set(issue_nos)), 8)
+        self.assertEqual(sorted(issue_nos), [f'{base_no}{n}' for n in range(1, 9)])
+
+
+class OrderSearchTests(LoggedInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.a = make_order(site='中央区共同住宅新築工事')
+        self.b = make_order(site='共同住宅改修（港区）')
+        self.c = make_order(site='江東区倉庫')
+
+    def _sites(self, term):
+        return [r['site'] for r in search_orders(term)]
+
+    def test_prefix_matches_rank_first(self):
+        self.assertEqual(self._sites('共同住宅'), ['共同住宅改修（港区）', '中央区共同住宅新築工事'])
+        self.assertEqual(self._sites(self.c.issue_no), ['江東区倉庫'])
+
+    def test_short_terms(self):
+        self.assertEqual(self._sites('倉庫'), ['江東区倉庫'])
+        self.assertEqual(self._sites('区'), ['中央区共同住宅新築工事', '共同住宅改修（港区）', '江東区倉庫'])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.c.site = '江東区物流センター'
+        self.c.save()
+        self.assertEqual(self._sites('倉庫'), [])
+        self.assertEqual(self._sites('物流センター'), ['江東区物流センター'])
+        self.a.delete()
+        self.assertEqual(self._sites('共同住宅'), ['共同住宅改修（港区）'])
+
+    def test_autocomplete_view(self):
+        data = self.client.get('/orders/autocomplete/', {'term': '港区'}).json()
+        self.assertEqual(data, [{'issue_no': self.b.issue_no, 'site': self.b.site, 'address': self.b.site_address}])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite の全文検索テーブルのみ')
+class SqliteSearchIndexTests(TestCase):
+    def test_index_is_consistent_after_changes(self):
+        orders = [make_order(site=f'現場名{i}') for i in range(5)]
+        orders[1].site = '変更後の現場'
+        orders[1].save()
+        orders[2].delete()
+        with connection.cursor() as cursor:
+            # 外部コンテンツの索引と受注テーブルが一致しているか（不一致なら例外）
+            cursor.execute(f"INSERT INTO {SQLITE_FTS_TABLE} ({SQLITE_FTS_TABLE}, rank) VALUES ('integrity-check', 1)")
+            cursor.execute(f"SELECT count(*) FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH '現場名'")
+            self.assertEqual(cursor.fetchone()[0], 3)
+
+    def test_migrate_rebuilds_after_table_remake(self):
+        orders = [make_order(site=f'現場名{i}') for i in range(3)]
+        with connection.cursor() as cursor:
+            # テーブルの作り直しと同じ状態: トリガーが消え、rowid が振り直される
+            for name in SQLITE_FTS_TRIGGER_NAMES:
+                cursor.execute(f"DROP TRIGGER {name}")
+            cursor.execute("UPDATE orders_order SET rowid = rowid + 100")
+        post_migrate.send(
+            sender=apps.get_app_config('orders'), app_config=apps.get_app_config('orders'),
+            verbosity=0, interactive=False, using='default', apps=apps, plan=[],
+        )
+        orders[0].delete()
+        make_order(site='現場名追加')
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {SQLITE_FTS_TABLE} ({SQLITE_FTS_TABLE}, rank) VALUES ('integrity-check', 1)")
+        self.assertEqual(
+            sorted(r['site'] for r in search_orders('現場名')),
+            ['現場名1', '現場名2', '現場名追加'],
+        )
+
+
+class OrderListTests(LoggedInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.staff = Staff.objects.create(user=User.objects.create_user('coord', display_name='担当一'))
+        # 2500010〜2500070（奇数番目は A建設・担当者あり）と 2400010
+        for i in range(1, 8):
+            make_order(
+                issue_no=f'25000{i}0', customer='A建設' if i % 2 else 'B工業',
+                coordinator=self.staff if i % 2 else None,
+            )
+        make_order(issue_no='2400010', customer='A建設')
+        patcher = mock.patch.object(views, 'ORDER_PAGE_SIZE', 3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _page(self, **params):
+        response = self.client.get('/orders/', params)
+        self.assertEqual(response.status_code, 200)
+        context = response.context
+        return [o.issue_no for o in context['orders']], context['prev_before'], context['next_after']
+
+    def test_pages_forward_to_the_last_page(self):
+        self.assertEqual(self._page(), (['2500070', '2500060', '2500050'], '', '2500050'))
+        self.assertEqual(self._page(after='2500050'), (['2500040', '2500030', '2500020'], '2500040', '2500020'))
+        self.assertEqual(self._page(after='2500020'), (['2500010', '2400010'], '2500010', ''))
+
+    def test_pages_back_to_the_first_page(self):
+        self.assertEqual(self._page(before='2500010'), (['2500040', '2500030', '2500020'], '2500040', '2500020'))
+        # 先頭ページに戻ったら「前へ」は出ない
+        self.assertEqual(self._page(before='2500040'), (['2500070', '2500060', '2500050'], '', '2500050'))
+
+    def test_full_last_page_has_no_next(self):
+        make_order(issue_no='2300010')
+        self.assertEqual(self._page(after='2500020'), (['2500010', '2400010', '2300010'], '2500010', ''))
+
+    def test_empty_page(self):
+        self.assertEqual(self._page(after='2300010'), ([], '', ''))
+        response = self.client.get('/orders/', {'customer': '該当なし'})
+        self.assertEqual(list(response.context['orders']), [])
+        self.assertContains(response, '該当する受注がありません')
+
+    def test_filters_with_cursor(self):
+        self.assertEqual(self._page(customer='A建設'), (['2500070', '2500050', '2500030'], '', '2500030'))
+        self.assertEqual(self._page(customer='A建設', after='2500030'), (['2500010', '2400010'], '2500010', ''))
+        self.assertEqual(self._page(customer='A建設', before='2500010'), (['2500070', '2500050', '2500030'], '', '2500030'))
+        self.assertEqual(
+            self._page(year='2025', coordinator=str(self.staff.pk), after='2500050'), (['2500030', '2500010'], '2500030', ''),
+        )
+        self.assertEqual(self._page(year='2024'), (['2400010'], '', ''))
+        # ページ送りのリンクに絞り込み条件が引き継がれる
+        self.assertContains(self.client.get('/orders/', {'customer': 'A建設'}), '?after=2500030&customer=A%E5%BB%BA%E8%A8%AD')
+
+    def test_query_count_does_not_depend_on_rows(self):
+        # 1回目はセッションの有効期限を書き込む
+        self.client.get('/orders/')
+        # セッション・ユーザー・変更時刻・受注（担当者を結合）・担当者一覧
+        with self.assertNumQueries(5):
+            self.client.get('/orders/')
+        for i in range(3):
+            Staff.objects.create(user=User.objects.create_user(f'coord{i}'))
+        Order.objects.update(coordinator=None)
+        for i, staff in enumerate(Staff.objects.all()):
+            Order.objects.filter(issue_no=f'25000{7 - i}0').update(coordinator=staff)
+        with self.assertNumQueries(5):
+            self.client.get('/orders/')
+
+
+class BulkPlanSaveTests(LoggedInTestCase):
+    def setUp(self):
+        super().setUp()
+        # ボードと同じく CSRF トークンを送る
+        self.client = Client(enforce_csrf_checks=True)
+        self.client.force_login(self.user)
+        self.client.get('/orders/schedule/')
+        self.token = self.client.cookies['csrftoken'].value
+        self.order = make_order(qty=30.0)
+
+    def _save(self, rows, **headers):
+        return self.client.post(
+            '/orders/plans/bulk_save/', json.dumps({'rows': rows}), content_type='application/json', **headers,
+        )
+
+    def _row(self, row_index, **fields):
+        return {'date': '2099-05-01', 'section': 'el', 'row_index': row_index, 'site': '現場', **fields}
+
+    def test_requires_csrf_token(self):
+        self.assertEqual(self._save([self._row(1)]).status_code, 403)
+        self.assertFalse(OrderPlan.objects.exists())
+
+    def test_upserts_rows(self):
+        OrderPlan.objects.create(plan_date=datetime.date(2099, 5, 1), section='el', row_index=1, site_name='旧')
+        response = self._save([
+            self._row(1, site='更新', qty='12', truck='2', issue_no=self.order.issue_no),
+            self._row(2, site='新規'),
+            # 同じ行が複数回含まれる場合は後の編集を採用
+            self._row(2, site='新規（再編集）'),
+        ], HTTP_X_CSRFTOKEN=self.token)
+        data = response.json()
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual([r['status'] for r in data['results']], ['success'] * 3)
+        plans = {p.row_index: p for p in OrderPlan.objects.all()}
+        self.assertEqual(len(plans), 2)
+        self.assertEqual((plans[1].site_name, plans[1].plan_qty, plans[1].truck_count, plans[1].order_id),
+                         ('更新', 12.0, 2, self.order.issue_no))
+        self.assertEqual(plans[2].site_name, '新規（再編集）')
+        self.assertEqual(data['commitments'][self.order.issue_no]['planned'], 12.0)
+        self.assertEqual(data['over'], [])
+
+    def test_reports_invalid_rows_and_over_commitment(self):
+        response = self._save([
+            {'date': 'x', 'section': 'el', 'row_index': 1},
+            self._row(3, qty='36', issue_no=self.order.issue_no),
+        ], HTTP_X_CSRFTOKEN=self.token)
+        data = response.json()
+        self.assertEqual(data['status'], 'error')
+        self.assertEqual([r['status'] for r in data['results']], ['error', 'success'])
+        self.assertEqual(data['over'], [self.order.issue_no])
+        self.assertEqual(OrderPlan.objects.count(), 1)
+
+
+class EventStreamTests(LoggedInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.async_client.force_login(self.user)
+        self.broadcaster = LocalBroadcaster()
+        patcher = mock.patch.object(broadcast, '_broadcaster', self.broadcaster)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def _subscribe(self):
+        async def subscribe():
+            return self.broadcaster.subscribe()
+        return self.loop.run_until_complete(subscribe())
+
+    def _received(self, sub):
+        # 配信はイベントループのスレッドで行われる
+        self.loop.run_until_complete(asyncio.sleep(0))
+        events = []
+        while not sub.queue.empty():
+            events.append(sub.queue.get_nowait())
+        return events
+
+    def test_publish_is_sent_on_commit(self):
+        sub = self._subscribe()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                broadcast.publish('shipment', {'issue_no': '2500010'})
+                self.assertEqual(self._received(sub), [])
+        self.assertEqual(self._received(sub), [('shipment', {'issue_no': '2500010'})])
+
+    def test_rollback_suppresses_event(self):
+        sub = self._subscribe()
+        order = make_order()
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(DatabaseError), transaction.atomic():
+                OrderPlan.objects.create(plan_date=datetime.date(2025, 5, 1), section='el', row_index=1, order=order)
+                raise DatabaseError('rollback')
+            OrderPlan.objects.create(plan_date=datetime.date(2025, 5, 2), section='el', row_index=1, order=order)
+        self.assertEqual([(event, data['date']) for event, data in self._received(sub)], [('plan', '2025-05-02')])
+
+    def test_invalid_dates(self):
+        for params in [{'start': '2025-05-01'}, {'start': '5/1', 'end': '2025-05-07'},
+                       {'start': '2025-02-30', 'end': '2025-03-01'}, {'start': '2025-05-07', 'end': '2025-05-01'}]:
+            self.assertEqual(self.client.get('/orders/stream/', params).status_code, 400, params)
+        # WSGI では接続を保持しない
+        self.assertEqual(self.client.get('/orders/stream/', {'start': '2025-05-01', 'end': '2025-05-07'}).status_code, 204)
+        self.assertEqual(self.client.get('/orders/stream/', {'issue_no': '2500010'}).status_code, 204)
+
+    async def test_stream_filters_by_date_window(self):
+        response = await self.async_client.get('/orders/stream/', {'start': '2025-05-01', 'end': '2025-05-07'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+        for day in ['2025-04-30', '2025-05-08', '2025-05-07']:
+            self.broadcaster.publish('plan', {'date': day})
+        self.broadcaster.publish('shipment', {'issue_no': '2500010'})
+        self.broadcaster.publish('plan', {'date': '2025-05-01'})
+        received = [await asyncio.wait_for(anext(stream), 5) for _ in range(2)]
+        self.assertEqual(received, [
+            b'event: plan\ndata: {"date": "2025-05-07"}\n\n',
+            b'event: plan\ndata: {"date": "2025-05-01"}\n\n',
+        ])
+        await stream.aclose()
+
+
+def make_shipment(order, ship_date, ship_qty=6.0, car_no='1', **fields):
+    shipment = Shipment(issue_no=order.issue_no, ship_date=ship_date, ship_qty=ship_qty, car_no=car_no, **fields)
+    shipment.save()
+    return shipment
+
+
+def counter_state():
+    """出荷カウンタの全行（比較用）"""
+    daily = set(ShipmentDailyCounter.objects.values_list(
+        'issue_no', 'ship_date', 'unit_count', 'qty_sum', 'last_car_no', 'last_shipment_id'))
+    contracts = set(ShipmentContractCounter.objects.values_list('issue_no', 'unit_count', 'qty_sum', 'last_ship_date'))
+    return daily, contracts
+
+
+class ShipmentCounterTests(TestCase):
+    def setUp(self):
+        self.a, self.b = make_order(), make_order()
+        self.day = datetime.date(2025, 5, 1)
+
+    def assertMatchesRebuild(self):
+        incremental = counter_state()
+        rebuild_counters()
+        self.assertEqual(counter_state(), incremental)
+
+    def test_incremental_counters_match_rebuild(self):
+        make_shipment(self.a, self.day, 6.0, '1')
+        make_shipment(self.a, self.day, 4.5, '2')
+        make_shipment(self.a, self.day + datetime.timedelta(days=1), 6.0, '3')
+        make_shipment(self.b, self.day, 5.0, '7')
+        self.assertEqual(
+            ShipmentDailyCounter.objects.values_list('unit_count', 'qty_sum', 'last_car_no')
+            .get(issue_no=self.a.issue_no, ship_date=self.day),
+            (2, 10.5, '2'),
+        )
+        self.assertEqual(
+            ShipmentContractCounter.objects.values_list('unit_count', 'qty_sum', 'last_ship_date').get(issue_no=self.a.issue_no),
+            (3, 16.5, self.day + datetime.timedelta(days=1)),
+        )
+        self.assertMatchesRebuild()
+
+    def test_edit_and_delete_keep_counters_consistent(self):
+        moved = make_shipment(self.a, self.day, 6.0, '1')
+        deleted = make_shipment(self.a, self.day, 3.0, '2')
+        make_shipment(self.a, self.day, 6.0, '3')
+        # 別の契約・別の日に付け替え、1件を削除
+        moved.issue_no = self.b.issue_no
+        moved.ship_date = self.day + datetime.timedelta(days=2)
+        moved.save()
+        deleted.delete()
+        self.assertEqual(
+            ShipmentContractCounter.objects.values_list('unit_count', 'qty_sum').get(issue_no=self.a.issue_no), (1, 6.0))
+        self.assertMatchesRebuild()
+
+
+class CounterMigrationTests(TransactionTestCase):
+    """0005 のカウンタ作成は、その時点のモデルだけで既存の出荷から集計する"""
+
+    def test_builds_counters_from_existing_shipments(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('orders', '0004_order_search_index')])
+        old_apps = executor.loader.project_state([('orders', '0004_order_search_index')]).apps
+        OldShipment = old_apps.get_model('orders', 'Shipment')
+        day = datetime.date(2025, 5, 1)
+        for issue_no, ship_date, qty, car_no in [
+            ('2500010', day, 6.0, '1'), ('2500010', day, 4.0, '2'), ('2500010', day + datetime.timedelta(days=1), 6.0, '3'),
+            ('2500020', day, 5.0, '9'),
+        ]:
+            OldShipment.objects.create(issue_no=issue_no, ship_date=ship_date, ship_qty=qty, car_no=car_no)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        self.assertEqual(
+            ShipmentDailyCounter.objects.values_list('unit_count', 'qty_sum', 'last_car_no').get(issue_no='2500010', ship_date=day),
+            (2, 10.0, '2'),
+        )
+        self.assertEqual(
+            set(ShipmentContractCounter.objects.values_list('issue_no', 'unit_count', 'qty_sum', 'last_ship_date')),
+            {('2500010', 3, 16.0, day + datetime.timedelta(days=1)), ('2500020', 1, 5.0, day)},
+        )
+
+
+class OrderSnapshotTests(TestCase):
+    def setUp(self):
+        self.order = make_order(rotation=3.0, water=1.5, night=True)
+
+    def test_same_contents_share_one_row(self):
+        values = OrderSnapshot.values_from_order(self.order)
+        first = OrderSnapshot.intern(self.order.issue_no, values)
+        # フォームの入力値（文字列）も同じ型に揃えてから比較する
+        posted = {**values, 'rotation': '3', 'price': str(values['price'])}
+        self.assertEqual(OrderSnapshot.intern(self.order.issue_no, posted).pk, first.pk)
+        self.assertEqual(OrderSnapshot.objects.count(), 1)
+
+    def test_changed_contents_create_new_row(self):
+        first = OrderSnapshot.intern(self.order.issue_no, OrderSnapshot.values_from_order(self.order))
+        self.order.site = '変更後の現場'
+        self.order.save()
+        changed = OrderSnapshot.intern(self.order.issue_no, OrderSnapshot.values_from_order(self.order))
+        self.assertNotEqual(changed.pk, first.pk)
+        self.assertEqual(OrderSnapshot.objects.get(pk=first.pk).site, '中央区共同住宅')
+        # 内容が同じでも契約NOが違えば別の行
+        other = OrderSnapshot.intern('2500020', OrderSnapshot.values_from_order(self.order))
+        self.assertEqual(OrderSnapshot.objects.count(), 3)
+        self.assertNotEqual(other.pk, changed.pk)
+
+    def test_concurrent_insert_returns_existing_row(self):
+        values = OrderSnapshot.values_from_order(self.order)
+        existing = OrderSnapshot.intern(self.order.issue_no, values)
+        # 他の接続が検索と作成の間に同じ内容の行を作成した場合（作成は一意制約違反になる）
+        not_found = mock.Mock(**{'first.return_value': None})
+        with mock.patch.object(OrderSnapshot.objects, 'filter', return_value=not_found):
+            self.assertEqual(OrderSnapshot.intern(self.order.issue_no, values).pk, existing.pk)
+        self.assertEqual(OrderSnapshot.objects.count(), 1)
+
+
+class SnapshotMigrationTests(TransactionTestCase):
+    """0008 は出荷のコピー項目を内容ごとにまとめ、OrderSnapshot.make_digest と同じハッシュを付ける"""
+
+    def test_collapses_copied_fields_with_model_digest(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('orders', '0007_backfill_shipment_order')])
+        old_apps = executor.loader.project_state([('orders', '0007_backfill_shipment_order')]).apps
+        OldShipment = old_apps.get_model('orders', 'Shipment')
+        copied = {
+            'site': '中央区共同住宅', 'site_address': '東京都中央区', 'customer': '山田建設', 'coordinator': '担当一',
+            'product': '流動化処理土', 'note': '備考', 'rotation': 3.0, 'price': 12000, 'material_soil': None,
+            'water': 1.5, 'night': True,
+        }
+        day = datetime.date(2025, 5, 1)
+        for issue_no, changes in [('2500010', {}), ('2500010', {}), ('2500010', {'price': 13000}), ('2500020', {})]:
+            OldShipment.objects.create(issue_no=issue_no, ship_date=day, **{**copied, **changes})
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        self.assertEqual(OrderSnapshot.objects.count(), 3)
+        self.assertEqual(
+            sorted(Counter(Shipment.objects.values_list('snapshot__issue_no', 'snapshot__price')).items()),
+            [(('2500010', 12000), 2), (('2500010', 13000), 1), (('2500020', 12000), 1)],
+        )
+        for snapshot in OrderSnapshot.objects.all():
+            values = {f: getattr(snapshot, f) for f in OrderSnapshot.FIELDS}
+            self.assertEqual(snapshot.digest, OrderSnapshot.make_digest(snapshot.issue_no, values))
+            # 移行後に同じ内容で出荷しても、移行で作った行が使われる
+            self.assertEqual(OrderSnapshot.intern(snapshot.issue_no, values).pk, snapshot.pk)
+        self.assertEqual(OrderSnapshot.objects.count(), 3)
+
+
+class ShipmentImportTests(LoggedInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = Client(enforce_csrf_checks=True)
+        self.client.force_login(self.user)
+        self.client.get('/orders/menu/')
+        self.token = self.client.cookies['csrftoken'].value
+        self.a, self.b = make_order(qty=30.0), make_order()
+        self.day = datetime.date(2025, 5, 1)
+        make_shipment(self.a, self.day, 6.0, '1')
+
+    def _upload(self, lines, **headers):
+        body = '\n'.join(['issue_no,ship_date,ship_time,ship_qty,car_no', *lines]).encode()
+        return self.client.post(
+            '/orders/shipment/import/', {'file': SimpleUploadedFile('log.csv', body)}, **headers,
+        )
+
+    def test_requires_csrf_token(self):
+        response = self._upload([f'{self.a.issue_no},2025-05-01,08:00,6,2'])
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Shipment.objects.count(), 1)
+
+    def test_totals_continue_from_existing_shipments(self):
+        response = self._upload([
+            f'{self.a.issue_no},2025-05-01,08:00,6,2',
+            f'{self.b.issue_no},2025-05-01,08:10,5,7',
+            '9999999,2025-05-01,08:20,6,3',
+            f'{self.a.issue_no},2025-05-01,08:30,,4',
+            f'{self.a.issue_no},2025-05-01,08:40,abc,5',
+        ], HTTP_X_CSRFTOKEN=self.token)
+        data = response.json()
+        self.assertEqual((data['status'], data['created'], data['error_count']), ('error', 3, 2))
+        self.assertEqual([e['line'] for e in data['errors']], [4, 6])
+        self.assertEqual(
+            list(Shipment.objects.filter(issue_no=self.a.issue_no).order_by('id')
+                 .values_list('total_unit', 'total_ship_qty', 'before_car_no', 'remaining_qty'))[1:],
+            [(2, 12.0, '1', 18.0), (3, 18.0, '2', 12.0)],
+        )
+        incremental = counter_state()
+        rebuild_counters()
+        self.assertEqual(counter_state(), incremental)
+
+    def test_reports_rows_committed_before_failure(self):
+        record = imports.record_shipments
+        calls = []
+
+        def fail_second_chunk(created):
+            calls.append(created)
+            if len(calls) > 1:
+                raise DatabaseError('lock timeout')
+            record(created)
+
+        with mock.patch('orders.views.import_shipments', functools.partial(imports.import_shipments, chunk_size=2)), \
+                mock.patch('orders.imports.record_shipments', fail_second_chunk):
+            response = self._upload([
+                f'{self.b.issue_no},2025-05-02,08:00,6,1',
+                f'{self.b.issue_no},2025-05-02,08:10,6,2',
+                f'{self.b.issue_no},2025-05-02,08:20,6,3',
+            ], HTTP_X_CSRFTOKEN=self.token)
+        self.assertEqual(response.status_code, 400)
+        data = response.json()
+        self.assertEqual(data['created'], 2)
+        self.assertIn('2件は登録済み', data['message'])
+        self.assertEqual(Shipment.objects.filter(issue_no=self.b.issue_no).count(), 2)
+
+
+class ShipmentImportConcurrencyTests(TransactionTestCase):
+    """カウンタがまだ無い契約・日付に同時に取込んでも累計台数が重複しない"""
+
+    def test_concurrent_imports_without_counters(self):
+        order = make_order()
+
+        def run():
+            records = [
+                (n, {'issue_no': order.issue_no, 'ship_date': '2025-05-01', 'ship_qty': '6', 'car_no': str(n)})
+                for n in range(1, 6)
+            ]
+            return imports.import_shipments(records).created
+
+        self.assertEqual(sum(run_concurrently(run, threads=4)), 20)
+        self.assertEqual(
+            sorted(Shipment.objects.values_list('total_unit', flat=True)), list(range(1, 21)),
+        )
+        self.assertEqual(
+            sorted(Shipment.objects.values_list('total_ship_qty', flat=True)), [6.0 * n for n in range(1, 21)],
+        )
+        incremental = counter_state()
+        rebuild_counters()
+        self.assertEqual(counter_state(), incremental)
+
+
+class ExportTests(LoggedInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.async_client.force_login(self.user)
+        staff = Staff.objects.create(user=User.objects.create_user('coord', display_name='担当一'))
+        self.a = make_order(customer='山田建設', coordinator=staff)
+        self.b = make_order(customer='佐藤工業', night=True)
+        UnitPriceMaster.objects.create(category='昼間', item_name='昼間 1回転', partition_price=15000)
+        UnitPriceMaster.objects.create(category='夜間', item_name='夜間 1回転', partition_price=18000)
+        self.day = datetime.date(2025, 5, 1)
+
+    def _rows(self, body):
+        text = body.decode('utf-8')
+        self.assertTrue(text.startswith(exports.UTF8_BOM))
+        return list(csv.reader(io.StringIO(text[1:])))
+
+    def _get(self, path, **params):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        return self._rows(b''.join(response.streaming_content))
+
+    async def _aget(self, path, **params):
+        response = await self.async_client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        return chunks, self._rows(b''.join(chunks))
+
+    def test_orders(self):
+        rows = self._get('/orders/export/orders.csv')
+        self.assertEqual(rows[0][:4], ['契約NO', '契約日', '現場名', '現場住所'])
+        coordinator = exports.ORDER_FIELDS.index('coordinator')
+        self.assertEqual([(r[0], r[coordinator]) for r in rows[1:]], [(self.a.issue_no, '担当一'), (self.b.issue_no, '')])
+        # 一覧画面と同じ絞り込み
+        self.assertEqual([r[0] for r in self._get('/orders/export/orders.csv', customer='佐藤')[1:]], [self.b.issue_no])
+
+    def test_shipments_with_and_without_snapshot(self):
+        snapshot = OrderSnapshot.intern(self.a.issue_no, OrderSnapshot.values_from_order(self.a))
+        with_snapshot = make_shipment(self.a, self.day, snapshot=snapshot)
+        without = make_shipment(self.b, self.day, 5.0, '7')
+        make_shipment(self.a, self.day + datetime.timedelta(days=1))
+        rows = self._get('/orders/export/shipments.csv', date='2025-05-01')
+        header, body = rows[0], rows[1:]
+        self.assertEqual(len(header), len(exports.SHIPMENT_FIELDS) + len(OrderSnapshot.FIELDS))
+        self.assertEqual(header[:2], ['ID', '契約NO'])
+        snapshot_cols = len(exports.SHIPMENT_FIELDS)
+        self.assertEqual([r[:3] for r in body], [
+            [str(with_snapshot.pk), self.a.issue_no, '2025-05-01'], [str(without.pk), self.b.issue_no, '2025-05-01'],
+        ])
+        self.assertEqual(body[0][snapshot_cols:snapshot_cols + 5], ['中央区共同住宅', '東京都中央区', '山田建設', '山田建設', '担当一'])
+        self.assertEqual(body[1][snapshot_cols:], [''] * len(OrderSnapshot.FIELDS))
+
+    def _expected_report(self, dates):
+        rows = []
+        for d in dates:
+            for report in build_daily_report(d):
+                for row in report['rows']:
+                    rows.append([str(v) for v in [
+                        d, report['issue_no'], report['truck_planned'], report['customer'], report['site'],
+                        row['item'], row['unit'], row['price'], row['total'],
+                    ]])
+        return rows
+
+    def test_report_across_windows(self):
+        # 7日ごとの集計の境目（7日目・8日目）と3つ目の集計範囲にまたがる
+        dates = [self.day + datetime.timedelta(days=n) for n in (0, 6, 7, 14)]
+        for d in dates:
+            make_shipment(self.a, d)
+            make_shipment(self.b, d, 4.0, '7')
+        rows = self._get('/orders/export/performance-report.csv', start='2025-05-01', end='2025-05-15')
+        self.assertEqual(rows[0], exports.REPORT_HEADER)
+        self.assertEqual(len(rows), 1 + len(dates) * 2 * 3)
+        self.assertEqual(rows[1:], self._expected_report(dates))
+
+    def test_invalid_range(self):
+        response = self.client.get('/orders/export/shipments.csv', {'start': '2025-05-02', 'end': '2025-05-01'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_asgi_streams_in_batches(self):
+        dates = [self.day + datetime.timedelta(days=n) for n in (0, 6, 7)]
+        for d in dates:
+            await sync_to_async(make_shipment)(self.a, d)
+        with mock.patch.object(exports, 'ASGI_BATCH_ROWS', 2):
+            chunks, rows = await self._aget('/orders/export/shipments.csv', start='2025-05-01', end='2025-05-08')
+            self.assertEqual(len(rows), 4)
+            self.assertEqual([r[2] for r in rows[1:]], [str(d) for d in dates])
+            # BOM と見出し・2行・1行の3回に分けて送る
+            self.assertEqual(len(chunks), 3)
+            chunks, rows = await self._aget('/orders/export/performance-report.csv', start='2025-05-01', end='2025-05-08')
+        self.assertEqual(rows[0], exports.REPORT_HEADER)
+        self.assertEqual(rows[1:], await sync_to_async(self._expected_report)(dates))
+        self.assertEqual(len(chunks), 6)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.day = datetime.date(2025, 5, 1)
+        self.next_day = self.day + datetime.timedelta(days=1)
+        self.a = make_order(customer='山田建設')
+        self.b = make_order(customer='佐藤工業', night=True)
+        OrderPlan.objects.create(order=self.a, plan_date=self.day, section='el', row_index=1, truck_count=2)
+        for qty, car_no in [(6.0, '1'), (4.5, '2'), (6.0, '3')]:
+            make_shipment(self.a, self.day, qty, car_no)
+        make_shipment(self.b, self.day, 5.0, '7')
+        make_shipment(self.a, self.next_day, 6.0, '4')
+
+    def assertRollupsMatchReports(self, *dates):
+        prices = pricing.get_price_table()
+        for d in dates:
+            rolled = [
+                contract_report(r.to_fact(), prices)
+                for r in DailyContractRollup.objects.filter(ship_date=d).order_by('issue_no')
+            ]
+            self.assertEqual(rolled, build_daily_report(d))
+
+    def test_rollups_match_daily_report(self):
+        self.assertEqual(rollups.refresh_rollups(), 2)
+        self.assertFalse(RollupDirtyDate.objects.exists())
+        self.assertRollupsMatchReports(self.day, self.next_day)
+
+        # 受注・予定・出荷の変更はその日付だけ再計算される
+        self.b.site = '港区倉庫'
+        self.b.save()
+        OrderPlan.objects.filter(order=self.a).update(truck_count=3)
+        rollups.mark_dates_dirty([self.day])
+        Shipment.objects.filter(ship_date=self.next_day).first().delete()
+        self.assertEqual(rollups.refresh_rollups(), 2)
+        self.assertRollupsMatchReports(self.day, self.next_day)
+        self.assertFalse(DailyContractRollup.objects.filter(ship_date=self.next_day).exists())
+
+    def test_range_report_totals(self):
+        report = build_range_report(self.day, self.next_day)
+        self.assertEqual(report['totals']['ship_count'], 5)
+        self.assertEqual([c['customer'] for c in report['customers']], ['佐藤工業', '山田建設'])
+        contract = report['customers'][1]['contracts'][0]
+        self.assertEqual((contract['issue_no'], contract['totals']['days']), (self.a.issue_no, 2))
+
+    def test_clean_read_does_not_open_transaction(self):
+        rollups.refresh_rollups()
+        with self.assertNumQueries(1):
+            self.assertEqual(rollups.refresh_rollups(self.day, self.next_day), 0)
+
+    def test_marker_set_again_during_refresh_is_kept(self):
+        aggregate = rollups.aggregate_contract_days
+
+        def aggregate_then_mark(start, end):
+            facts = aggregate(start, end)
+            # 集計を読んだ後に別の変更が印を付け直した場合
+            rollups.mark_dates_dirty([self.day])
+            return facts
+
+        with mock.patch('orders.rollups.aggregate_contract_days', aggregate_then_mark):
+            rollups.refresh_rollups()
+        self.assertEqual(list(RollupDirtyDate.objects.values_list('date', flat=True)), [self.day])
+        self.assertEqual(rollups.refresh_rollups(), 1)
+
+
+class CommitmentTests(TestCase):
+    def setUp(self):
+        self.today = datetime.date(2025, 5, 10)
+        self.a = make_order(qty=30.0)
+        self.b = make_order(qty=20.0)
+        # 前日までの出荷 12、当日の出荷 6（当日分は今日の予定に含まれるため出荷済みに数えない）
+        make_shipment(self.a, self.today - datetime.timedelta(days=2), 6.0)
+        make_shipment(self.a, self.today - datetime.timedelta(days=1), 6.0)
+        make_shipment(self.a, self.today, 6.0)
+        for days, qty in [(-1, 99.0), (0, 12.0), (3, 8.0)]:
+            OrderPlan.objects.create(
+                order=self.a, plan_date=self.today + datetime.timedelta(days=days), section='el', row_index=1, plan_qty=qty,
+            )
+        OrderPlan.objects.create(order=self.b, plan_date=self.today + datetime.timedelta(days=30), section='el', row_index=1, plan_qty=5.0)
+
+    def test_shipped_planned_and_remaining(self):
+        result = contract_commitments([self.a.issue_no, self.b.issue_no], today=self.today)
+        self.assertEqual(result[self.a.issue_no], {'qty': 30.0, 'shipped': 12.0, 'planned': 20.0, 'remaining': -2.0, 'over': True})
+        self.assertEqual(result[self.b.issue_no], {'qty': 20.0, 'shipped': 0.0, 'planned': 5.0, 'remaining': 15.0, 'over': False})
+
+    def test_window_contracts_in_one_query(self):
+        window = window_contracts(self.today, self.today + datetime.timedelta(days=6))
+        with self.assertNumQueries(1):
+            result = contract_commitments(window, today=self.today)
+        self.assertEqual(list(result), [self.a.issue_no])
+
+
+@override_settings(METRICS_TOKEN='secret')
+class RequestMetricsTests(LoggedInTestCase):
+    def test_requests_are_counted_and_rendered(self):
+        labels = {'view': 'menu', 'method': 'GET', 'status': '200'}
+        before = REGISTRY.get_sample_value('orders_requests_total', labels) or 0
+        self.client.get('/orders/menu/')
+        self.client.get('/orders/menu/')
+        self.assertEqual(REGISTRY.get_sample_value('orders_requests_total', labels), before + 2)
+
+        response = self.client.get('/orders/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertContains(response, 'orders_request_queries_bucket{le="0.0",method="GET",view="menu"}')
+        self.assertEqual(self.client.get('/orders/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+
+class ConditionalGetTests(LoggedInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = make_order()
+        self.day = datetime.date(2025, 5, 1)
+        make_shipment(self.order, self.day)
+
+    def assertNotModified(self, path, response):
+        again = self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        return again
+
+    def test_order_list_until_an_order_changes(self):
+        first = self.client.get('/orders/')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['Cache-Control'], 'private, no-cache')
+        self.assertNotModified('/orders/', first)
+        self.assertEqual(
+            self.client.get('/orders/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 304)
+
+        make_order(site='港区倉庫')
+        changed = self.client.get('/orders/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+
+    def test_daily_report_depends_only_on_its_date(self):
+        path = f'/orders/performance-report/?date={self.day}'
+        first = self.client.get(path)
+        make_shipment(self.order, self.day + datetime.timedelta(days=1))
+        self.assertNotModified(path, first)
+
+        make_shipment(self.order, self.day)
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_price_change_invalidates_report(self):
+        path = f'/orders/performance-report/?date={self.day}'
+        first = self.client.get(path)
+        touch_tables(PRICE_TABLE)
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_etag_is_per_user(self):
+        first = self.client.get('/orders/')
+        other = User.objects.create_user('other', password='pass')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get('/orders/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_async_view(self):
+        first = self.client.get('/orders/get_plans/')
+        self.assertEqual(first.status_code, 200)
+        self.assertNotModified('/orders/get_plans/', first)
+        OrderPlan.objects.create(order=self.order, plan_date=self.day, section='el', row_index=1)
+        self.assertEqual(self.client.get('/orders/get_plans/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_order_delete_changes_its_plans(self):
+        plan = OrderPlan.objects.create(order=self.order, plan_date=self.day, section='el', row_index=1)
+        OrderPlan.objects.filter(pk=plan.pk).update(updated_at=timezone.now() - datetime.timedelta(hours=1))
+        first = self.client.get('/orders/get_plans/')
+        since = (timezone.now() - datetime.timedelta(minutes=10)).isoformat()
+
+        def feed():
+            params = {'start': '2025-05-01', 'end': '2025-05-01', 'since': since}
+            return [(p['row_index'], p['issue_no']) for p in self.client.get('/orders/plans/feed/', params).json()['plans']]
+
+        self.assertEqual(feed(), [])
+        # 受注の削除で予定の契約NOが外れる（SET_NULL の一括更新）
+        self.order.delete()
+        self.assertEqual(self.client.get('/orders/get_plans/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+        self.assertEqual(feed(), [(1, '')])
+
+    def test_past_day_report_cache_follows_changes(self):
+        report = cached_daily_report(self.day)
+        with mock.patch('orders.reports.build_daily_report') as build:
+            self.assertEqual(cached_daily_report(self.day), report)
+        build.assert_not_called()
+        make_shipment(self.order, self.day)
+        self.assertEqual(cached_daily_report(self.day)[0]['rows'], build_daily_report(self.day)[0]['rows'])
+        self.assertNotEqual(cached_daily_report(self.day), report)
+
+
+class ArchiveTestCase(TestCase):
+    def setUp(self):
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        self.enterContext(override_settings(ARCHIVE_DIR=archive_dir.name))
+        self.order = make_order()
+        # 2022年度と2023年度の出荷・予定
+        self.day = datetime.date(2022, 6, 1)
+        self.later = datetime.date(2023, 6, 1)
+        for d in (self.day, self.day, self.later):
+            make_shipment(self.order, d)
+        for d in (self.day, self.later):
+            OrderPlan.objects.create(order=self.order, plan_date=d, section='el', row_index=1, truck_count=1)
+
+    def archived_year_counts(self):
+        start, end = archive.fiscal_year_range(2022)
+        return (
+            Shipment.objects.filter(ship_date__range=(start, end)).count(),
+            OrderPlan.objects.filter(plan_date__range=(start, end)).count(),
+        )
+
+
+class ArchiveTests(ArchiveTestCase):
+    def test_archive_and_restore(self):
+        report = build_daily_report(self.day)
+        period = archive.archive_fiscal_year(2022)
+        self.assertEqual((period.shipment_count, period.plan_count), (2, 1))
+        self.assertEqual(self.archived_year_counts(), (0, 0))
+        self.assertEqual(Shipment.objects.count(), 1)
+        # 日別集計が残るため実績管理表は変わらない
+        self.assertEqual(build_daily_report(self.day), report)
+
+        restored = archive.restore_fiscal_year(2022)
+        self.assertEqual((restored['shipment'], restored['orderplan']), (2, 1))
+        self.assertEqual(self.archived_year_counts(), (2, 1))
+        self.assertFalse(ArchivedPeriod.objects.exists())
+
+    def test_aborts_when_rows_change_during_export(self):
+        serialize = archive.serializers.serialize
+
+        def serialize_then_edit(*args, **kwargs):
+            serialize(*args, **kwargs)
+            # 書き出した後の変更（件数は変わらない）
+            shipment = Shipment.objects.filter(ship_date=self.day).first()
+            shipment.ship_qty = 3.0
+            shipment.save()
+
+        with mock.patch('orders.archive.serializers.serialize', serialize_then_edit):
+            with self.assertRaises(RuntimeError):
+                archive.archive_fiscal_year(2022)
+        self.assertEqual(self.archived_year_counts(), (2, 1))
+        self.assertTrue(Shipment.objects.filter(ship_date=self.day, ship_qty=3.0).exists())
+        self.assertFalse(ArchivedPeriod.objects.exists())
+        self.assertEqual(list(archive.archive_path(2022).parent.iterdir()), [])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'テーブル分割は PostgreSQL のみ')
+class PartitionTests(ArchiveTestCase):
+    def test_convert_archive_and_restore(self):
+        with connection.cursor() as cursor:
+            for model, field in archive.DATED_MODELS:
+                periods = archive.partition_periods(self.day, self.later, 'year')
+                archive.convert_to_partitioned(cursor, model._meta.db_table, field, periods)
+                self.assertTrue(archive.is_partitioned(cursor, model._meta.db_table))
+            cursor.execute(
+                "SELECT contype, count(*) FROM pg_constraint WHERE conrelid = 'orders_shipment'::regclass GROUP BY contype"
+            )
+            self.assertEqual(dict(cursor.fetchall()), {'p': 1, 'f': 2})
+            cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'orders_shipment'")
+            self.assertTrue({'shipment_ship_date_idx', 'shipment_issue_date_id_idx'} <= {row[0] for row in cursor.fetchall()})
+            names = {name for name, _, _ in archive.list_partitions(cursor, 'orders_shipment')}
+        self.assertEqual(names, {'orders_shipment_fy2022', 'orders_shipment_fy2023', 'orders_shipment_default'})
+        self.assertEqual(self.archived_year_counts(), (2, 1))
+
+        # 採番は既存の最大値から続き、ORM からは従来どおり id で読み書きできる
+        last_id = Shipment.objects.order_by('-id').values_list('id', flat=True).first()
+        added = make_shipment(self.order, self.later)
+        self.assertGreater(added.pk, last_id)
+        added.ship_qty = 4.0
+        added.save()
+        self.assertEqual(Shipment.objects.get(pk=added.pk).ship_qty, 4.0)
+
+        archive.archive_fiscal_year(2022)
+        with connection.cursor() as cursor:
+            names = {name for name, _, _ in archive.list_partitions(cursor, 'orders_shipment')}
+        self.assertNotIn('orders_shipment_fy2022', names)
+        self.assertEqual(self.archived_year_counts(), (0, 0))
+        self.assertEqual(Shipment.objects.count(), 2)
+
+        # 区画を削除した年度は既定の区画に戻る
+        archive.restore_fiscal_year(2022)
+        self.assertEqual(self.archived_year_counts(), (2, 1))
+
+
+class ContractProgressTests(LoggedInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.today = timezone.localdate()
+        self.order = make_order(qty=30.0)
+        for days in (-3, -2):
+            make_shipment(self.order, self.today + datetime.timedelta(days=days), 6.0)
+        for days, qty in ((2, 6.0), (5, 12.0), (9, 6.0)):
+            OrderPlan.objects.create(
+                order=self.order, plan_date=self.today + datetime.timedelta(days=days), section='el', row_index=1, plan_qty=qty,
+            )
+
+    def test_progress_numbers(self):
+        row = progress.progress_queryset(status='all').get(issue_no=self.order.issue_no)
+        self.assertEqual(
+            (row.shipped_qty, row.ship_count, row.upcoming_qty, row.remaining_qty, row.over_planned),
+            (12.0, 2, 24.0, 18.0, True),
+        )
+        # 出荷済み 12 + 予定 6 + 12 で契約数量 30 に届く（残りの予定 6 は超過）
+        self.assertEqual((row.projected_completion, row.projected_by), (self.today + datetime.timedelta(days=5), 'plan'))
+
+        response = self.client.get('/orders/progress/data/?status=all')
+        self.assertEqual([r['issue_no'] for r in response.json()['rows']], [self.order.issue_no])
+
+    def test_changes_are_picked_up(self):
+        progress.refresh_progress()
+        make_shipment(self.order, self.today, 6.0)
+        new_order = make_order()
+        rows = {r.issue_no: r for r in progress.progress_queryset(status='all')}
+        self.assertEqual(rows[self.order.issue_no].shipped_qty, 18.0)
+        self.assertIn(new_order.issue_no, rows)
+
+    def test_clean_read_does_not_open_transaction(self):
+        progress.refresh_progress()
+        with self.assertNumQueries(2):
+            list(progress.progress_queryset(status='all'))
+
+    def test_marker_set_again_during_refresh_is_kept(self):
+        refresh_batch = progress._refresh_batch
+
+        def refresh_then_mark(issue_nos):
+            refresh_batch(issue_nos)
+            progress.mark_contracts_dirty([self.order.issue_no])
+
+        with mock.patch('orders.progress._refresh_batch', refresh_then_mark):
+            progress.refresh_progress()
+        self.assertEqual(list(ProgressDirtyContract.objects.values_list('issue_no', flat=True)), [self.order.issue_no])
+        self.assertTrue(ContractProgress.objects.filter(issue_no=self.order.issue_no).exists())
+
+
+class PriceSimulationTests(TestCase):
+    def setUp(self):
+        self.day = datetime.date(2025, 5, 1)
+        self.next_month = datetime.date(2025, 6, 2)
+        for night, label in ((False, '昼間'), (True, '夜間')):
+            for rotation in range(1, 4):
+                base = (30000 if night else 20000) + rotation * 1000
+                UnitPriceMaster.objects.create(category=label, item_name=f'{label} {rotation}回転', partition_price=base)
+                UnitPriceMaster.objects.create(category=label, item_name=f'{label} {rotation}回空積', partition_price=base // 10)
+        # 予定台数ごとの割り振り: (受注, 出荷日, 予定台数, 出荷数量)
+        cases = [
+            # 5台を2台で: L=3, M=2, X=3, Y=2（空積あり）
+            (make_order(customer='山田建設'), self.day, 2, [6.0, 6.0, 4.5, 6.0, 6.0]),
+            # 夜間 4台を2台で割り切れる: L=M=2, X=0, Y=4
+            (make_order(customer='佐藤工業', night=True), self.day, 2, [6.0] * 4),
+            # 予定なし（1台扱い）: L=2, X=2, Y=0
+            (make_order(customer='佐藤工業'), self.day, 0, [6.0, 3.0]),
+            # 予定台数が出荷数より多い: L=1, M=0, X=2, Y=0
+            (make_order(customer='山田建設', night=True), self.next_month, 3, [5.0, 6.0]),
+        ]
+        for row_index, (order, ship_date, trucks, quantities) in enumerate(cases, 1):
+            if trucks:
+                OrderPlan.objects.create(order=order, plan_date=ship_date, section='el', row_index=row_index, truck_count=trucks)
+            for n, qty in enumerate(quantities):
+                make_shipment(order, ship_date, qty, str(n + 1))
+
+    def _report_totals(self, prices):
+        """contract_report の各行の 数量 × 単価 を得意先ごとに合計する"""
+        totals = Counter()
+        for fact in report_facts(self.day, self.next_month):
+            for row in contract_report(fact, prices)['rows']:
+                totals[fact['customer']] += row['total'] * row['price']
+        return totals
+
+    def assertMatchesReports(self, result, current, candidate):
+        expected_current, expected_candidate = self._report_totals(current), self._report_totals(candidate)
+        self.assertEqual(result['days'], 4)
+        self.assertEqual(result['current'], sum(expected_current.values()))
+        self.assertEqual(result['candidate'], sum(expected_candidate.values()))
+        self.assertEqual(
+            sorted(result['customers']),
+            sorted((c, expected_current[c], expected_candidate[c]) for c in expected_current),
+        )
+
+    def test_unchanged_prices(self):
+        prices = pricing.get_price_table()
+        result = simulate_prices(prices, self.day, self.next_month)
+        self.assertMatchesReports(result, prices, prices)
+        self.assertEqual(result['current'], result['candidate'])
+        self.assertEqual([m[0] for m in result['months']], ['2025-05', '2025-06'])
+
+    def test_overridden_prices(self):
+        prices = pricing.get_price_table()
+        # 昼間の3回転・夜間の空積を値上げし、夜間2回転は未登録（0円）にする
+        candidate = dict(prices)
+        for night, rotation, empty in prices:
+            if (night, rotation, empty) == (False, 3, False) or (night and empty):
+                candidate[(night, rotation, empty)] += 500
+        del candidate[(True, 2, False)]
+        self.assertMatchesReports(simulate_prices(candidate, self.day, self.next_month), prices, candidate)
+
+        # 比較元の単価表も差し替えられる
+        self.assertMatchesReports(simulate_prices(prices, self.day, self.next_month, prices=candidate), candidate, prices)
@@ -21,24 +21,52 @@ urlpatterns = [
     path('schedule/', views.schedule_board, name='schedule_board'),
     # アクセス先: http://localhost:8000/orders/get_plans/
     path('get_plans/', views.get_plans, name='get_plans'),
+    # アクセス先: http://localhost:8000/orders/plans/feed/?start=2025-01-01&end=2025-01-14
+    path('plans/feed/', views.plan_feed, name='plan_feed'),
     # アクセス先: http://localhost:8000/orders/save_plan/
     path('save_plan/', views.save_plan, name='save_plan'),
+    # アクセス先: http://localhost:8000/orders/plans/bulk_save/
+    path('plans/bulk_save/', views.save_plans_bulk, name='save_plans_bulk'),
     # アクセス先: http://localhost:8000/orders/autocomplete/
     path('autocomplete/', views.order_autocomplete, name='autocomplete'),
+    # アクセス先: http://localhost:8000/orders/stream/?start=2025-01-01&end=2025-01-14
+    path('stream/', views.event_stream, name='event_stream'),
 
     # --- 出荷入力・統計 ---
     # アクセス先: http://localhost:8000/orders/shipment/create/
     path('shipment/create/', views.shipment_create, name='shipment_create'),
     # アクセス先: http://localhost:8000/orders/shipment/stats/
     path('shipment/stats/', views.get_shipment_stats, name='get_shipment_stats'),
+    # アクセス先: http://localhost:8000/orders/shipment/import/（POST, multipart の file）
+    path('shipment/import/', views.shipment_import, name='shipment_import'),
+
+    # --- 契約の進捗 ---
+    # アクセス先: http://localhost:8000/orders/progress/?sort=-remaining_qty&status=active
+    path('progress/', views.contract_progress, name='contract_progress'),
+    # アクセス先: http://localhost:8000/orders/progress/data/?sort=projected_completion&limit=100
+    path('progress/data/', views.contract_progress_data, name='contract_progress_data'),
 
     # --- 実績管理表・単価マスタ ---
     # アクセス先: http://localhost:8000/orders/performance-report/
     path('performance-report/', views.daily_performance_report, name='daily_performance_report'),
+    # アクセス先: http://localhost:8000/orders/performance-report/range/?month=2025-01
+    path('performance-report/range/', views.range_performance_report, name='range_performance_report'),
     # アクセス先: http://localhost:8000/orders/master-setting/
     path('master-setting/', views.master_setting, name='master_setting'),
 
+    # --- CSV出力 ---
+    # アクセス先: http://localhost:8000/orders/export/orders.csv?year=2025
+    path('export/orders.csv', views.export_orders, name='export_orders'),
+    # アクセス先: http://localhost:8000/orders/export/shipments.csv?start=2025-04-01&end=2026-03-31
+    path('export/shipments.csv', views.export_shipments, name='export_shipments'),
+    # アクセス先: http://localhost:8000/orders/export/performance-report.csv?date=2025-01-01
+    path('export/performance-report.csv', views.export_performance_report, name='export_performance_report'),
+
     # orders/urls.py に追記
     path('staff-management/', views.staff_management, name='staff_management'),
     path('reset-password/<int:pk>/', views.reset_password, name='reset_password'),
+
+    # --- 計測（Prometheus 形式） ---
+    # アクセス先: http://localhost:8000/orders/metrics/
+    path('metrics/', views.request_metrics, name='request_metrics'),
 ]
\ No newline at end of file
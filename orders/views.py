@@ -1,22 +1,40 @@
+import asyncio
+import io
 import json
-import math
+import time
+from datetime import timedelta
+from urllib.parse import urlencode
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
-from django.db.models import Q, Sum
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.forms.models import model_to_dict
+from django.conf import settings
 from django.utils import timezone
-from django.db import models
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_date, parse_datetime
+from django.db import DatabaseError, transaction
 from django.contrib.auth.decorators import user_passes_test
 from .forms import StaffForm, SystemConfigForm
 
 # モデルとフォームのインポート（UnitPriceMasterを追加）
-from .models import Order, OrderPlan, Shipment, UnitPriceMaster
+from .models import Order, OrderPlan, OrderSnapshot, UnitPriceMaster
+from .models import ShipmentContractCounter, ShipmentDailyCounter
 from .forms import OrderForm, ShipmentForm
-
-from .models import User, SystemConfig 
-from django.contrib.auth import get_user_model
+from . import metrics
+from .broadcast import get_broadcaster, publish
+from .commitments import acontract_commitments, contract_commitments, window_contracts
+from .exports import csv_response, order_rows, report_rows, shipment_rows
+from .imports import ImportResult, detect_format, import_shipments, read_records
+from .pricing import invalidate_price_table
+from .progress import PROGRESS_FILTERS, PROGRESS_SORT_FIELDS, mark_contracts_dirty, progress_queryset
+from .reports import build_range_report, cached_daily_report, daily_report_keys
+from .rollups import mark_dates_dirty
+from .search import asearch_orders
+from .stamps import ORDER_TABLE, PLAN_TABLE, STAFF_TABLE, conditional_on, table_key, touch_tables
+
+from .models import User, Staff, SystemConfig 
 
 # --- 基本画面 ---
 @login_required
@@ -30,11 +48,61 @@ def schedule_board(request):
     return render(request, 'orders/schedule_board.html')
 
 # --- 受注管理 ---
+# 受注一覧の1ページあたりの件数
+ORDER_PAGE_SIZE = 50
+
+def _order_filters(request):
+    """受注一覧の絞り込み条件（契約年・得意先・担当者）"""
+    return {k: request.GET.get(k, '').strip() for k in ('year', 'customer', 'coordinator')}
+
+def _filter_orders(orders, filters):
+    if filters['year'].isdigit():
+        # 契約NOの先頭2桁が西暦の下2桁
+        orders = orders.filter(issue_no__startswith=filters['year'][-2:])
+    if filters['customer']:
+        orders = orders.filter(customer__icontains=filters['customer'])
+    if filters['coordinator'].isdigit():
+        orders = orders.filter(coordinator_id=filters['coordinator'])
+    return orders
+
 @login_required
+@conditional_on(lambda request: [table_key(ORDER_TABLE), table_key(STAFF_TABLE)])
 def order_list(request):
-    """受注案件一覧"""
-    orders = Order.objects.all().order_by('-issue_no')
-    return render(request, 'orders/order_list.html', {'orders': orders})
+    """
+    受注案件一覧（契約NOの降順、キーセット方式のページ送り）
+    after/before: 前ページ末尾・次ページ先頭の契約NO
+    year/customer/coordinator: 絞り込み条件（契約年・得意先・担当者）
+    """
+    orders = Order.objects.select_related('coordinator__user').only(
+        'issue_no', 'site', 'customer', 'qty',
+        'night', 'test', 'outside23', 'material_delivery',
+        'coordinator', 'coordinator__user', 'coordinator__user__display_name',
+    )
+
+    filters = _order_filters(request)
+    orders = _filter_orders(orders, filters)
+
+    after, before = request.GET.get('after'), request.GET.get('before')
+    if before:
+        page = list(orders.filter(issue_no__gt=before).order_by('issue_no')[:ORDER_PAGE_SIZE + 1])
+        has_prev, has_next = len(page) > ORDER_PAGE_SIZE, True
+        page = page[:ORDER_PAGE_SIZE][::-1]
+    else:
+        if after:
+            orders = orders.filter(issue_no__lt=after)
+        page = list(orders.order_by('-issue_no')[:ORDER_PAGE_SIZE + 1])
+        has_prev, has_next = bool(after), len(page) > ORDER_PAGE_SIZE
+        page = page[:ORDER_PAGE_SIZE]
+
+    staffs = Staff.objects.select_related('user').only('id', 'user__username', 'user__display_name').order_by('user__username')
+    return render(request, 'orders/order_list.html', {
+        'orders': page,
+        'filters': filters,
+        'filter_query': urlencode({k: v for k, v in filters.items() if v}),
+        'staffs': staffs,
+        'next_after': page[-1].issue_no if page and has_next else '',
+        'prev_before': page[0].issue_no if page and has_prev else '',
+    })
 
 @login_required
 def order_create(request):
@@ -65,19 +133,19 @@ def order_edit(request, pk):
 def order_branch(request, pk):
     """既存の受注をベースに枝番（コピー）を作成"""
     parent_order = get_object_or_404(Order, pk=pk)
+    base_no = parent_order.issue_no[:6]
     if request.method == 'POST':
-        form = OrderForm(request.POST)
+        # 枝番は保存時に採番する（画面に表示した番号は目安。同時に分岐しても重複しない）
+        data = request.POST.copy()
+        data['issue_no'] = ''
+        form = OrderForm(data)
         if form.is_valid():
-            form.save()
+            order = form.save(commit=False)
+            order.issue_no = Order.next_branch_no(base_no)
+            order.save(force_insert=True)
             return redirect('order_list')
     
-    base_no = parent_order.issue_no[:6]
-    last_order = Order.objects.filter(issue_no__startswith=base_no).order_by('-issue_no').first()
-    try:
-        new_branch = int(last_order.issue_no[6:]) + 1
-    except (ValueError, IndexError):
-        new_branch = 1
-    new_issue_no = f"{base_no}{new_branch}"
+    new_issue_no = Order.peek_branch_no(base_no)
 
     initial_data = model_to_dict(parent_order)
     initial_data['issue_no'] = new_issue_no
@@ -93,133 +161,314 @@ def order_branch(request, pk):
 
 # --- API ---
 @login_required
-def order_autocomplete(request):
+async def order_autocomplete(request):
     """オートコンプリート（現場名・契約NO検索）"""
     term = request.GET.get('term', '')
-    results = []
-    if term:
-        orders = Order.objects.filter(
-            Q(site__icontains=term) | Q(issue_no__icontains=term)
-        ).order_by('site')[:15]
-        for o in orders:
-            results.append({
-                'issue_no': o.issue_no, 
-                'site': o.site, 
-                'address': o.site_address
-            })
-    return JsonResponse(results, safe=False)
+    return JsonResponse(await asearch_orders(term), safe=False)
+
+def _to_float(val):
+    if not val or not str(val).strip(): return None
+    try: return float(val)
+    except: return None
+
+def _to_int(val):
+    if not val or not str(val).strip(): return None
+    try: return int(val)
+    except: return None
 
 @csrf_exempt
 @login_required
-def save_plan(request):
+async def save_plan(request):
     """予定のリアルタイム保存（重複防止版）"""
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            
-            def to_float(val):
-                if not val or not str(val).strip(): return None
-                try: return float(val)
-                except: return None
-
-            def to_int(val):
-                if not val or not str(val).strip(): return None
-                try: return int(val)
-                except: return None
+            row_idx = _to_int(data.get('row_index'))
+            order = await Order.objects.filter(issue_no=data.get('issue_no')).afirst() if data.get('issue_no') else None
 
-            row_idx = to_int(data.get('row_index'))
-            
-            plan, created = OrderPlan.objects.update_or_create(
+            plan, created = await OrderPlan.objects.aupdate_or_create(
                 plan_date=data['date'],
                 section=data['section'],
                 row_index=row_idx,
                 defaults={
                     'site_name': data.get('site', ''),
                     'start_time': data.get('time', ''),
-                    'plan_qty': to_float(data.get('qty')),
-                    'truck_count': to_int(data.get('truck')),
+                    'plan_qty': _to_float(data.get('qty')),
+                    'truck_count': _to_int(data.get('truck')),
                     'plan_note': data.get('note', ''),
-                    'order': Order.objects.filter(issue_no=data.get('issue_no')).first() if data.get('issue_no') else None
+                    'order': order,
                 }
             )
-            return JsonResponse({'status': 'success'})
+            # 契約数量を超える予定になった場合は over に契約NOを返す（保存は行う）
+            commitments = await acontract_commitments([order.issue_no]) if order else {}
+            return JsonResponse({'status': 'success', **_commitment_payload(commitments)})
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
     return JsonResponse({'status': 'error', 'message': 'POSTが必要です'}, status=400)
 
+def _commitment_payload(commitments):
+    """予定超過チェックの結果（契約NOごとの数量と、超過している契約NOの一覧）"""
+    return {
+        'commitments': commitments,
+        'over': sorted(issue_no for issue_no, c in commitments.items() if c['over']),
+    }
+
+# 一括保存で上書きする項目
+PLAN_UPDATE_FIELDS = ['site_name', 'start_time', 'plan_qty', 'truck_count', 'plan_note', 'order', 'updated_at']
+
 @login_required
-def get_plans(request):
-    """全予定の取得"""
+def save_plans_bulk(request):
+    """
+    予定の一括保存（ボードの編集をまとめて1回で反映）
+    リクエスト: {"rows": [save_plan と同じ形式の行, ...]}
+    レスポンス: {"status": ..., "results": [行ごとの結果（リクエストと同じ順）]}
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'POSTが必要です'}, status=400)
+    try:
+        rows = json.loads(request.body)['rows']
+        if not isinstance(rows, list):
+            raise ValueError('rows は配列で指定してください')
+    except (ValueError, KeyError, TypeError) as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    # 参照される受注を1クエリでまとめて取得
+    orders = Order.objects.in_bulk({str(r.get('issue_no')) for r in rows if isinstance(r, dict) and r.get('issue_no')})
+
+    results = [None] * len(rows)
+    plans = {}
+    for i, data in enumerate(rows):
+        if not isinstance(data, dict):
+            results[i] = {'status': 'error', 'message': '行の形式が不正です'}
+            continue
+        plan_date = parse_date(str(data.get('date', '')))
+        row_idx = _to_int(data.get('row_index'))
+        section = data.get('section')
+        if not plan_date or row_idx is None or not section:
+            results[i] = {'status': 'error', 'message': 'date/section/row_index が不正です'}
+            continue
+        # 同じ行が複数回含まれる場合は後の編集を採用
+        plans[(plan_date, section, row_idx)] = OrderPlan(
+            plan_date=plan_date,
+            section=section,
+            row_index=row_idx,
+            site_name=data.get('site', ''),
+            start_time=data.get('time', ''),
+            plan_qty=_to_float(data.get('qty')),
+            truck_count=_to_int(data.get('truck')),
+            plan_note=data.get('note', ''),
+            order=orders.get(str(data.get('issue_no'))) if data.get('issue_no') else None,
+        )
+        results[i] = {'status': 'success'}
+
+    try:
+        with transaction.atomic():
+            # 上書きする予定の元の契約（付け替えた場合は元の契約の進捗も再計算させる）
+            previous_orders = {
+                key[3] for key in OrderPlan.objects.filter(plan_date__in={d for d, _, _ in plans}, order__isnull=False)
+                .values_list('plan_date', 'section', 'row_index', 'order_id')
+                if key[:3] in plans
+            }
+            OrderPlan.objects.bulk_create(
+                list(plans.values()),
+                update_conflicts=True,
+                unique_fields=['plan_date', 'section', 'row_index'],
+                update_fields=PLAN_UPDATE_FIELDS,
+            )
+            mark_dates_dirty({plan.plan_date for plan in plans.values()})
+            mark_contracts_dirty(previous_orders | {plan.order_id for plan in plans.values()})
+            touch_tables(PLAN_TABLE)
+    except DatabaseError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    # bulk_create ではシグナルが飛ばないため、ここで変更を通知する
+    for plan in plans.values():
+        publish('plan', plan.to_board_dict())
+
+    # 保存した予定の契約について、契約数量の超過をまとめて確認する
+    commitments = contract_commitments({plan.order_id for plan in plans.values() if plan.order_id})
+    failed = sum(1 for r in results if r['status'] != 'success')
+    return JsonResponse({
+        'status': 'error' if failed else 'success',
+        'results': results,
+        **_commitment_payload(commitments),
+    })
+
+@login_required
+@conditional_on(lambda request: [table_key(PLAN_TABLE)])
+async def get_plans(request):
+    """全予定の取得（旧API：plan_feed を推奨）"""
     plans = OrderPlan.objects.all()
-    results = []
-    for p in plans:
-        results.append({
-            'date': p.plan_date.strftime('%Y-%m-%d'),
-            'section': p.section,
-            'row_index': p.row_index,
-            'site': p.site_name,
-            'time': p.start_time,
-            'qty': p.plan_qty,
-            'truck': p.truck_count,
-            'note': p.plan_note,
-            'issue_no': p.order.issue_no if p.order else ''
-        })
-    return JsonResponse(results, safe=False)
+    return JsonResponse([p.to_board_dict() async for p in plans], safe=False)
+
+# 差分同期カーソルの巻き戻し幅（保存とコミットの時間差で取りこぼさないため）
+PLAN_FEED_OVERLAP = timedelta(seconds=5)
 
-# --- 実績管理・単価マスタ ---
 @login_required
-def daily_performance_report(request):
-    """実績管理表の集計"""
+async def plan_feed(request):
+    """
+    表示範囲の予定取得（差分同期対応）
+    start/end: 取得する日付範囲（YYYY-MM-DD）
+    since: 前回レスポンスの cursor。指定時はそれ以降に更新された行のみ返す
+    commitments/over: 範囲内の予定に含まれる契約の予定超過チェック（since の有無にかかわらず範囲全体）
+    """
+    start = parse_date(request.GET.get('start', ''))
+    end = parse_date(request.GET.get('end', ''))
+    if not start or not end or start > end:
+        return JsonResponse({'status': 'error', 'message': 'start/end を正しく指定してください'}, status=400)
+
+    # カーソルは検索前の時刻から決める（検索中の更新は次回に拾う）
+    cursor = timezone.now() - PLAN_FEED_OVERLAP
+    plans = OrderPlan.objects.filter(plan_date__range=(start, end))
+    since_str = request.GET.get('since')
+    if since_str:
+        since = parse_datetime(since_str)
+        if since is None:
+            return JsonResponse({'status': 'error', 'message': 'since が不正です'}, status=400)
+        plans = plans.filter(updated_at__gte=since)
+
+    return JsonResponse({
+        'plans': [p.to_board_dict() async for p in plans.order_by('plan_date', 'section', 'row_index')],
+        'cursor': cursor.isoformat(),
+        **_commitment_payload(await acontract_commitments(window_contracts(start, end))),
+    })
+
+# SSE 接続の最大継続時間（切断後はブラウザが自動で再接続する）
+STREAM_MAX_SECONDS = 300
+# 無通信で切断されないよう送るコメント行の間隔
+STREAM_HEARTBEAT_SECONDS = 20
+
+@login_required
+async def event_stream(request):
+    """
+    変更通知の配信（Server-Sent Events）
+    start/end: 通知を受け取る予定の日付範囲 / issue_no: 出荷を通知する契約NO
+    """
+    start_str, end_str = request.GET.get('start', ''), request.GET.get('end', '')
+    issue_no = request.GET.get('issue_no', '')
+    try:
+        start, end = parse_date(start_str), parse_date(end_str)
+    except ValueError:
+        start = end = None
+    if (start_str or end_str) and (not start or not end or start > end):
+        return JsonResponse({'status': 'error', 'message': 'start/end を正しく指定してください'}, status=400)
+
+    if not isinstance(request, ASGIRequest):
+        # WSGI では接続を保持できない。204 を返すとブラウザは再接続せず、画面側は定期取得で動く
+        return HttpResponse(status=204)
+
+    def wanted(event, data):
+        if event == 'plan':
+            # 予定の日付は ISO 形式の文字列（文字列の比較で日付順になる）
+            return bool(start) and start.isoformat() <= data['date'] <= end.isoformat()
+        if event == 'shipment':
+            return bool(issue_no) and data['issue_no'] == issue_no
+        return False
+
+    async def events():
+        broadcaster = get_broadcaster()
+        sub = broadcaster.subscribe()
+        deadline = time.monotonic() + STREAM_MAX_SECONDS
+        try:
+            yield 'retry: 3000\n\n'
+            while time.monotonic() < deadline:
+                try:
+                    event, data = await asyncio.wait_for(sub.queue.get(), STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': ping\n\n'
+                    continue
+                if wanted(event, data):
+                    yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            broadcaster.unsubscribe(sub)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+# --- 実績管理・単価マスタ ---
+def _report_date(request):
     target_date_str = request.GET.get('date', timezone.localtime().date().isoformat())
-    target_date = timezone.datetime.strptime(target_date_str, '%Y-%m-%d').date()
+    return timezone.datetime.strptime(target_date_str, '%Y-%m-%d').date()
 
-    issue_numbers = Shipment.objects.filter(ship_date=target_date).values_list('issue_no', flat=True).distinct()
-    report_data = []
+def _report_keys(request):
+    try:
+        return daily_report_keys(_report_date(request))
+    except ValueError:
+        return None
 
-    for no in issue_numbers:
-        shipments = Shipment.objects.filter(ship_date=target_date, issue_no=no)
-        order = Order.objects.filter(issue_no=no).first()
-        if not order: continue
+@login_required
+@conditional_on(_report_keys)
+def daily_performance_report(request):
+    """実績管理表の集計（前回から変更の無い日は 304、過去日は集計結果をキャッシュから返す）"""
+    target_date = _report_date(request)
 
-        N = shipments.count()
-        k_val = OrderPlan.objects.filter(plan_date=target_date, order__issue_no=no).aggregate(Sum('truck_count'))['truck_count__sum'] or 1
-        
-        L = math.ceil(N / k_val)
-        M = math.floor(N / k_val)
-        Q = N // k_val
-        R = N % k_val
-        X = (Q + 1) * R
-        Y = Q * (k_val - R)
-
-        short_diff = 0
-        for s in shipments:
-            if s.ship_qty < 6.0:
-                short_diff += (6.0 - s.ship_qty)
-
-        price_X = get_price_from_master(L, order.night)
-        price_Y = get_price_from_master(M, order.night)
-        price_empty = get_price_from_master(L, order.night, is_empty=True)
-
-        report_data.append({
-            'issue_no': no,
-            'truck_planned': k_val,
-            'customer': order.customer,
-            'site': order.site,
-            'rows': [
-                {'item': f'流動化処理土 出荷量㎥ ({L}回転)', 'unit': X, 'price': price_X, 'total': X * 6 - short_diff},
-                {'item': f'流動化処理土 出荷量㎥ ({M}回転)', 'unit': Y, 'price': price_Y, 'total': Y * 6},
-                {'item': '空積割増', 'unit': L if short_diff > 0 else 0, 'price': price_empty, 'total': short_diff},
-            ]
-        })
+    # 出荷・受注・予定・単価をそれぞれ1クエリで集計（契約数によらず一定）
+    report_data = cached_daily_report(target_date)
 
     return render(request, 'orders/daily_report.html', {'report_data': report_data, 'target_date': target_date})
 
-def get_price_from_master(rotation, is_night, is_empty=False):
-    """単価取得用ヘルパー"""
-    prefix = "夜間" if is_night else "昼間"
-    suffix = f"{rotation}回空積" if is_empty else f"{rotation}回転"
-    master = UnitPriceMaster.objects.filter(item_name=f"{prefix} {suffix}").first()
-    return master.partition_price if master else 0
+@login_required
+def range_performance_report(request):
+    """
+    期間の実績集計（得意先・契約ごと）
+    month: 対象月（YYYY-MM） / start・end: 任意の期間（省略時は当月1日〜当日）
+    """
+    today = timezone.localdate()
+    month = request.GET.get('month', '')
+    try:
+        if month:
+            start = timezone.datetime.strptime(month, '%Y-%m').date()
+            end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        else:
+            start = parse_date(request.GET.get('start', '')) or today.replace(day=1)
+            end = parse_date(request.GET.get('end', '')) or today
+    except ValueError:
+        return HttpResponse('期間の指定が不正です', status=400)
+    if start > end:
+        return HttpResponse('期間の指定が不正です', status=400)
+
+    report = build_range_report(start, end)
+    return render(request, 'orders/range_report.html', {'report': report, 'start': start, 'end': end})
+
+# --- CSV出力 ---
+def _export_range(request):
+    """start/end（省略時は date または当日）の期間を返す。不正な場合は None"""
+    today = timezone.localdate().isoformat()
+    try:
+        start = parse_date(request.GET.get('start') or request.GET.get('date') or today)
+        end = parse_date(request.GET.get('end') or request.GET.get('date') or today)
+    except ValueError:
+        return None
+    if not start or not end or start > end:
+        return None
+    return start, end
+
+@login_required
+def export_orders(request):
+    """受注一覧のCSV出力（一覧画面と同じ絞り込み条件）"""
+    orders = _filter_orders(Order.objects.all(), _order_filters(request))
+    filename = f"orders_{timezone.localdate():%Y%m%d}.csv"
+    return csv_response(request, filename, order_rows(orders))
+
+@login_required
+def export_shipments(request):
+    """出荷実績のCSV出力（start〜end の出荷日）"""
+    period = _export_range(request)
+    if period is None:
+        return JsonResponse({'status': 'error', 'message': 'start/end が不正です'}, status=400)
+    start, end = period
+    return csv_response(request, f"shipments_{start:%Y%m%d}_{end:%Y%m%d}.csv", shipment_rows(start, end))
+
+@login_required
+def export_performance_report(request):
+    """実績管理表のCSV出力（date の1日分、または start〜end）"""
+    period = _export_range(request)
+    if period is None:
+        return JsonResponse({'status': 'error', 'message': 'start/end が不正です'}, status=400)
+    start, end = period
+    return csv_response(request, f"performance_report_{start:%Y%m%d}_{end:%Y%m%d}.csv", report_rows(start, end))
 
 @login_required
 def master_setting(request):
@@ -254,6 +503,8 @@ def master_setting(request):
                     partition_price=int(request.POST.get(f'price_{mid}', 0) or 0),
                     standard_price=int(request.POST.get(f'std_{mid}', 0) or 0)
                 )
+            # update() ではシグナルが飛ばないため明示的に単価キャッシュを破棄
+            invalidate_price_table()
             return redirect('master_setting')
 
     masters = UnitPriceMaster.objects.all().order_by('category', 'id')
@@ -275,43 +526,23 @@ def shipment_create(request):
     }
 
     if issue_no:
-        order = Order.objects.filter(issue_no=issue_no).first()
+        order = Order.objects.filter(issue_no=issue_no).select_related('coordinator__user').first()
         if order:
-            total_shipped = Shipment.objects.filter(issue_no=issue_no).aggregate(models.Sum('ship_qty'))['ship_qty__sum'] or 0
+            # 累計値は出荷カウンタ（出荷の保存時に更新）から1行で取得
+            contract = ShipmentContractCounter.objects.filter(issue_no=issue_no).first()
+            total_shipped = contract.qty_sum if contract else 0
             initial_data.update({
                 'issue_no': order.issue_no,
                 'contract_qty': order.qty,
                 'remaining_qty': order.qty - (total_shipped + 6.0),
-                'site': order.site,
-                'site_address': order.site_address,
-                'customer': order.customer,
-                'contractor': order.contractor,
-                'coordinator': order.coordinator.display_name if order.coordinator else "",
-                'contact': order.contact,
-                'product': order.product,
-                'product_category': order.product_category,
-                'price': order.price,
-                'rotation': order.rotation,
-                'material_soil': order.material_soil,
-                'water': order.water,
-                'cementBB': order.cementBB,
-                'recycle_sand': order.recycle_sand,
-                'admixture': order.admixture,
-                'material_soil_wm': order.material_soil_wm,
-                'test': order.test,
-                'night': order.night,
-                'outside23': order.outside23,
-                'material_delivery': order.material_delivery,
-                'note': order.note,
-                'specialnote': order.specialnote,
+                **OrderSnapshot.values_from_order(order),
             })
             
-            today_ships = Shipment.objects.filter(issue_no=issue_no, ship_date=now.date()).order_by('id')
-            initial_data['total_unit'] = today_ships.count() + 1
-            initial_data['total_ship_qty'] = (today_ships.aggregate(models.Sum('ship_qty'))['ship_qty__sum'] or 0) + 6.0
-            last_ship = today_ships.last()
-            if last_ship:
-                initial_data['before_car_no'] = last_ship.car_no
+            today_counter = ShipmentDailyCounter.objects.filter(issue_no=issue_no, ship_date=today).first()
+            initial_data['total_unit'] = (today_counter.unit_count if today_counter else 0) + 1
+            initial_data['total_ship_qty'] = (today_counter.qty_sum if today_counter else 0) + 6.0
+            if today_counter:
+                initial_data['before_car_no'] = today_counter.last_car_no
 
     if request.method == 'POST':
         form = ShipmentForm(request.POST)
@@ -324,19 +555,49 @@ def shipment_create(request):
     return render(request, 'orders/shipment_form.html', {'form': form})
 
 @login_required
-def get_shipment_stats(request):
+def shipment_import(request):
+    """
+    出荷実績の一括取込（計量器・配車記録の CSV / JSONL をアップロード）
+    リクエスト: multipart の file（列: issue_no, ship_date, ship_time, ship_qty, car_no）と CSRF トークン
+    レスポンス: {"status": ..., "created": 登録件数, "error_count": ..., "errors": [{"line", "message"}]}
+    途中で中断した場合も、それまでに登録した件数を created で返す
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'POSTが必要です'}, status=400)
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'status': 'error', 'message': 'file を指定してください'}, status=400)
+
+    fmt = request.POST.get('format') or detect_format(upload.name)
+    # アップロードは一時ファイルから1行ずつ読み、全体をメモリに載せない
+    stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+    result = ImportResult()
+    try:
+        import_shipments(read_records(stream, fmt), result=result)
+    except (ValueError, UnicodeDecodeError, DatabaseError) as e:
+        message = f'取込を中断しました: {e}'
+        if result.created:
+            message += f'（中断前の{result.created}件は登録済みです）'
+        return JsonResponse({'status': 'error', 'message': message, **result.as_dict()}, status=400)
+    finally:
+        stream.detach()
+
+    return JsonResponse({'status': 'error' if result.error_count else 'success', **result.as_dict()})
+
+@login_required
+async def get_shipment_stats(request):
     """リアルタイム出荷統計取得API"""
     issue_no = request.GET.get('issue_no')
-    today = timezone.now().date()
-    order = Order.objects.filter(issue_no=issue_no).first()
+    today = timezone.localdate()
+    order = await Order.objects.filter(issue_no=issue_no).select_related('coordinator__user').afirst()
     if not order:
         return JsonResponse({'error': '受注が見つかりません'}, status=404)
 
-    prev_shipments = Shipment.objects.filter(issue_no=issue_no, ship_date=today).order_by('id')
-    total_unit = prev_shipments.count() + 1
-    total_ship_qty_sum = prev_shipments.aggregate(Sum('ship_qty'))['ship_qty__sum'] or 0
-    last_ship = prev_shipments.last()
-    before_car_no = last_ship.car_no if last_ship else "なし"
+    # 当日の累計は出荷カウンタ（出荷の保存時に更新）から1行で取得
+    counter = await ShipmentDailyCounter.objects.filter(issue_no=issue_no, ship_date=today).afirst()
+    total_unit = (counter.unit_count if counter else 0) + 1
+    total_ship_qty_sum = counter.qty_sum if counter else 0
+    before_car_no = counter.last_car_no if counter else "なし"
 
     return JsonResponse({
         'total_unit': total_unit,
@@ -346,9 +607,75 @@ def get_shipment_stats(request):
         'customer': order.customer,
         'product': order.product,
         'site_address': order.site_address,
-        'coordinator': order.coordinator.display_name if order.coordinator else "",
+        'coordinator': order.coordinator.user.display_name if order.coordinator else "",
+    })
+
+# --- 契約の進捗 ---
+# 進捗一覧の JSON に含める項目
+PROGRESS_FIELDS = [
+    'issue_no', 'customer', 'site', 'qty', 'planned_qty', 'upcoming_qty', 'shipped_qty', 'ship_count',
+    'remaining_qty', 'progress', 'first_ship_date', 'last_ship_date', 'last_plan_date',
+    'projected_completion', 'projected_by', 'over_planned',
+]
+
+# 進捗一覧の列（見出し, 並べ替えの項目）
+PROGRESS_COLUMNS = [
+    ('契約NO', 'issue_no'), ('得意先', 'customer'), ('現場名', 'site'), ('契約数量', 'qty'),
+    ('予定合計', 'planned_qty'), ('今後の予定', 'upcoming_qty'), ('出荷済み', 'shipped_qty'),
+    ('残数量', 'remaining_qty'), ('進捗', 'progress'), ('最終出荷日', 'last_ship_date'),
+    ('完了見込み', 'projected_completion'),
+]
+
+def _progress_columns(sort):
+    """見出しのリンク先（同じ列をもう一度押すと昇順・降順を切り替える）と並び順の印"""
+    columns = []
+    for label, field in PROGRESS_COLUMNS:
+        mark = '▲' if sort == field else '▼' if sort == f'-{field}' else ''
+        columns.append({'label': label, 'sort': f'-{field}' if sort == field else field, 'mark': mark})
+    return columns
+
+def _progress_params(request):
+    """並べ替え（sort）・絞り込み（status・customer）。不正な値は ValueError"""
+    sort = request.GET.get('sort') or 'projected_completion'
+    status = request.GET.get('status') or 'active'
+    if sort.lstrip('-') not in PROGRESS_SORT_FIELDS:
+        raise ValueError(f"sort は {', '.join(PROGRESS_SORT_FIELDS)} のいずれかです（- を付けると降順）")
+    if status not in PROGRESS_FILTERS:
+        raise ValueError(f"status は {', '.join(PROGRESS_FILTERS)} のいずれかです")
+    return {'sort': sort, 'status': status, 'customer': request.GET.get('customer', '').strip()}
+
+@login_required
+def contract_progress(request):
+    """
+    契約の進捗一覧（契約数量・予定・出荷済み・残数量・完了見込み日）
+    sort: 並べ替える列（- で降順） / status: active（未完了）・idle（停滞）・over（予定超過）・done（完了）・all / customer: 得意先
+    """
+    try:
+        params = _progress_params(request)
+    except ValueError as e:
+        return HttpResponse(str(e), status=400)
+    rows = progress_queryset(**params)
+    return render(request, 'orders/contract_progress.html', {
+        'rows': rows,
+        'params': params,
+        'columns': _progress_columns(params['sort']),
+        'filter_query': urlencode({k: v for k, v in params.items() if v and k != 'sort'}),
+        'today': timezone.localdate(),
     })
 
+@login_required
+def contract_progress_data(request):
+    """契約の進捗一覧の JSON（contract_progress と同じ条件。limit で件数を制限）"""
+    try:
+        params = _progress_params(request)
+        limit = int(request.GET['limit']) if request.GET.get('limit') else None
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    rows = progress_queryset(**params).values(*PROGRESS_FIELDS)
+    if limit is not None:
+        rows = rows[:max(0, limit)]
+    return JsonResponse({'status': 'success', 'rows': list(rows)})
+
 def admin_check(user):
     return user.is_authenticated and user.is_admin_user
 
@@ -409,4 +736,16 @@ def reset_password(request, pk):
         if new_pass:
             target_user.set_password(new_pass)
             target_user.save()
-    return redirect('staff_management')
\ No newline at end of file
+    return redirect('staff_management')
+
+# --- 計測 ---
+def request_metrics(request):
+    """
+    URL名ごとの応答時間・SQL件数・DB時間・応答サイズ（Prometheus のテキスト形式）
+    METRICS_TOKEN を設定した場合は Authorization: Bearer <トークン> で取得できる。それ以外は管理者のみ
+    """
+    token = settings.METRICS_TOKEN
+    if not (token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')) \
+            and not admin_check(request.user):
+        return HttpResponse('権限がありません', status=403, content_type='text/plain; charset=utf-8')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')